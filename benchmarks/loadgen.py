@@ -0,0 +1,217 @@
+"""
+Load generator for a running server's /method endpoint.
+
+Run from the project root, e.g. 200 requests per second over 16 connections for 30 seconds:
+    python -m benchmarks.loadgen --port 8080 --rps 200 --concurrency 16 --duration 30
+
+Without --rps every connection sends its next request as soon as the previous one is answered. With --rps requests
+are scheduled at fixed times and latency is measured from the scheduled time, so a stalled server is not hidden by
+the generator slowing down with it.
+"""
+
+import asyncio
+import datetime
+import itertools
+import json
+import sys
+import time
+from argparse import ArgumentParser, Namespace
+from collections import Counter
+from typing import Any
+
+from benchmarks.payloads import PayloadFactory, admin_token
+from src.bodies import async_read_chunked
+
+POOL_SIZE = 2000
+PERCENTILES = (50, 90, 99, 99.9)
+MAX_RESPONSE_SIZE = 64 * 1024 * 1024
+
+
+def parse_size(value: str) -> tuple[int, int]:
+    """
+    ``N`` or ``MIN-MAX`` client_ids per clients_interests request
+    """
+    low, _, high = value.partition("-")
+    return int(low), int(high or low)
+
+
+def make_requests(args: Namespace) -> list[tuple[str, bytes]]:
+    """
+    Pool of ``(kind, raw HTTP request)`` following the requested mix, cycled through during the run
+    """
+    payloads = PayloadFactory(args.seed)
+    low, high = args.client_ids
+    requests = []
+    for _ in range(POOL_SIZE):
+        admin = payloads.random.random() < args.admin_ratio
+        if payloads.random.random() < args.invalid_ratio:
+            kind, body = "invalid", payloads.invalid()
+        elif payloads.random.random() < args.interests_ratio:
+            kind, body = "clients_interests", payloads.clients_interests(payloads.random.randint(low, high), admin)
+        else:
+            kind, body = "online_score", payloads.online_score(admin)
+        data = json.dumps(body).encode("utf-8")
+        head = "POST {} HTTP/1.1\r\nHost: {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\n\r\n".format(args.path, args.host, len(data))
+        requests.append((kind, head.encode("latin-1") + data))
+    return requests
+
+
+async def read_response(reader: asyncio.StreamReader) -> tuple[int, bytes, bool]:
+    """
+    Status code, body and whether the server keeps the connection open, ValueError when the response is malformed
+    """
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    version, _, rest = lines[0].partition(" ")
+    if not version.startswith("HTTP/"):
+        raise ValueError("Malformed status line %r" % lines[0])
+    status = int(rest.partition(" ")[0])
+    headers = {name.strip().lower(): value.strip() for name, _, value in (line.partition(":") for line in lines[1:] if line)}
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        body = await async_read_chunked(reader, MAX_RESPONSE_SIZE)
+    else:
+        body = await reader.readexactly(int(headers.get("content-length", 0)))
+    return status, body, headers.get("connection", "").lower() != "close"
+
+
+class LoadGenerator:
+    def __init__(self, args: Namespace) -> None:
+        self.args = args
+        now = datetime.datetime.now()
+        self.token_hour, self.token = token_hour(now), admin_token(now).encode("latin-1")
+        self.requests = make_requests(args)
+        self.counter = itertools.count()
+        self.latencies: list[float] = []
+        self.outcomes: Counter[tuple[str, str]] = Counter()
+        self.started = 0.0
+        self.deadline = 0.0
+
+    def next_request(self) -> tuple[int, float] | None:
+        """
+        Index and scheduled start of the next request, None when the run is over
+        """
+        index = next(self.counter)
+        if self.args.requests and index >= self.args.requests:
+            return None
+        scheduled = self.started + index / self.args.rps if self.args.rps else time.perf_counter()
+        if scheduled >= self.deadline:
+            return None
+        return index, scheduled
+
+    def request(self, index: int, now: datetime.datetime | None = None) -> tuple[str, bytes]:
+        """
+        Pooled request number ``index``. Admin tokens are only valid within the hour, the pool gets new ones when it
+        changes.
+        """
+        now = now or datetime.datetime.now()
+        if token_hour(now) != self.token_hour:
+            # Same length, the Content-Length of the requests holds
+            token = admin_token(now).encode("latin-1")
+            self.requests = [(kind, raw.replace(self.token, token)) for kind, raw in self.requests]
+            self.token_hour, self.token = token_hour(now), token
+        return self.requests[index % len(self.requests)]
+
+    async def worker(self) -> None:
+        connection: tuple[asyncio.StreamReader, asyncio.StreamWriter] | None = None
+        while (task := self.next_request()) is not None:
+            index, scheduled = task
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            kind, raw = self.request(index)
+            try:
+                if connection is None:
+                    connection = await asyncio.open_connection(self.args.host, self.args.port)
+                reader, writer = connection
+                writer.write(raw)
+                status, body, keep_alive = await asyncio.wait_for(read_response(reader), self.args.timeout)
+            except (OSError, ValueError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, TimeoutError) as e:
+                self.outcomes[(kind, type(e).__name__)] += 1
+                keep_alive = False
+            else:
+                self.latencies.append(time.perf_counter() - scheduled)
+                self.outcomes[(kind, outcome(status, body))] += 1
+            if not keep_alive and connection is not None:
+                connection[1].close()
+                connection = None
+        if connection is not None:
+            connection[1].close()
+
+    async def run(self) -> dict[str, Any]:
+        self.started = time.perf_counter()
+        self.deadline = self.started + self.args.duration if self.args.duration else float("inf")
+        await asyncio.gather(*(self.worker() for _ in range(self.args.concurrency)))
+        return report(self.latencies, self.outcomes, time.perf_counter() - self.started)
+
+
+def token_hour(now: datetime.datetime) -> str:
+    return now.strftime("%Y%m%d%H")
+
+
+def outcome(status: int, body: bytes) -> str:
+    """
+    HTTP status, plus the envelope code when it differs
+    """
+    try:
+        code = json.loads(body).get("code", status)
+    except ValueError:
+        code = status
+    return str(status) if code == status else "{}/{}".format(status, code)
+
+
+def percentile(ordered: list[float], p: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def report(latencies: list[float], outcomes: Counter[tuple[str, str]], elapsed: float) -> dict[str, Any]:
+    ordered = sorted(latencies)
+    total = sum(outcomes.values())
+    return {
+        "requests": total,
+        "elapsed_s": elapsed,
+        "throughput_rps": len(ordered) / elapsed if elapsed else 0.0,
+        "latency_ms": {
+            "mean": sum(ordered) / len(ordered) * 1000 if ordered else 0.0,
+            **{"p%s" % p: percentile(ordered, p) * 1000 for p in PERCENTILES},
+            "max": ordered[-1] * 1000 if ordered else 0.0,
+        },
+        "outcomes": {"%s %s" % key: count for key, count in sorted(outcomes.items())},
+    }
+
+
+def main() -> int:
+    parser = ArgumentParser(description="Load generator for the /method endpoint")
+    parser.add_argument("--host", action="store", default="localhost")
+    parser.add_argument("-p", "--port", action="store", type=int, default=8080)
+    parser.add_argument("--path", action="store", default="/method")
+    parser.add_argument("-c", "--concurrency", action="store", type=int, default=8, help="open connections")
+    parser.add_argument("--rps", action="store", type=float, default=0, help="target requests per second, 0 sends as fast as possible")
+    parser.add_argument("-d", "--duration", action="store", type=float, default=10, help="seconds to run, 0 for no limit")
+    parser.add_argument("-n", "--requests", action="store", type=int, default=0, help="stop after this many requests, 0 for no limit")
+    parser.add_argument("--interests-ratio", action="store", type=float, default=0.3, help="share of clients_interests among valid requests")
+    parser.add_argument("--admin-ratio", action="store", type=float, default=0.1, help="share of requests sent as admin")
+    parser.add_argument("--invalid-ratio", action="store", type=float, default=0.05, help="share of requests answered with 403/422")
+    parser.add_argument("--client-ids", action="store", type=parse_size, default=(1, 10), help="client_ids per request, N or MIN-MAX")
+    parser.add_argument("--timeout", action="store", type=float, default=5, help="seconds to wait for a response")
+    parser.add_argument("--seed", action="store", type=int, default=42)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+    if not args.duration and not args.requests:
+        parser.error("either --duration or --requests must limit the run")
+
+    result = asyncio.run(LoadGenerator(args).run())
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return 0
+    print("requests     {requests}  in {elapsed_s:.2f} s, {throughput_rps:.1f} req/s".format(**result))
+    print("latency ms   " + "  ".join("{} {:.2f}".format(name, value) for name, value in result["latency_ms"].items()))
+    for name, count in result["outcomes"].items():
+        print("  {:<40} {:>8}".format(name, count))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+"""
+Seeded synthetic method requests shared by the benchmark suite and the load generator
+"""
+
+import datetime
+import hashlib
+import json
+import random
+from typing import Any, Iterable
+
+from src.constants import ADMIN_LOGIN, ADMIN_SALT, SALT
+
+INTERESTS = ["cars", "pets", "travel", "hi-tech", "sport", "music", "books", "tv", "cinema", "geek", "otus"]
+FIRST_NAMES = ["Stanislav", "Anna", "Ivan", "Maria", "Oleg", "Elena", "Pavel", "Olga"]
+LAST_NAMES = ["Stupnikov", "Ivanova", "Petrov", "Smirnova", "Volkov", "Kuznetsova"]
+SCORE_COUPLES = (("phone", "email"), ("birthday", "gender"), ("first_name", "last_name"))
+# Birthdays count back from this date, not today, so a seed builds the same bodies on any day. Ages up to 65 stay
+# within the 70 year window of BirthDayField until 2030.
+REFERENCE_DATE = datetime.date(2025, 1, 1)
+
+
+def user_token(account: str, login: str) -> str:
+    return hashlib.sha512((account + login + SALT).encode("utf-8")).hexdigest()
+
+
+def admin_token(now: datetime.datetime | None = None) -> str:
+    now = now or datetime.datetime.now()
+    return hashlib.sha512((now.strftime("%Y%m%d%H") + ADMIN_SALT).encode("utf-8")).hexdigest()
+
+
+class PayloadFactory:
+    """
+    Builds valid (and on request invalid) bodies for the /method endpoint from a fixed seed
+    """
+
+    def __init__(self, seed: int = 42, accounts: int = 100) -> None:
+        self.random = random.Random(seed)
+        self.accounts = [("account%d" % i, "login%d" % i) for i in range(accounts)]
+
+    def phone(self) -> str:
+        return "7" + "".join(self.random.choice("0123456789") for _ in range(10))
+
+    def birthday(self) -> str:
+        day = REFERENCE_DATE - datetime.timedelta(days=self.random.randint(18 * 365, 65 * 365))
+        return day.strftime("%d.%m.%Y")
+
+    def score_arguments(self) -> dict[str, Any]:
+        """
+        One to three of the valid field couples
+        """
+        values = {
+            "phone": self.phone(),
+            "email": "user%d@example.com" % self.random.randint(0, 10**6),
+            "birthday": self.birthday(),
+            "gender": self.random.randint(0, 2),
+            "first_name": self.random.choice(FIRST_NAMES),
+            "last_name": self.random.choice(LAST_NAMES),
+        }
+        couples = self.random.sample(SCORE_COUPLES, self.random.randint(1, len(SCORE_COUPLES)))
+        return {name: values[name] for couple in couples for name in couple}
+
+    def client_ids(self, size: int, id_space: int = 10**6) -> list[int]:
+        return [self.random.randrange(id_space) for _ in range(size)]
+
+    def envelope(self, method: str, arguments: dict[str, Any], admin: bool = False) -> dict[str, Any]:
+        if admin:
+            return {"account": "", "login": ADMIN_LOGIN, "method": method, "token": admin_token(), "arguments": arguments}
+        account, login = self.random.choice(self.accounts)
+        return {"account": account, "login": login, "method": method, "token": user_token(account, login), "arguments": arguments}
+
+    def online_score(self, admin: bool = False) -> dict[str, Any]:
+        return self.envelope("online_score", self.score_arguments(), admin)
+
+    def online_score_bulk(self, size: int, admin: bool = False) -> dict[str, Any]:
+        return self.envelope("online_score_bulk", {"people": [self.score_arguments() for _ in range(size)]}, admin)
+
+    def clients_interests(self, size: int, admin: bool = False, id_space: int = 10**6) -> dict[str, Any]:
+        return self.envelope("clients_interests", {"client_ids": self.client_ids(size, id_space), "date": "20.07.2017"}, admin)
+
+    def invalid(self) -> dict[str, Any]:
+        """
+        A request the server answers with 403 or 422
+        """
+        kind = self.random.choice(["token", "phone", "couple", "client_ids", "method"])
+        if kind == "token":
+            return {**self.online_score(), "token": "bad"}
+        if kind == "phone":
+            return self.envelope("online_score", {"phone": "89175002040", "email": "a@b.c"})
+        if kind == "couple":
+            return self.envelope("online_score", {"phone": self.phone()})
+        if kind == "client_ids":
+            return self.envelope("clients_interests", {"client_ids": ["1", "2"]})
+        return self.envelope("unknown", {})
+
+    def interests(self, cids: Iterable[int]) -> dict[str, str]:
+        """
+        Store contents ``i:<cid>`` for the given clients
+        """
+        return {"i:%s" % cid: json.dumps(self.random.sample(INTERESTS, 2)) for cid in cids}
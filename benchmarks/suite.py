@@ -0,0 +1,328 @@
+"""
+Reproducible micro and end-to-end benchmarks, results are written as JSON and can be compared with a saved baseline.
+
+Run from the project root:
+    python -m benchmarks.suite --output bench.json
+    python -m benchmarks.suite --baseline bench.json --threshold 0.2
+"""
+
+import functools
+import http.client
+import itertools
+import json
+import logging
+import platform
+import statistics
+import sys
+import threading
+import time
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterator
+
+from benchmarks.payloads import PayloadFactory
+from src.api import MainHTTPHandler, method_handler
+from src.constants import ADMIN_SCORE, FORBIDDEN, NOT_FOUND, OK, ErrorMessage
+from src.datas import ArgumentsField, BirthDayField, CharField, ClientIDsField, DateField, EmailField, GenderField, MethodRequest, PhoneField, Request
+from src.encoding import ENCODER, JSON_ENCODERS, ResponseEncoder, make_envelope
+from src.logs import RequestLog
+from src.methods import check_auth, validate_clients_interests, validate_online_score
+from src.metrics import Metrics
+from src.scoring import get_interests, get_interests_many, get_score
+from src.server import PooledHTTPServer
+
+SEED = 42
+POOL_SIZE = 512
+CLIENT_ID_SPACE = 10000
+CLIENT_IDS_SIZES = (1, 10, 100, 1000)
+BATCH_SIZES = (1, 10, 100)
+
+
+class DictStore:
+    """
+    In-memory store, the benchmarks measure the service code and not the network
+    """
+
+    def __init__(self, storage: dict[str, str] | None = None) -> None:
+        self.cache: dict[str, str] = {}
+        self.storage = storage or {}
+
+    def cache_get(self, key: str) -> str | None:
+        return self.cache.get(key)
+
+    def cache_set(self, key: str, value: Any, expired: int) -> None:
+        self.cache[key] = str(value)
+
+    def get(self, key: str) -> str | None:
+        return self.storage.get(key)
+
+    def get_many(self, keys: list[str]) -> list[str | None]:
+        return [self.storage.get(key) for key in keys]
+
+    def cache_get_many(self, keys: list[str]) -> list[str | None]:
+        return [self.cache.get(key) for key in keys]
+
+    def cache_set_many(self, items: dict[str, Any], expired: int) -> None:
+        for key, value in items.items():
+            self.cache[key] = str(value)
+
+
+class Fields(Request):
+    char = CharField(nullable=True)
+    arguments = ArgumentsField(nullable=True)
+    email = EmailField(nullable=True)
+    phone = PhoneField(nullable=True)
+    date = DateField(nullable=True)
+    birthday = BirthDayField(nullable=True)
+    gender = GenderField(nullable=True)
+    client_ids = ClientIDsField(nullable=True)
+
+
+class Case:
+    """
+    One benchmark: ``func`` is called with the inputs in turn, ``ops`` is the work done by one call
+    """
+
+    def __init__(self, name: str, func: Callable[[Any], Any], inputs: list[Any], ops: int = 1) -> None:
+        self.name = name
+        self.func = func
+        self.inputs = inputs
+        self.ops = ops
+
+    def run(self, number: int, repeat: int) -> dict[str, Any]:
+        func = self.func
+        samples = []
+        for _ in range(repeat):
+            inputs = list(itertools.islice(itertools.cycle(self.inputs), number))
+            started = time.perf_counter()
+            for value in inputs:
+                func(value)
+            samples.append((time.perf_counter() - started) / number)
+        best = min(samples)
+        return {
+            "us_per_call": best * 1e6,
+            "median_us_per_call": statistics.median(samples) * 1e6,
+            "ops_per_sec": self.ops / best,
+            "calls": number * repeat,
+        }
+
+
+def pool(factory: Callable[[], Any], size: int = POOL_SIZE) -> list[Any]:
+    return [factory() for _ in range(size)]
+
+
+def field_cases(payloads: PayloadFactory) -> Iterator[Case]:
+    values = {
+        "char": lambda: payloads.random.choice(["Stanislav", "Anna", "Ivan"]),
+        "arguments": lambda: payloads.score_arguments(),
+        "email": lambda: "user%d@example.com" % payloads.random.randrange(10**6),
+        "phone": payloads.phone,
+        "date": payloads.birthday,
+        "birthday": payloads.birthday,
+        "gender": lambda: payloads.random.randint(0, 2),
+        "client_ids": lambda: payloads.client_ids(10),
+    }
+    for name, make in values.items():
+        instance = Fields()
+        field_type = type(vars(Fields)[name]).__name__
+        yield Case("fields.%s" % field_type, functools.partial(setattr, instance, name), pool(make))
+
+
+def validation_cases(payloads: PayloadFactory) -> Iterator[Case]:
+    yield Case("validate_online_score", validate_online_score, pool(payloads.score_arguments))
+    for size in CLIENT_IDS_SIZES:
+        yield Case("validate_clients_interests[%d]" % size, validate_clients_interests, pool(lambda: payloads.clients_interests(size)["arguments"], 64))
+
+
+def auth_cases(payloads: PayloadFactory) -> Iterator[Case]:
+    def method_request(body: dict[str, Any]) -> MethodRequest:
+        request = MethodRequest()
+        request.account = body["account"]
+        request.login = body["login"]
+        request.token = body["token"]
+        return request
+
+    yield Case("check_auth[user]", check_auth, pool(lambda: method_request(payloads.online_score())))
+    yield Case("check_auth[admin]", check_auth, pool(lambda: method_request(payloads.online_score(admin=True)), 8))
+
+
+def store_cases(payloads: PayloadFactory) -> Iterator[Case]:
+    people = pool(payloads.score_arguments)
+    warm = DictStore()
+    for person in people:
+        get_score(warm, **person)
+    yield Case("get_score[hit]", lambda person: get_score(warm, **person), people)
+    yield Case("get_score[miss]", lambda person: get_score(DictStore(), **person), people)
+
+    storage = payloads.interests(range(CLIENT_ID_SPACE))
+    store = DictStore(storage)
+    yield Case("get_interests", lambda cid: get_interests(store, cid), payloads.client_ids(POOL_SIZE, CLIENT_ID_SPACE))
+    for size in CLIENT_IDS_SIZES:
+        cids = pool(lambda: payloads.client_ids(size, CLIENT_ID_SPACE), 64)
+        yield Case("get_interests_many[%d]" % size, lambda ids: get_interests_many(store, ids), cids, ops=size)
+
+
+def handler_cases(payloads: PayloadFactory) -> Iterator[Case]:
+    settings = {"store": DictStore(payloads.interests(range(CLIENT_ID_SPACE)))}
+
+    def handle(body: Any) -> Any:
+        return method_handler({"body": body, "headers": {}}, {}, settings)
+
+    yield Case("method_handler.online_score", handle, pool(payloads.online_score))
+    for size in CLIENT_IDS_SIZES:
+        yield Case("method_handler.clients_interests[%d]" % size, handle, pool(lambda: payloads.clients_interests(size, id_space=CLIENT_ID_SPACE), 64))
+    for size in BATCH_SIZES:
+        yield Case("method_handler.online_score_bulk[%d]" % size, handle, pool(lambda: payloads.online_score_bulk(size), 64), ops=size)
+    for size in BATCH_SIZES:
+        yield Case("method_handler.batch[%d]" % size, handle, pool(lambda: [payloads.online_score() for _ in range(size)], 64), ops=size)
+
+
+def encoding_cases(payloads: PayloadFactory) -> Iterator[Case]:
+    """
+    Response envelopes encoded on every call (the previous path) against ResponseEncoder
+    """
+    responses: dict[str, list[Any]] = {
+        "forbidden": [(ErrorMessage.FORBIDDEN.value, FORBIDDEN)],
+        "not_found": [({}, NOT_FOUND)],
+        "admin_score": [(ADMIN_SCORE, OK)],
+        "score": pool(lambda: ({"score": payloads.random.choice([0.5, 1.5, 3.0, 5.0])}, OK)),
+        "interests[100]": [({cid: ["cars", "pets"] for cid in payloads.client_ids(100)}, OK) for _ in range(64)],
+    }
+    compact = ResponseEncoder(JSON_ENCODERS["compact"]())
+    for name, inputs in responses.items():
+        yield Case("encode.%s[json.dumps]" % name, lambda response: json.dumps(make_envelope(*response)).encode("utf-8"), inputs)
+        yield Case("encode.%s[encoder]" % name, lambda response: ENCODER.encode(*response), inputs)
+        yield Case("encode.%s[compact]" % name, lambda response: compact.encode(*response), inputs)
+
+
+def http_throughput(bodies: list[bytes], requests: int, clients: int) -> dict[str, Any]:
+    """
+    Serves MainHTTPHandler on a local socket, ``clients`` keep-alive connections send ``requests`` in total
+    """
+    quiet = logging.getLogger("benchmarks.http")
+    quiet.disabled = True
+
+    class Handler(MainHTTPHandler):
+        settings = {
+            "store": DictStore(PayloadFactory(SEED).interests(range(CLIENT_ID_SPACE))),
+            "request_log": RequestLog(sample_rate=0, body_limit=0, logger=quiet),
+            "metrics": Metrics(),
+        }
+
+        def log_message(self, format: str, *args: Any) -> None:
+            pass
+
+    server = PooledHTTPServer(("localhost", 0), Handler, threads=clients)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    def client(share: int) -> list[float]:
+        connection = http.client.HTTPConnection("localhost", server.server_port)
+        latencies = []
+        for body in itertools.islice(itertools.cycle(bodies), share):
+            started = time.perf_counter()
+            connection.request("POST", "/method", body=body, headers={"Content-Type": "application/json"})
+            connection.getresponse().read()
+            latencies.append(time.perf_counter() - started)
+        connection.close()
+        return latencies
+
+    try:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(clients) as executor:
+            latencies = sorted(itertools.chain.from_iterable(executor.map(client, [requests // clients] * clients)))
+        elapsed = time.perf_counter() - started
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    return {
+        "us_per_call": statistics.median(latencies) * 1e6,
+        "p99_us": latencies[int(len(latencies) * 0.99) - 1] * 1e6,
+        "ops_per_sec": len(latencies) / elapsed,
+        "calls": len(latencies),
+    }
+
+
+def http_results(payloads: PayloadFactory, quick: bool) -> dict[str, dict[str, Any]]:
+    requests = 500 if quick else 5000
+    score = [json.dumps(payloads.online_score()).encode("utf-8") for _ in range(POOL_SIZE)]
+    interests = [json.dumps(payloads.clients_interests(100, id_space=CLIENT_ID_SPACE)).encode("utf-8") for _ in range(64)]
+    forbidden = [json.dumps({**payloads.online_score(), "token": "bad"}).encode("utf-8") for _ in range(64)]
+    return {
+        "http.online_score[1 client]": http_throughput(score, requests, 1),
+        "http.online_score[4 clients]": http_throughput(score, requests, 4),
+        "http.clients_interests[100][4 clients]": http_throughput(interests, requests, 4),
+        "http.forbidden[4 clients]": http_throughput(forbidden, requests, 4),
+    }
+
+
+def run(quick: bool = False, only: str | None = None) -> dict[str, Any]:
+    payloads = PayloadFactory(SEED)
+    number, repeat = (200, 3) if quick else (2000, 7)
+    results: dict[str, dict[str, Any]] = {}
+    groups = (field_cases, validation_cases, auth_cases, store_cases, handler_cases, encoding_cases)
+    for case in itertools.chain.from_iterable(group(payloads) for group in groups):
+        if only is None or only in case.name:
+            results[case.name] = case.run(number, repeat)
+    if only is None or "http" in only:
+        results.update(http_results(payloads, quick))
+    return {
+        "meta": {
+            "python": sys.version.split()[0],
+            "implementation": platform.python_implementation(),
+            "platform": platform.platform(),
+            "seed": SEED,
+            "quick": quick,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+
+
+def compare(current: dict[str, Any], baseline: dict[str, Any], threshold: float) -> list[dict[str, Any]]:
+    """
+    Per benchmark time ratio against the baseline, a ratio above ``1 + threshold`` is a regression
+    """
+    rows = []
+    for name, result in current["results"].items():
+        before = baseline["results"].get(name)
+        if before is None:
+            continue
+        ratio = result["us_per_call"] / before["us_per_call"]
+        rows.append({"name": name, "baseline_us": before["us_per_call"], "current_us": result["us_per_call"], "ratio": ratio, "regression": ratio > 1 + threshold})
+    return rows
+
+
+def main() -> int:
+    parser = ArgumentParser(description="Benchmarks of the validators, scoring and the request pipeline")
+    parser.add_argument("--output", action="store", default=None, help="write the results to this JSON file")
+    parser.add_argument("--baseline", action="store", default=None, help="JSON results to compare with")
+    parser.add_argument("--threshold", action="store", type=float, default=0.2, help="allowed slowdown against the baseline")
+    parser.add_argument("--filter", action="store", default=None, help="run only benchmarks whose name contains this")
+    parser.add_argument("--quick", action="store_true", help="fewer iterations, for smoke runs")
+    args = parser.parse_args()
+
+    current = run(quick=args.quick, only=args.filter)
+    for name, result in current["results"].items():
+        print(f"{name:<45} {result['us_per_call']:10.2f} us  {result['ops_per_sec']:12.0f} ops/s")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(current, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        rows = compare(current, baseline, args.threshold)
+        print()
+        for row in rows:
+            flag = "REGRESSION" if row["regression"] else ""
+            print(f"{row['name']:<45} {row['baseline_us']:10.2f} -> {row['current_us']:10.2f} us  x{row['ratio']:.2f} {flag}")
+        if any(row["regression"] for row in rows):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
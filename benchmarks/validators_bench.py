@@ -0,0 +1,91 @@
+"""
+Compares the compiled request validators with the previous dir()/setattr based validation.
+
+Run from the project root: python -m benchmarks.validators_bench
+"""
+
+import timeit
+from typing import Any, Callable
+
+from src.datas import ClientsInterestsRequest, OnlineScoreRequest
+from src.methods import validate_clients_interests, validate_online_score
+
+ONLINE_SCORE_ARGUMENTS = {
+    "phone": "79175002040",
+    "email": "stupnikov@otus.ru",
+    "first_name": "Stanislav",
+    "last_name": "Stupnikov",
+    "birthday": "01.01.1990",
+    "gender": 1,
+}
+CLIENTS_INTERESTS_ARGUMENTS = {"client_ids": list(range(100)), "date": "20.07.2017"}
+
+
+def reflective_validate_online_score(arguments: dict[str, Any]) -> tuple[OnlineScoreRequest | list[str], list[str]]:
+    score = OnlineScoreRequest()
+    errors = []
+    has = []
+
+    for key in dir(OnlineScoreRequest):
+        # Skips the slot storage (_phone, ...) too, the original class only had the field descriptors
+        if not key.startswith("_"):
+            try:
+                value = arguments.get(key, None)
+                setattr(score, key, value)
+                if value is not None:
+                    has.append(key)
+            except ValueError:
+                errors.append(f"Incorrect {key} value")
+    if len(errors) > 0:
+        return errors, has
+
+    phone = arguments.get("phone", None)
+    email = arguments.get("email", None)
+    birthday = arguments.get("birthday", None)
+    gender = arguments.get("gender", None)
+    first_name = arguments.get("first_name", None)
+    last_name = arguments.get("last_name", None)
+
+    if (phone is not None and email is not None) or (birthday is not None and gender is not None) or (first_name is not None and last_name is not None):
+        return score, has
+    return ["No couple"], has
+
+
+def reflective_validate_clients_interests(arguments: dict[str, Any]) -> tuple[ClientsInterestsRequest | list[str], int]:
+    interests = ClientsInterestsRequest()
+    errors = []
+    nclients = len(arguments.get("client_ids", []))
+
+    for key in dir(ClientsInterestsRequest):
+        # Skips the slot storage (_client_ids, ...) too, the original class only had the field descriptors
+        if not key.startswith("_"):
+            try:
+                value = arguments.get(key, None)
+                setattr(interests, key, value)
+            except ValueError:
+                errors.append(f"Incorrect {key} value")
+    if len(errors) > 0:
+        return errors, nclients
+    return interests, nclients
+
+
+def measure(func: Any, arguments: dict[str, Any], number: int) -> float:
+    """
+    Best of five runs, microseconds per call
+    """
+    return min(timeit.repeat(lambda: func(arguments), number=number, repeat=5)) / number * 1e6
+
+
+def main(number: int = 20000) -> None:
+    cases: list[tuple[str, Callable[..., Any], Callable[..., Any], dict[str, Any]]] = [
+        ("online_score", reflective_validate_online_score, validate_online_score, ONLINE_SCORE_ARGUMENTS),
+        ("clients_interests", reflective_validate_clients_interests, validate_clients_interests, CLIENTS_INTERESTS_ARGUMENTS),
+    ]
+    for name, before, after, arguments in cases:
+        old = measure(before, arguments, number)
+        new = measure(after, arguments, number)
+        print(f"{name:<18} reflective {old:8.2f} us  compiled {new:8.2f} us  speedup x{old / new:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,205 @@
 import logging
-from argparse import ArgumentParser
-from http.server import HTTPServer
+import os
+import threading
+import time
+from argparse import ArgumentParser, Namespace
+from typing import Any
 
 from src.api import MainHTTPHandler
+from src.bodies import MAX_BODY_SIZE
+from src.breaker import CircuitBreaker
+from src.cache import BLOCK, DROP_OLDEST, AsyncCachedStore, AsyncWriteBehindStore, CachedStore, WriteBehindStore
+from src.encoding import JSON_ENCODERS, ResponseEncoder
+from src.flight import AsyncSingleFlight, SingleFlight
+from src.logs import RequestLog, configure_logging
+from src.metrics import AsyncInstrumentedStore, InstrumentedStore, Metrics, stats_collector
+from src.profiling import RequestProfiler
+from src.scoring import AsyncStore, Store
+from src.server import serve_async, serve_prefork, serve_threaded
+from src.store import AsyncMemoryStore, AsyncRedisHandler, MemoryStore, RedisHandler, load_interests
+
+
+def log_pool_stats(store: RedisHandler, interval: float) -> None:
+    while True:
+        time.sleep(interval)
+        logging.info("Redis pool: %s" % store.pool_stats())
+
+
+def route_limit(value: str) -> tuple[str, int]:
+    route, _, limit = value.partition("=")
+    return route.strip("/"), int(limit)
+
+
+def common_settings(args: Namespace, metrics: Metrics) -> dict[str, Any]:
+    return {
+        "keepalive_timeout": args.keepalive_timeout,
+        "keepalive_requests": args.keepalive_requests,
+        "request_log": RequestLog(sample_rate=args.log_sample_rate, body_limit=args.log_body_limit),
+        "metrics": metrics,
+        "max_body_size": args.max_body_size,
+        "body_limits": dict(args.body_limit),
+        "stream_threshold": args.stream_threshold,
+        "stream_chunk_size": args.stream_chunk_size,
+        "encoder": ResponseEncoder(JSON_ENCODERS[args.json_encoder]()),
+        "server_timing": args.server_timing,
+        **profiler_settings(args, metrics),
+    }
+
+
+def profiler_settings(args: Namespace, metrics: Metrics) -> dict[str, Any]:
+    if not args.profile_sample_rate and not args.profile_token:
+        return {}
+    profiler = RequestProfiler(sample_rate=args.profile_sample_rate, token=args.profile_token, directory=args.profile_dir, top=args.profile_top)
+    metrics.collectors.append(stats_collector("api_profiler", "Requests run under the profiler and picked ones skipped while another was profiled", profiler.stats))
+    return {"profiler": profiler}
+
+
+def flight_settings(args: Namespace, metrics: Metrics, flight: SingleFlight | AsyncSingleFlight) -> dict[str, Any]:
+    if not args.single_flight:
+        return {}
+    metrics.collectors.append(stats_collector("api_score_single_flight", "Score cache lookups, leaders hit the store and followers share their result", flight.stats))
+    return {"score_flight": flight}
+
+
+def redis_options(args: Namespace) -> dict[str, Any]:
+    return {
+        "host": args.redis_host,
+        "port": args.redis_port,
+        "db": args.redis_db,
+        "max_connections": args.redis_max_connections,
+        "pool_timeout": args.redis_pool_timeout,
+        "retries": args.redis_retries,
+        "socket_timeout": args.redis_timeout,
+        "connect_timeout": args.redis_connect_timeout,
+    }
+
+
+def build_breaker(args: Namespace, metrics: Metrics) -> CircuitBreaker | None:
+    if args.breaker_failures <= 0:
+        return None
+    breaker = CircuitBreaker(failure_threshold=args.breaker_failures, reset_timeout=args.breaker_reset_timeout, probes=args.breaker_probes, name="redis")
+    metrics.collectors.append(stats_collector("api_store_breaker", "Redis circuit breaker, state 0 closed, 1 half-open, 2 open", breaker.stats))
+    return breaker
+
+
+def build_memory_store(args: Namespace, interests: dict[str, str] | None, metrics: Metrics) -> MemoryStore:
+    store = MemoryStore(max_bytes=args.memory_max_bytes, data=interests)
+    metrics.collectors.append(stats_collector("api_memory_store", "In-memory store stats", store.stats))
+    return store
+
+
+def build_settings(args: Namespace, interests: dict[str, str] | None = None) -> dict[str, Any]:
+    metrics = Metrics()
+    store: Store
+    if args.store == "memory":
+        store = build_memory_store(args, interests, metrics)
+    else:
+        redis_store = RedisHandler(idle_timeout=args.redis_idle_timeout, breaker=build_breaker(args, metrics), **redis_options(args))
+        if args.pool_stats_interval > 0:
+            threading.Thread(target=log_pool_stats, args=(redis_store, args.pool_stats_interval), daemon=True).start()
+        metrics.collectors.append(stats_collector("api_redis_pool", "Redis connection pool stats", redis_store.pool_stats))
+        store = redis_store
+
+    store = InstrumentedStore(store, metrics)
+    if args.write_behind:
+        writer = WriteBehindStore(store, max_queue=args.write_behind_queue, batch_size=args.write_behind_batch, policy=args.write_behind_policy)
+        metrics.collectors.append(stats_collector("api_write_behind", "Score cache writes queued for the background flusher", writer.stats))
+        store = writer
+    if args.l1_cache_size > 0:
+        cached = CachedStore(store, max_size=args.l1_cache_size, ttl=args.l1_cache_ttl)
+        metrics.collectors.append(stats_collector("api_l1_cache", "In-process score cache stats", cached.local.stats))
+        store = cached
+    return {"store": store, **common_settings(args, metrics), **flight_settings(args, metrics, SingleFlight())}
+
+
+def build_async_settings(args: Namespace, interests: dict[str, str] | None = None) -> dict[str, Any]:
+    metrics = Metrics()
+    store: AsyncStore
+    if args.store == "memory":
+        store = AsyncMemoryStore(build_memory_store(args, interests, metrics))
+    else:
+        store = AsyncRedisHandler(breaker=build_breaker(args, metrics), **redis_options(args))
+
+    store = AsyncInstrumentedStore(store, metrics)
+    if args.write_behind:
+        writer = AsyncWriteBehindStore(store, max_queue=args.write_behind_queue, batch_size=args.write_behind_batch, policy=args.write_behind_policy)
+        metrics.collectors.append(stats_collector("api_write_behind", "Score cache writes queued for the background flusher", writer.stats))
+        store = writer
+    if args.l1_cache_size > 0:
+        cached = AsyncCachedStore(store, max_size=args.l1_cache_size, ttl=args.l1_cache_ttl)
+        metrics.collectors.append(stats_collector("api_l1_cache", "In-process score cache stats", cached.local.stats))
+        store = cached
+    return {"store": store, **common_settings(args, metrics), **flight_settings(args, metrics, AsyncSingleFlight())}
+
 
 if __name__ == "__main__":
     parser = ArgumentParser()
     parser.add_argument("-p", "--port", action="store", type=int, default=8080)
     parser.add_argument("-l", "--log", action="store", default=None)
-    args = parser.parse_args()
-
-    logging.basicConfig(
-        filename=args.log,
-        level=logging.INFO,
-        format="[%(asctime)s] %(levelname).1s %(message)s",
-        datefmt="%Y.%m.%d %H:%M:%S",
+    parser.add_argument("--log-mode", action="store", choices=["sync", "background"], default="sync", help="background writes log records on a separate thread")
+    parser.add_argument("--log-sample-rate", action="store", type=float, default=1.0, help="share of successful requests that are logged, errors are always logged")
+    parser.add_argument("--log-body-limit", action="store", type=int, default=1024, help="bytes of request and response bodies kept in the log, 0 leaves them out")
+    parser.add_argument("--mode", action="store", choices=["thread", "prefork", "async"], default="thread")
+    parser.add_argument("-w", "--workers", action="store", type=int, default=1, help="threads in thread mode, processes in prefork and async modes")
+    parser.add_argument("--threads", action="store", type=int, default=1, help="threads per process in prefork mode")
+    parser.add_argument("--queue-size", action="store", type=int, default=None, help="accepted connections waiting for a thread")
+    parser.add_argument("--store", action="store", choices=["redis", "memory"], default="redis", help="memory keeps the store in each server process")
+    parser.add_argument("--memory-max-bytes", action="store", type=int, default=64 * 1024 * 1024, help="approximate size limit of the memory store score cache")
+    parser.add_argument("--interests-file", action="store", default=None, help="JSON object of client id to interests, loaded into the memory store")
+    parser.add_argument("--redis-host", action="store", default="localhost")
+    parser.add_argument("--redis-port", action="store", type=int, default=6379)
+    parser.add_argument("--redis-db", action="store", type=int, default=0)
+    parser.add_argument("--redis-max-connections", action="store", type=int, default=50)
+    parser.add_argument("--redis-pool-timeout", action="store", type=float, default=5)
+    parser.add_argument("--redis-idle-timeout", action="store", type=float, default=300)
+    parser.add_argument("--redis-retries", action="store", type=int, default=3, help="retries of a failed Redis command")
+    parser.add_argument("--redis-timeout", action="store", type=float, default=5, help="Redis socket timeout in seconds")
+    parser.add_argument("--redis-connect-timeout", action="store", type=float, default=5)
+    parser.add_argument("--breaker-failures", action="store", type=int, default=5, help="consecutive Redis failures that open the circuit, 0 disables it")
+    parser.add_argument("--breaker-reset-timeout", action="store", type=float, default=10, help="seconds the circuit stays open before probing")
+    parser.add_argument("--breaker-probes", action="store", type=int, default=1, help="successful probes that close the circuit")
+    parser.add_argument("--pool-stats-interval", action="store", type=float, default=0)
+    parser.add_argument("--l1-cache-size", action="store", type=int, default=0, help="in-process score cache entries, 0 disables it")
+    parser.add_argument("--l1-cache-ttl", action="store", type=float, default=60)
+    parser.add_argument("--write-behind", action="store_true", help="write computed scores to the store from a background worker")
+    parser.add_argument("--write-behind-queue", action="store", type=int, default=10000, help="score writes waiting to be flushed")
+    parser.add_argument("--write-behind-batch", action="store", type=int, default=500, help="score writes sent in one pipelined round trip")
+    parser.add_argument("--write-behind-policy", action="store", choices=[DROP_OLDEST, BLOCK], default=DROP_OLDEST, help="what a write does when the queue is full")
+    parser.add_argument("--no-single-flight", action="store_false", dest="single_flight", help="do not coalesce concurrent score lookups of one person")
+    parser.add_argument("--max-body-size", action="store", type=int, default=MAX_BODY_SIZE, help="largest request body in bytes, larger ones get 413")
+    parser.add_argument("--body-limit", action="append", type=route_limit, default=[], metavar="ROUTE=BYTES", help="body size limit of one route, can be repeated")
+    parser.add_argument("--stream-threshold", action="store", type=int, default=0, help="client_ids from which interests are streamed chunked, 0 disables it")
+    parser.add_argument("--stream-chunk-size", action="store", type=int, default=500, help="clients read from the store per streamed chunk")
+    parser.add_argument("--keepalive-timeout", action="store", type=float, default=15, help="seconds an idle client connection is kept open")
+    parser.add_argument("--keepalive-requests", action="store", type=int, default=1000, help="requests served on one connection before it is closed")
+    parser.add_argument("--json-encoder", action="store", choices=sorted(JSON_ENCODERS), default="json", help="encoder of response bodies, orjson must be installed separately")
+    parser.add_argument("--server-timing", action="store_true", help="return the request stage timings in a Server-Timing header")
+    parser.add_argument("--profile-sample-rate", action="store", type=float, default=0, help="share of requests whose handler runs under cProfile")
+    parser.add_argument(
+        "--profile-token",
+        action="store",
+        default=os.environ.get("API_PROFILE_TOKEN"),
+        help="requests with this X-Profile-Token header are profiled and can read GET /debug/profile, defaults to $API_PROFILE_TOKEN",
     )
+    parser.add_argument("--profile-dir", action="store", default=None, help="directory the per-method profiles are written to on shutdown")
+    parser.add_argument("--profile-top", action="store", type=int, default=30, help="functions per method in the /debug/profile report")
+    args = parser.parse_args()
+    try:
+        JSON_ENCODERS[args.json_encoder]()
+    except ImportError as e:
+        parser.error("--json-encoder %s: %s" % (args.json_encoder, e))
 
-    server = HTTPServer(("localhost", args.port), MainHTTPHandler)
-
-    logging.info("Starting server at %s" % args.port)
+    configure_logging(args.log, background=args.log_mode == "background")
 
-    try:
-        server.serve_forever()
-    except KeyboardInterrupt:
-        pass
+    address = ("localhost", args.port)
+    # Parsed once here instead of in every worker
+    interests = load_interests(args.interests_file) if args.interests_file else None
 
-    server.server_close()
+    if args.mode == "async":
+        serve_async(address, lambda: build_async_settings(args, interests), workers=args.workers)
+    elif args.mode == "prefork":
+        serve_prefork(
+            address, MainHTTPHandler, lambda: build_settings(args, interests), workers=args.workers or os.cpu_count() or 1, threads=args.threads, queue_size=args.queue_size
+        )
+    else:
+        serve_threaded(address, MainHTTPHandler, lambda: build_settings(args, interests), threads=args.workers, queue_size=args.queue_size)
@@ -0,0 +1,286 @@
+import asyncio
+import functools
+import inspect
+import json
+import logging
+import signal
+import socket
+import time
+from http import HTTPStatus
+from http.client import HTTPMessage, parse_headers
+from io import BytesIO
+from typing import Any, Awaitable, Callable
+
+from src.api import KEEPALIVE_REQUESTS, KEEPALIVE_TIMEOUT, AsyncInterestsStream, async_method_handler, get_request_id
+from src.bodies import BodyTooLarge, async_read_chunked, body_limit, chunked, content_length
+from src.constants import BAD_REQUEST, FORBIDDEN, INTERNAL_ERROR, NOT_FOUND, OK, PAYLOAD_TOO_LARGE, STORE_ERROR
+from src.encoding import ENCODER, response_head
+from src.logs import REQUEST_LOG
+from src.metrics import METRICS, METRICS_CONTENT_TYPE
+from src.profiling import PROFILE_PATH, REPORT_CONTENT_TYPE, report_method
+from src.store import STORE_ERRORS
+from src.timing import TIMINGS, Timings, record, server_timing
+
+AsyncRoute = Callable[[dict[str, Any], dict[str, Any], dict[str, Any]], Awaitable[tuple[Any, int]]]
+
+MAX_HEADER_SIZE = 64 * 1024
+
+
+class AsyncHTTPServer:
+    """
+    asyncio front end speaking the same POST /<route> JSON protocol as MainHTTPHandler
+    """
+
+    router: dict[str, AsyncRoute] = {"method": async_method_handler}
+
+    def __init__(self, settings: dict[str, Any]) -> None:
+        self.settings = settings
+        self.keepalive_timeout = settings.get("keepalive_timeout", KEEPALIVE_TIMEOUT)
+        self.keepalive_requests = settings.get("keepalive_requests", KEEPALIVE_REQUESTS)
+        self.request_log = settings.get("request_log") or REQUEST_LOG
+        self.metrics = settings.get("metrics") or METRICS
+        self.encoder = settings.get("encoder") or ENCODER
+        self.timing_header = settings.get("server_timing", False)
+        self.idle: set[asyncio.StreamWriter] = set()
+        self.draining = False
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        Serves requests from one connection until the client or the keep-alive limits close it
+        """
+        try:
+            for left in range(self.keepalive_requests - 1, -1, -1):
+                if not await self.handle_one(reader, writer, last=left == 0):
+                    break
+        finally:
+            self.idle.discard(writer)
+            writer.close()
+
+    async def handle_one(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, last: bool) -> bool:
+        """
+        Answers one request, returns whether the connection can carry the next one
+        """
+        self.idle.add(writer)
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), self.keepalive_timeout)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError, TimeoutError):
+            return False
+        finally:
+            self.idle.discard(writer)
+
+        try:
+            request_line, _, raw_headers = head.partition(b"\r\n")
+            command, path, version = request_line.decode("latin-1").split()
+            headers = parse_headers(BytesIO(raw_headers))
+        except Exception:
+            await self.respond(writer, BAD_REQUEST, self.encoder.encode({}, BAD_REQUEST))
+            return False
+
+        keep_alive = not last and not self.draining and wants_keep_alive(version, headers)
+        if command == "GET" and path.partition("?")[0] in ("/metrics", PROFILE_PATH):
+            return await self.respond_get(writer, path, headers, keep_alive, version == "HTTP/1.0")
+        if command != "POST":
+            # The request may carry a body we are not going to read
+            await self.respond(writer, HTTPStatus.NOT_IMPLEMENTED, b"")
+            return False
+
+        if expects_continue(version, headers, body_limit(self.settings, path.strip("/"))):
+            writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+
+        context: dict[str, Any] = {"request_id": get_request_id(headers)}
+        timings = Timings()
+        reset = TIMINGS.set(timings)
+        started = time.perf_counter()
+        self.metrics.in_flight.inc()
+        try:
+            code, body, data_string = await self.dispatch(reader, path, headers, context)
+            # A body that could not be read leaves the stream at an unknown position
+            keep_alive = keep_alive and data_string is not None
+            written = time.perf_counter()
+            if isinstance(body, AsyncInterestsStream):
+                alive = await self.respond_stream(writer, code, body, keep_alive, version == "HTTP/1.0", context)
+                body = body.head
+            else:
+                alive = await self.respond(writer, code, body, keep_alive, version == "HTTP/1.0", headers=server_timing(self.timing_header))
+            timings.add("write", time.perf_counter() - written)
+        finally:
+            TIMINGS.reset(reset)
+            self.metrics.in_flight.dec()
+        context["timings"] = timings.fields()
+        self.metrics.observe_request(context, time.perf_counter() - started)
+        self.request_log.log(path, data_string, body, context)
+        return alive
+
+    async def dispatch(self, reader: asyncio.StreamReader, path: str, headers: HTTPMessage, context: dict[str, Any]) -> tuple[int, bytes | AsyncInterestsStream, bytes | None]:
+        """
+        Reads the body and routes the request, returns the code, the encoded envelope (or the stream that encodes it)
+        and the raw request body
+        """
+        response, code = {}, OK
+        request = None
+        data_string: bytes | None = None
+        route = path.strip("/")
+        started = time.perf_counter()
+        try:
+            # A client that stops sending mid-body gets 400 and the connection closed, like one going idle
+            data_string = await asyncio.wait_for(read_body(reader, headers, body_limit(self.settings, route)), self.keepalive_timeout)
+            read = time.perf_counter()
+            record("read", read - started)
+            request = json.loads(data_string)
+            record("parse", time.perf_counter() - read)
+        except BodyTooLarge:
+            code = PAYLOAD_TOO_LARGE
+        except Exception:
+            code = BAD_REQUEST
+
+        if request:
+            if route in self.router:
+                call = functools.partial(self.router[route], {"body": request, "headers": headers}, context, self.settings)
+                profiler = self.settings.get("profiler")
+                try:
+                    response, code = await (call() if profiler is None else profiler.async_run(headers, context, call))
+                except Exception as e:
+                    logging.exception("Unexpected error: %s" % e)
+                    code = INTERNAL_ERROR
+            else:
+                code = NOT_FOUND
+
+        context["code"] = code
+        if isinstance(response, AsyncInterestsStream):
+            return code, response, data_string
+        started = time.perf_counter()
+        body = self.encoder.encode(response, code)
+        record("encode", time.perf_counter() - started)
+        return code, body, data_string
+
+    async def respond_get(self, writer: asyncio.StreamWriter, target: str, headers: HTTPMessage, keep_alive: bool, http10: bool) -> bool:
+        """
+        MainHTTPHandler.do_GET: the metrics and the profiler report
+        """
+        path, _, query = target.partition("?")
+        profiler = self.settings.get("profiler")
+        if path == "/metrics":
+            return await self.respond(writer, OK, self.metrics.render().encode("utf-8"), keep_alive, http10, METRICS_CONTENT_TYPE)
+        if path == PROFILE_PATH and profiler is not None:
+            if profiler.authorized(headers):
+                return await self.respond(writer, OK, profiler.report(report_method(query)).encode("utf-8"), keep_alive, http10, REPORT_CONTENT_TYPE)
+            return await self.respond(writer, FORBIDDEN, self.encoder.encode({}, FORBIDDEN), keep_alive, http10)
+        return await self.respond(writer, NOT_FOUND, self.encoder.encode({}, NOT_FOUND), keep_alive, http10)
+
+    @staticmethod
+    async def respond(
+        writer: asyncio.StreamWriter,
+        code: int,
+        body: bytes,
+        keep_alive: bool = False,
+        http10: bool = False,
+        content_type: str = "application/json",
+        headers: dict[str, str] | None = None,
+    ) -> bool:
+        """
+        Writes one response, returns whether the connection is still usable
+        """
+        connection = ("keep-alive" if http10 else None) if keep_alive else "close"
+        try:
+            writer.write(response_head(code, content_type, len(body), connection, headers) + body)
+            await writer.drain()
+        except ConnectionError:
+            return False
+        return keep_alive
+
+    async def respond_stream(self, writer: asyncio.StreamWriter, code: int, stream: AsyncInterestsStream, keep_alive: bool, http10: bool, context: dict[str, Any]) -> bool:
+        """
+        MainHTTPHandler.send_stream: chunked transfer encoding, waiting for the client to take each chunk
+        """
+        if http10:
+            try:
+                body = b"".join([piece async for piece in stream.encode()])
+            except STORE_ERRORS:
+                code, body = INTERNAL_ERROR, self.encoder.encode(STORE_ERROR, INTERNAL_ERROR)
+                context["code"] = code
+            return await self.respond(writer, code, body, keep_alive, http10, headers=server_timing(self.timing_header))
+
+        try:
+            writer.write(response_head(code, "application/json", None, None if keep_alive else "close", server_timing(self.timing_header)))
+            async for piece in stream.encode():
+                writer.write(b"%x\r\n%s\r\n" % (len(piece), piece))
+                await writer.drain()
+            writer.write(b"0\r\n\r\n")
+            await writer.drain()
+        except ConnectionError:
+            return False
+        except STORE_ERRORS as e:
+            logging.error("Interests stream aborted after %s chunks: %s" % (stream.chunks, e))
+            context["code"] = INTERNAL_ERROR
+            return False
+        finally:
+            context["stream_chunks"] = stream.chunks
+        return keep_alive
+
+    def close_idle(self) -> None:
+        """
+        Stops serving: connections waiting for their next request are closed, busy ones close after the response
+        """
+        self.draining = True
+        for writer in list(self.idle):
+            writer.close()
+
+
+async def read_body(reader: asyncio.StreamReader, headers: HTTPMessage, limit: int) -> bytes:
+    """
+    Content-Length or chunked body of at most ``limit`` bytes, a body over the limit is left unread
+    """
+    if chunked(headers):
+        return await async_read_chunked(reader, limit)
+    return await reader.readexactly(content_length(headers, limit))
+
+
+def expects_continue(version: str, headers: HTTPMessage, limit: int) -> bool:
+    """
+    Whether the client waits for a 100 Continue before sending a body it is allowed to send
+    """
+    if version == "HTTP/1.0" or headers.get("Expect", "").lower() != "100-continue":
+        return False
+    try:
+        if not chunked(headers):
+            content_length(headers, limit)
+    except (TypeError, ValueError):
+        return False
+    return True
+
+
+def wants_keep_alive(version: str, headers: HTTPMessage) -> bool:
+    connection = headers.get("Connection", "").lower()
+    if version == "HTTP/1.0":
+        return connection == "keep-alive"
+    return connection != "close"
+
+
+async def serve(sock: socket.socket, make_settings: Callable[[], dict[str, Any]]) -> None:
+    settings = make_settings()
+    app = AsyncHTTPServer(settings)
+    server = await asyncio.start_server(app.handle, sock=sock, limit=MAX_HEADER_SIZE)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stop.set)
+
+    await stop.wait()
+    server.close()
+    app.close_idle()
+    # Waits for the connections that are still being served
+    await server.wait_closed()
+
+    store = settings.get("store")
+    if store is not None and hasattr(store, "close"):
+        closed = store.close()
+        if inspect.isawaitable(closed):
+            await closed
+    profiler = settings.get("profiler")
+    if profiler is not None:
+        profiler.close()
+
+
+def run_worker(sock: socket.socket, make_settings: Callable[[], dict[str, Any]]) -> None:
+    asyncio.run(serve(sock, make_settings))
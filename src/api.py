@@ -1,27 +1,95 @@
+import functools
+import itertools
 import json
 import logging
+import time
 import uuid
 from email.message import Message
 from http.server import BaseHTTPRequestHandler
-from typing import Any, Callable
+from typing import Any, AsyncIterator, Callable, Iterator
 
-from redis.exceptions import ConnectionError as RedisConnectionError
+from src.bodies import BodyTooLarge, body_limit, chunked, content_length, read_chunked
+from src.constants import ADMIN_SCORE, BAD_REQUEST, ERRORS, FORBIDDEN, INTERNAL_ERROR, INVALID_REQUEST, NOT_FOUND, OK, PAYLOAD_TOO_LARGE, STORE_ERROR, ErrorMessage
+from src.datas import ClientsInterestsRequest, MethodRequest, OnlineScoreRequest
+from src.encoding import ENCODER, ResponseEncoder, make_envelope, response_head
+from src.logs import REQUEST_LOG
+from src.methods import check_auth, validate_clients_interests, validate_online_score, validate_online_score_bulk
+from src.metrics import METRICS, METRICS_CONTENT_TYPE
+from src.profiling import PROFILE_PATH, REPORT_CONTENT_TYPE, report_method
+from src.scoring import (
+    AsyncStore,
+    Store,
+    async_get_interests_many,
+    async_get_score,
+    async_get_scores,
+    async_iter_interests,
+    get_interests_many,
+    get_score,
+    get_scores,
+    iter_interests,
+)
+from src.store import STORE_ERRORS, default_store
+from src.timing import TIMINGS, Timings, record, server_timing
 
-from src.constants import BAD_REQUEST, ERRORS, FORBIDDEN, INTERNAL_ERROR, INVALID_REQUEST, NOT_FOUND, OK, ErrorMessage
-from src.datas import MethodRequest
-from src.methods import check_auth, validate_clients_interests, validate_online_score
-from src.scoring import get_interests, get_score
-from src.store import RedisHandler
+KEEPALIVE_TIMEOUT = 15
+KEEPALIVE_REQUESTS = 1000
+STREAM_CHUNK_SIZE = 500
+STREAM_HEAD = b'{"response": {'
+STREAM_TAIL = b'}, "code": %d}' % OK
 
 
-def method_handler(request: dict[str, Any], ctx: dict[str, Any], settings: Any = None) -> tuple[dict[str, Any] | str, int]:
-    req = MethodRequest()
-    body = request.get("body", None)
+def encode_interests(chunk: dict[Any, list[str]]) -> bytes:
+    """
+    Members of the JSON object, as json.dumps writes them inside the braces
+    """
+    return json.dumps(chunk)[1:-1].encode("utf-8")
+
+
+class InterestsStream:
+    """
+    clients_interests response encoded chunk by chunk while ``rest`` is read from the store.
+
+    The first chunk is read before the response starts, so a store that is down still gets a regular error response.
+    """
+
+    def __init__(self, first: dict[Any, list[str]], rest: Iterator[dict[Any, list[str]]]) -> None:
+        self.head = STREAM_HEAD + encode_interests(first)
+        self.rest = rest
+        self.chunks = 1
+
+    def encode(self) -> Iterator[bytes]:
+        """
+        Pieces of the same envelope json.dumps(make_envelope(interests, OK)) gives
+        """
+        yield self.head
+        for chunk in self.rest:
+            self.chunks += 1
+            yield b", " + encode_interests(chunk)
+        yield STREAM_TAIL
 
-    store = RedisHandler()
 
-    response: dict[str, Any] | str | int
-    code: int
+class AsyncInterestsStream:
+    def __init__(self, first: dict[Any, list[str]], rest: AsyncIterator[dict[Any, list[str]]]) -> None:
+        self.head = STREAM_HEAD + encode_interests(first)
+        self.rest = rest
+        self.chunks = 1
+
+    async def encode(self) -> AsyncIterator[bytes]:
+        yield self.head
+        async for chunk in self.rest:
+            self.chunks += 1
+            yield b", " + encode_interests(chunk)
+        yield STREAM_TAIL
+
+
+Response = tuple[dict[str, Any] | list[Any] | str | InterestsStream | AsyncInterestsStream, int]
+
+
+def authenticate(body: Any) -> MethodRequest | Response:
+    """
+    Builds the method request from the body and checks its token, returns an error response on failure
+    """
+    req = MethodRequest()
 
     if not body:
         return {}, INVALID_REQUEST
@@ -37,84 +105,474 @@ def method_handler(request: dict[str, Any], ctx: dict[str, Any], settings: Any =
     if not check_auth(req):
         return ErrorMessage.FORBIDDEN.value, FORBIDDEN
 
+    return req
+
+
+def online_score_request(req: MethodRequest, ctx: dict[str, Any]) -> OnlineScoreRequest | Response:
+    result_score, has = validate_online_score(req.arguments)
+    if isinstance(result_score, list):
+        return ", ".join(result_score), INVALID_REQUEST
+
+    ctx["has"] = has
+    if req.is_admin:
+        return ADMIN_SCORE, OK
+    return result_score
+
+
+def clients_interests_request(req: MethodRequest, ctx: dict[str, Any]) -> ClientsInterestsRequest | Response:
+    result_interests, nclients = validate_clients_interests(req.arguments)
+    ctx["nclients"] = nclients
+    if isinstance(result_interests, list):
+        return ", ".join(result_interests), INVALID_REQUEST
+    return result_interests
+
+
+class ScoreBulk:
+    """
+    Person records of an online_score_bulk request, invalid ones are kept as None with their error message
+    """
+
+    def __init__(self, records: list[OnlineScoreRequest | None], errors: dict[int, str]) -> None:
+        self.records = records
+        self.errors = errors
+
+    def people(self) -> list[dict[str, Any]]:
+        return [person(record) for record in self.records if record is not None]
+
+    def response(self, scores: Iterator[float | None]) -> dict[str, Any]:
+        """
+        Takes one score per valid record from ``scores``, in order. A valid record scored None failed on the server.
+        """
+        errors = dict(self.errors)
+        results = []
+        for i, valid in enumerate(self.records):
+            score = None if valid is None else next(scores)
+            if valid is not None and score is None:
+                errors[i] = ERRORS[INTERNAL_ERROR]
+            results.append(score)
+        return {"scores": results, "errors": errors}
+
+
+def online_score_bulk_request(req: MethodRequest, ctx: dict[str, Any]) -> ScoreBulk | Response:
+    validated = validate_online_score_bulk(req.arguments)
+    if isinstance(validated, list):
+        return ", ".join(validated), INVALID_REQUEST
+
+    bulk = ScoreBulk(*validated)
+    ctx["npeople"] = len(bulk.records)
+    if req.is_admin:
+        return bulk.response(itertools.repeat(ADMIN_SCORE["score"])), OK
+    return bulk
+
+
+Prepared = OnlineScoreRequest | ClientsInterestsRequest | ScoreBulk
+
+
+def prepare_request(body: Any, ctx: dict[str, Any]) -> Prepared | Response:
+    """
+    Everything before the store: auth and validation of the method arguments, both timed into ``ctx`` and the
+    request timings
+    """
+    started = time.perf_counter()
+    req = authenticate(body)
+    validated = time.perf_counter()
+    ctx["auth_seconds"] = validated - started
+    record("auth", ctx["auth_seconds"])
+    if isinstance(req, tuple):
+        return req
+
+    prepared: Prepared | Response
     if req.method == "online_score":
-        result_score, has = validate_online_score(req.arguments)
-        if isinstance(result_score, list):
-            response = ", ".join(result_score)
-            code = INVALID_REQUEST
-        else:
-            if req.is_admin:
-                response = {"score": 42}
-                code = OK
-            else:
-                response = {
-                    "score": get_score(
-                        store, result_score.phone, result_score.email, result_score.birthday, result_score.gender, result_score.first_name, result_score.last_name
-                    )
-                }
-                code = OK
-
-            ctx["has"] = has
+        prepared = online_score_request(req, ctx)
+    elif req.method == "online_score_bulk":
+        prepared = online_score_bulk_request(req, ctx)
     elif req.method == "clients_interests":
-        result_interests, nclients = validate_clients_interests(req.arguments)
-        if isinstance(result_interests, list):
-            response = ", ".join(result_interests)
-            code = INVALID_REQUEST
-        else:
-            try:
-                response = {client_id: get_interests(store, client_id) for client_id in result_interests.client_ids}
-                code = OK
-            except RedisConnectionError:
-                response = "Store connection error"
-                code = INTERNAL_ERROR
-
-        ctx["nclients"] = nclients
+        prepared = clients_interests_request(req, ctx)
     else:
         return ErrorMessage.INVALID_REQUEST.value, INVALID_REQUEST
+    ctx["method"] = req.method
+    ctx["validation_seconds"] = time.perf_counter() - validated
+    record("validation", ctx["validation_seconds"])
+    return prepared
+
+
+def person(score: OnlineScoreRequest) -> dict[str, Any]:
+    return {
+        "phone": score.phone,
+        "email": score.email,
+        "birthday": score.birthday,
+        "gender": score.gender,
+        "first_name": score.first_name,
+        "last_name": score.last_name,
+    }
+
 
-    return response, code
+def streamed(prepared: ClientsInterestsRequest, settings: dict[str, Any]) -> bool:
+    """
+    Whether the interests are streamed: ``stream_threshold`` or more client ids, 0 never streams
+    """
+    threshold = settings.get("stream_threshold", 0)
+    return bool(threshold) and len(prepared.client_ids) >= threshold
+
+
+def method_handler(request: dict[str, Any], ctx: dict[str, Any], settings: dict[str, Any] | None = None) -> Response:
+    settings = settings or {}
+    store = settings.get("store") or default_store()
+    body = request.get("body", None)
+
+    if isinstance(body, list):
+        return batch_handler(body, ctx, store)
+
+    prepared = prepare_request(body, ctx)
+    if isinstance(prepared, tuple):
+        return prepared
+
+    if isinstance(prepared, OnlineScoreRequest):
+        return {"score": get_score(store, **person(prepared), flight=settings.get("score_flight"))}, OK
+    if isinstance(prepared, ScoreBulk):
+        return prepared.response(iter(get_scores(store, prepared.people()))), OK
+    try:
+        if streamed(prepared, settings):
+            chunks = iter_interests(store, prepared.client_ids, settings.get("stream_chunk_size") or STREAM_CHUNK_SIZE)
+            return InterestsStream(next(chunks), chunks), OK
+        return get_interests_many(store, prepared.client_ids), OK
+    except STORE_ERRORS:
+        return STORE_ERROR, INTERNAL_ERROR
+
+
+async def async_method_handler(request: dict[str, Any], ctx: dict[str, Any], settings: dict[str, Any]) -> Response:
+    """
+    Same protocol as method_handler, but the store calls are awaited on an AsyncStore from settings
+    """
+    store = settings["store"]
+    body = request.get("body", None)
+
+    if isinstance(body, list):
+        return await async_batch_handler(body, ctx, store)
+
+    prepared = prepare_request(body, ctx)
+    if isinstance(prepared, tuple):
+        return prepared
+
+    if isinstance(prepared, OnlineScoreRequest):
+        return {"score": await async_get_score(store, **person(prepared), flight=settings.get("score_flight"))}, OK
+    if isinstance(prepared, ScoreBulk):
+        return prepared.response(iter(await async_get_scores(store, prepared.people()))), OK
+    try:
+        if streamed(prepared, settings):
+            chunks = async_iter_interests(store, prepared.client_ids, settings.get("stream_chunk_size") or STREAM_CHUNK_SIZE)
+            return AsyncInterestsStream(await anext(chunks), chunks), OK
+        return await async_get_interests_many(store, prepared.client_ids), OK
+    except STORE_ERRORS:
+        return STORE_ERROR, INTERNAL_ERROR
+
+
+class Batch:
+    """
+    Method requests of one batch body, validated and authenticated one by one, with their store work grouped
+    """
+
+    def __init__(self, bodies: list[Any], ctx: dict[str, Any]) -> None:
+        items: list[dict[str, Any]] = [{} for _ in bodies]
+        ctx["method"] = "batch"
+        ctx["batch"] = items
+        self.results: list[Response] = []
+        self.scores: list[tuple[int, OnlineScoreRequest]] = []
+        self.interests: list[tuple[int, ClientsInterestsRequest]] = []
+        self.bulks: list[tuple[int, ScoreBulk]] = []
+
+        for i, (body, item) in enumerate(zip(bodies, items)):
+            try:
+                prepared = prepare_request(body, item) if isinstance(body, dict) else ({}, INVALID_REQUEST)
+            except Exception:
+                # One malformed item does not fail the others
+                logging.exception("Batch item %d failed" % i)
+                prepared = ERRORS[INTERNAL_ERROR], INTERNAL_ERROR
+            if isinstance(prepared, OnlineScoreRequest):
+                self.scores.append((i, prepared))
+            elif isinstance(prepared, ClientsInterestsRequest):
+                self.interests.append((i, prepared))
+            elif isinstance(prepared, ScoreBulk):
+                self.bulks.append((i, prepared))
+            else:
+                self.results.append(prepared)
+                continue
+            self.results.append(({}, OK))
+
+    def people(self) -> list[dict[str, Any]]:
+        """
+        People to score: the online_score items, then the records of the online_score_bulk items
+        """
+        return [person(score) for _, score in self.scores] + [record for _, bulk in self.bulks for record in bulk.people()]
+
+    def client_ids(self) -> list[Any]:
+        return [cid for _, interests in self.interests for cid in interests.client_ids]
+
+    def set_scores(self, scores: list[float | None]) -> None:
+        for (i, _), score in zip(self.scores, scores):
+            self.results[i] = ({"score": score}, OK) if score is not None else (ERRORS[INTERNAL_ERROR], INTERNAL_ERROR)
+        rest = iter(scores[len(self.scores) :])
+        for i, bulk in self.bulks:
+            self.results[i] = bulk.response(rest), OK
+
+    def set_interests(self, found: dict[Any, list[str]] | None) -> None:
+        for i, interests in self.interests:
+            if found is None:
+                self.results[i] = STORE_ERROR, INTERNAL_ERROR
+            else:
+                self.results[i] = {cid: found[cid] for cid in interests.client_ids}, OK
+
+    def response(self) -> tuple[list[dict[str, Any]], int]:
+        return [make_envelope(response, code) for response, code in self.results], OK
+
+
+def batch_handler(bodies: list[Any], ctx: dict[str, Any], store: Store) -> tuple[list[dict[str, Any]], int]:
+    """
+    Answers a JSON array of method requests in order, all their store calls take at most three round trips
+    """
+    batch = Batch(bodies, ctx)
+    if batch.scores or batch.bulks:
+        batch.set_scores(get_scores(store, batch.people()))
+    if batch.interests:
+        try:
+            batch.set_interests(get_interests_many(store, batch.client_ids()))
+        except STORE_ERRORS:
+            batch.set_interests(None)
+    return batch.response()
+
+
+async def async_batch_handler(bodies: list[Any], ctx: dict[str, Any], store: AsyncStore) -> tuple[list[dict[str, Any]], int]:
+    batch = Batch(bodies, ctx)
+    if batch.scores or batch.bulks:
+        batch.set_scores(await async_get_scores(store, batch.people()))
+    if batch.interests:
+        try:
+            batch.set_interests(await async_get_interests_many(store, batch.client_ids()))
+        except STORE_ERRORS:
+            batch.set_interests(None)
+    return batch.response()
+
+
+def get_request_id(headers: Message) -> str:
+    return headers.get("HTTP_X_REQUEST_ID", uuid.uuid4().hex)
 
 
 class MainHTTPHandler(BaseHTTPRequestHandler):
+    """
+    Persistent HTTP/1.1 connections: a connection is closed after ``keepalive_timeout`` idle seconds, after
+    ``keepalive_requests`` requests, or after a request whose body can not be framed. Between requests the server
+    may close it to give its thread to another connection.
+    """
+
     router: dict[str, Callable] = {"method": method_handler}
+    settings: dict[str, Any] = {}
+    protocol_version = "HTTP/1.1"
+    # Streamed responses go out in several writes, Nagle would hold a chunk until the client ACKs the previous one
+    disable_nagle_algorithm = True
 
     @staticmethod
     def get_request_id(headers: Message) -> str:
-        return headers.get("HTTP_X_REQUEST_ID", uuid.uuid4().hex)
+        return get_request_id(headers)
+
+    @property
+    def encoder(self) -> ResponseEncoder:
+        return self.settings.get("encoder") or ENCODER
+
+    def setup(self) -> None:
+        super().setup()
+        self.connection.settimeout(self.settings.get("keepalive_timeout", KEEPALIVE_TIMEOUT))
+        self.requests_left = self.settings.get("keepalive_requests", KEEPALIVE_REQUESTS)
+        self.kept_alive = False
+
+    def handle_one_request(self) -> None:
+        """
+        After the first request the connection waits idle for the next one, registered with servers that reclaim
+        idle connections
+        """
+        enter_idle = getattr(self.server, "enter_idle", None)
+        if not self.kept_alive or enter_idle is None:
+            self.kept_alive = True
+            super().handle_one_request()
+        elif enter_idle(self.connection):
+            try:
+                super().handle_one_request()
+            finally:
+                self.server.leave_idle(self.connection)  # type: ignore[attr-defined]
+        else:
+            self.close_connection = True
+
+    def parse_request(self) -> bool:
+        # The request line is in, the connection is busy again
+        if self.kept_alive and hasattr(self.server, "leave_idle"):
+            self.server.leave_idle(self.connection)
+        return super().parse_request()
+
+    def read_body(self, limit: int) -> bytes:
+        """
+        Reads the Content-Length or chunked body, at most ``limit`` bytes. The connection can not be reused when that
+        fails, a body over the limit is left unread.
+        """
+        try:
+            if chunked(self.headers):
+                return read_chunked(self.rfile, limit)
+            length = content_length(self.headers, limit)
+            data = self.rfile.read(length)
+            if len(data) < length:
+                raise ValueError("Truncated body")
+            return data
+        except Exception:
+            self.close_connection = True
+            raise
+
+    def handle_expect_100(self) -> bool:
+        """
+        Refuses a body over the limit before the client sends it
+        """
+        try:
+            if not chunked(self.headers) and "Content-Length" in self.headers:
+                content_length(self.headers, body_limit(self.settings, self.path.strip("/")))
+        except BodyTooLarge:
+            self.requests_left -= 1
+            self.close_connection = True
+            context = {"request_id": self.get_request_id(self.headers), "code": PAYLOAD_TOO_LARGE}
+            body = self.encoder.encode({}, PAYLOAD_TOO_LARGE)
+            self.send_body(PAYLOAD_TOO_LARGE, body)
+            (self.settings.get("metrics") or METRICS).observe_request(context, 0.0)
+            (self.settings.get("request_log") or REQUEST_LOG).log(self.path, None, body, context)
+            return False
+        except ValueError:
+            pass
+        return super().handle_expect_100()
 
     def do_POST(self) -> None:
+        self.requests_left -= 1
+        metrics = self.settings.get("metrics") or METRICS
+        context: dict[str, Any] = {"request_id": self.get_request_id(self.headers)}
+        timings = Timings()
+        reset = TIMINGS.set(timings)
+        started = time.perf_counter()
+        metrics.in_flight.inc()
+        try:
+            code, body, data_string = self.route(context)
+            written = time.perf_counter()
+            if isinstance(body, InterestsStream):
+                self.send_stream(code, body, context)
+                body = body.head
+            else:
+                self.send_body(code, body)
+            timings.add("write", time.perf_counter() - written)
+        finally:
+            TIMINGS.reset(reset)
+            metrics.in_flight.dec()
+        context["timings"] = timings.fields()
+        metrics.observe_request(context, time.perf_counter() - started)
+        (self.settings.get("request_log") or REQUEST_LOG).log(self.path, data_string, body, context)
+
+    def do_GET(self) -> None:
+        self.requests_left -= 1
+        path, _, query = self.path.partition("?")
+        profiler = self.settings.get("profiler")
+        if path == "/metrics":
+            self.send_body(OK, (self.settings.get("metrics") or METRICS).render().encode("utf-8"), METRICS_CONTENT_TYPE)
+        elif path == PROFILE_PATH and profiler is not None:
+            if profiler.authorized(self.headers):
+                self.send_body(OK, profiler.report(report_method(query)).encode("utf-8"), REPORT_CONTENT_TYPE)
+            else:
+                self.send_body(FORBIDDEN, self.encoder.encode({}, FORBIDDEN))
+        else:
+            self.send_body(NOT_FOUND, self.encoder.encode({}, NOT_FOUND))
+
+    def route(self, context: dict[str, Any]) -> tuple[int, bytes | InterestsStream, bytes | None]:
+        """
+        Reads the body and routes the request, returns the code, the encoded envelope (or the stream that encodes it)
+        and the raw request body
+        """
         response, code = {}, OK
-        context = {"request_id": self.get_request_id(self.headers)}
         request = None
         data_string: bytes | None = None
+        path = self.path.strip("/")
+        started = time.perf_counter()
         try:
-            data_string = self.rfile.read(int(self.headers["Content-Length"]))
+            data_string = self.read_body(body_limit(self.settings, path))
+            read = time.perf_counter()
+            record("read", read - started)
             request = json.loads(data_string)
+            record("parse", time.perf_counter() - read)
+        except BodyTooLarge:
+            code = PAYLOAD_TOO_LARGE
         except Exception:
             code = BAD_REQUEST
 
         if request:
-            path = self.path.strip("/")
-            logging.info("{}: {} {}".format(self.path, data_string, context["request_id"]))
             if path in self.router:
+                call = functools.partial(self.router[path], {"body": request, "headers": self.headers}, context, self.settings)
+                profiler = self.settings.get("profiler")
                 try:
-                    response, code = self.router[path](
-                        {"body": request, "headers": self.headers},
-                        context,
-                    )
+                    response, code = call() if profiler is None else profiler.run(self.headers, context, call)
                 except Exception as e:
                     logging.exception("Unexpected error: %s" % e)
                     code = INTERNAL_ERROR
             else:
                 code = NOT_FOUND
 
-        self.send_response(code)
-        self.send_header("Content-Type", "application/json")
-        self.end_headers()
-        if code not in ERRORS:
-            r = {"response": response, "code": code}
-        else:
-            r = {"error": response or ERRORS.get(code, "Unknown Error"), "code": code}
-        context.update(r)
-        logging.info(context)
-        self.wfile.write(json.dumps(r).encode("utf-8"))
+        context["code"] = code
+        if isinstance(response, InterestsStream):
+            return code, response, data_string
+        started = time.perf_counter()
+        body = self.encoder.encode(response, code)
+        record("encode", time.perf_counter() - started)
+        return code, body, data_string
+
+    def send_stream(self, code: int, stream: InterestsStream, context: dict[str, Any]) -> None:
+        """
+        Writes the envelope with chunked transfer encoding as the pieces come from the store, buffered for HTTP/1.0.
+
+        A store error after the first chunk can only cut the response short: the body ends without the last chunk and
+        the connection is closed.
+        """
+        if self.request_version == "HTTP/1.0":
+            try:
+                body = b"".join(stream.encode())
+            except STORE_ERRORS:
+                code, body = INTERNAL_ERROR, self.encoder.encode(STORE_ERROR, INTERNAL_ERROR)
+                context["code"] = code
+            self.send_body(code, body)
+            return
+
+        # The head goes out with the first chunk
+        pending = response_head(code, "application/json", None, self.connection_header(), server_timing(self.settings.get("server_timing", False)))
+        try:
+            for piece in stream.encode():
+                self.wfile.write(pending + b"%x\r\n%s\r\n" % (len(piece), piece))
+                pending = b""
+        except STORE_ERRORS as e:
+            logging.error("Interests stream aborted after %s chunks: %s" % (stream.chunks, e))
+            context["code"] = INTERNAL_ERROR
+            self.close_connection = True
+            return
+        finally:
+            context["stream_chunks"] = stream.chunks
+        self.wfile.write(pending + b"0\r\n\r\n")
+
+    def send_body(self, code: int, body: bytes, content_type: str = "application/json") -> None:
+        """
+        Status line, headers and body in a single write
+        """
+        head = response_head(code, content_type, len(body), self.connection_header(), server_timing(self.settings.get("server_timing", False)))
+        self.wfile.write(head + body)
+
+    def log_request(self, code: int | str = "-", size: int | str = "-") -> None:
+        # Requests are logged once by the request log, after the response is written
+        pass
+
+    def log_message(self, format: str, *args: Any) -> None:
+        logging.warning("%s - %s", self.address_string(), format % args)
+
+    def connection_header(self) -> str | None:
+        if self.requests_left <= 0 or getattr(self.server, "draining", False):
+            self.close_connection = True
+        if self.close_connection:
+            return "close"
+        if self.request_version == "HTTP/1.0":
+            return "keep-alive"
+        return None
@@ -0,0 +1,87 @@
+import asyncio
+from email.message import Message
+from io import BufferedIOBase
+from typing import Any
+
+MAX_BODY_SIZE = 8 * 1024 * 1024
+MAX_CHUNK_LINE = 1024
+
+
+class BodyTooLarge(ValueError):
+    """
+    The request body is over the limit of its route, the rest of it is left unread
+    """
+
+
+def body_limit(settings: dict[str, Any], route: str) -> int:
+    """
+    Largest body accepted on ``route``: its ``body_limits`` entry, else ``max_body_size``
+    """
+    limit = (settings.get("body_limits") or {}).get(route)
+    if limit is None:
+        limit = settings.get("max_body_size")
+    return MAX_BODY_SIZE if limit is None else int(limit)
+
+
+def chunked(headers: Message) -> bool:
+    encoding = headers.get("Transfer-Encoding")
+    if encoding is None:
+        return False
+    if encoding.strip().lower() != "chunked":
+        raise ValueError("Unsupported Transfer-Encoding")
+    return True
+
+
+def content_length(headers: Message, limit: int) -> int:
+    """
+    Declared body size, checked against ``limit`` before anything is read
+    """
+    length = int(headers["Content-Length"])
+    if length < 0:
+        raise ValueError("Negative Content-Length")
+    if length > limit:
+        raise BodyTooLarge("Content-Length %d is over the limit of %d bytes" % (length, limit))
+    return length
+
+
+def chunk_size(line: bytes, total: int, limit: int) -> int:
+    if not line.endswith(b"\n"):
+        raise ValueError("Truncated chunk size")
+    size = int(line.split(b";", 1)[0], 16)
+    if size < 0:
+        raise ValueError("Negative chunk size")
+    if total + size > limit:
+        raise BodyTooLarge("Chunked body is over the limit of %d bytes" % limit)
+    return size
+
+
+def read_chunked(rfile: BufferedIOBase, limit: int) -> bytes:
+    """
+    Body sent with Transfer-Encoding: chunked, rejected as soon as the chunks add up to more than ``limit``
+    """
+    parts = []
+    total = 0
+    while size := chunk_size(rfile.readline(MAX_CHUNK_LINE), total, limit):
+        data = rfile.read(size + 2)
+        if len(data) < size + 2 or not data.endswith(b"\r\n"):
+            raise ValueError("Truncated chunk")
+        parts.append(data[:-2])
+        total += size
+    # Trailer fields are not used
+    while rfile.readline(MAX_CHUNK_LINE) not in (b"\r\n", b"\n", b""):
+        pass
+    return b"".join(parts)
+
+
+async def async_read_chunked(reader: asyncio.StreamReader, limit: int) -> bytes:
+    parts = []
+    total = 0
+    while size := chunk_size(await reader.readline(), total, limit):
+        data = await reader.readexactly(size + 2)
+        if not data.endswith(b"\r\n"):
+            raise ValueError("Truncated chunk")
+        parts.append(data[:-2])
+        total += size
+    while await reader.readline() not in (b"\r\n", b"\n", b""):
+        pass
+    return b"".join(parts)
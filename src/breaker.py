@@ -0,0 +1,104 @@
+import logging
+import threading
+import time
+from typing import Any, Callable
+
+from redis.exceptions import ConnectionError
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(ConnectionError):
+    """
+    Raised instead of making a call while the circuit is open, handled like any store connection error
+    """
+
+
+class CircuitBreaker:
+    """
+    Stops calling a failing dependency for a while.
+
+    ``failure_threshold`` consecutive failures open the circuit and calls are rejected without being made. After
+    ``reset_timeout`` seconds up to ``probes`` calls go through (half-open): that many successes close the circuit,
+    any failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 10, probes: int = 1, name: str = "store") -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.probes = probes
+        self.name = name
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probes_in_flight = 0
+        self.probe_successes = 0
+        self.rejected = 0
+        self.transitions: dict[str, int] = {}
+        self.listeners: list[Callable[[str, str], None]] = []
+        self._lock = threading.Lock()
+
+    def transition(self, state: str) -> None:
+        previous, self.state = self.state, state
+        key = "%s->%s" % (previous, state)
+        self.transitions[key] = self.transitions.get(key, 0) + 1
+        if state == OPEN:
+            self.opened_at = time.monotonic()
+        if state != CLOSED:
+            self.probes_in_flight = 0
+            self.probe_successes = 0
+        self.failures = 0
+        logging.warning("Circuit %s: %s -> %s" % (self.name, previous, state))
+        for listener in self.listeners:
+            listener(previous, state)
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.transition(HALF_OPEN)
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and self.probes_in_flight < self.probes:
+                self.probes_in_flight += 1
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.state == CLOSED:
+                self.failures = 0
+            elif self.state == HALF_OPEN:
+                self.probes_in_flight = max(0, self.probes_in_flight - 1)
+                self.probe_successes += 1
+                if self.probe_successes >= self.probes:
+                    self.transition(CLOSED)
+
+    def release(self) -> None:
+        """
+        Gives back a half-open probe slot without an outcome, for a call that was cancelled
+        """
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self.probes_in_flight = max(0, self.probes_in_flight - 1)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            if self.state == CLOSED:
+                self.failures += 1
+                if self.failures >= self.failure_threshold:
+                    self.transition(OPEN)
+            elif self.state == HALF_OPEN:
+                self.transition(OPEN)
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "state": STATE_VALUES[self.state],
+                "consecutive_failures": self.failures,
+                "rejected": self.rejected,
+                **{"transitions_" + key.replace("->", "_to_"): count for key, count in self.transitions.items()},
+            }
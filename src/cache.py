@@ -0,0 +1,405 @@
+import asyncio
+import contextvars
+import functools
+import inspect
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+
+from src.scoring import AsyncStore, Store
+
+DROP_OLDEST = "drop-oldest"
+BLOCK = "block"
+
+
+class LocalCache:
+    """
+    Thread-safe in-process cache bounded by entry count (LRU eviction) and per-entry TTL
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = 60) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> str | None:
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            expires, value = item
+            if expires <= now:
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: Any, ttl: float | None = None) -> None:
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            return
+        expires = time.monotonic() + ttl
+        with self._lock:
+            self._data[key] = (expires, str(value))
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+class CachedStore:
+    """
+    Serves cache_get from a LocalCache in front of ``store`` and writes cache_set through to both.
+
+    Entries written here never outlive the TTL given to cache_set. Values read through from the store have
+    unknown remaining TTL, so they are kept for at most ``ttl`` seconds of the local cache.
+    """
+
+    def __init__(self, store: Store, max_size: int = 10000, ttl: float = 60) -> None:
+        self.store = store
+        self.local = LocalCache(max_size, ttl)
+
+    def cache_get(self, key: str) -> str | None:
+        value = self.local.get(key)
+        if value is not None:
+            return value
+        value = self.store.cache_get(key)
+        if value is not None:
+            self.local.set(key, value)
+        return value
+
+    def cache_set(self, key: str, value: Any, expired: int) -> None:
+        self.local.set(key, value, expired)
+        self.store.cache_set(key, value, expired)
+
+    def get(self, key: str) -> str | None:
+        return self.store.get(key)
+
+    def get_many(self, keys: list[str]) -> list[str | None]:
+        return self.store.get_many(keys)
+
+    def cache_get_many(self, keys: list[str]) -> list[str | None]:
+        values = [self.local.get(key) for key in keys]
+        missing = [key for key, value in zip(keys, values) if value is None]
+        if missing:
+            found = dict(zip(missing, self.store.cache_get_many(missing)))
+            values = [found.get(key) if value is None else value for key, value in zip(keys, values)]
+            for key in missing:
+                if found[key] is not None:
+                    self.local.set(key, found[key])
+        return values
+
+    def cache_set_many(self, items: dict[str, Any], expired: int) -> None:
+        for key, value in items.items():
+            self.local.set(key, value, expired)
+        self.store.cache_set_many(items, expired)
+
+    def close(self) -> None:
+        if hasattr(self.store, "close"):
+            self.store.close()
+
+
+class AsyncCachedStore:
+    def __init__(self, store: AsyncStore, max_size: int = 10000, ttl: float = 60) -> None:
+        self.store = store
+        self.local = LocalCache(max_size, ttl)
+
+    async def cache_get(self, key: str) -> str | None:
+        value = self.local.get(key)
+        if value is not None:
+            return value
+        value = await self.store.cache_get(key)
+        if value is not None:
+            self.local.set(key, value)
+        return value
+
+    async def cache_set(self, key: str, value: Any, expired: int) -> None:
+        self.local.set(key, value, expired)
+        await self.store.cache_set(key, value, expired)
+
+    async def get(self, key: str) -> str | None:
+        return await self.store.get(key)
+
+    async def get_many(self, keys: list[str]) -> list[str | None]:
+        return await self.store.get_many(keys)
+
+    async def cache_get_many(self, keys: list[str]) -> list[str | None]:
+        values = [self.local.get(key) for key in keys]
+        missing = [key for key, value in zip(keys, values) if value is None]
+        if missing:
+            found = dict(zip(missing, await self.store.cache_get_many(missing)))
+            values = [found.get(key) if value is None else value for key, value in zip(keys, values)]
+            for key in missing:
+                if found[key] is not None:
+                    self.local.set(key, found[key])
+        return values
+
+    async def cache_set_many(self, items: dict[str, Any], expired: int) -> None:
+        for key, value in items.items():
+            self.local.set(key, value, expired)
+        await self.store.cache_set_many(items, expired)
+
+    async def close(self) -> None:
+        if hasattr(self.store, "close"):
+            closed = self.store.close()
+            if inspect.isawaitable(closed):
+                await closed
+
+
+def take_batch(pending: OrderedDict[str, tuple[str, int]], size: int) -> dict[int, dict[str, str]]:
+    """
+    Removes up to ``size`` of the oldest queued writes, grouped by TTL for cache_set_many
+    """
+    batch: dict[int, dict[str, str]] = {}
+    for _ in range(min(size, len(pending))):
+        key, (value, expired) = pending.popitem(last=False)
+        batch.setdefault(expired, {})[key] = value
+    return batch
+
+
+class WriteBehind:
+    """
+    Queue of cache writes shared by the write-behind stores.
+
+    A key written again before it is flushed keeps a single entry with the latest value. When ``max_queue`` keys are
+    waiting, ``policy`` either drops the oldest write (the value is recomputed on the next miss) or blocks the writer.
+    The batch being flushed stays readable in ``writing`` until the store has it.
+    """
+
+    def __init__(self, max_queue: int = 10000, batch_size: int = 500, policy: str = DROP_OLDEST) -> None:
+        if policy not in (DROP_OLDEST, BLOCK):
+            raise ValueError("Unknown write-behind policy %r" % policy)
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.policy = policy
+        self.pending: OrderedDict[str, tuple[str, int]] = OrderedDict()
+        self.writing: dict[str, str] = {}
+        self.closed = False
+        self.written = 0
+        self.dropped = 0
+        self.flushes = 0
+        self.errors = 0
+
+    def full(self) -> bool:
+        return len(self.pending) >= self.max_queue and not self.closed
+
+    def has_room(self, key: str) -> bool:
+        """
+        Whether a blocked write of ``key`` can go ahead: it replaces a queued value or the queue is not full
+        """
+        return key in self.pending or not self.full()
+
+    def put(self, key: str, value: Any, expired: int) -> None:
+        if key not in self.pending and len(self.pending) >= self.max_queue:
+            self.pending.popitem(last=False)
+            self.dropped += 1
+        self.pending[key] = (str(value), expired)
+        self.pending.move_to_end(key)
+
+    def take(self) -> dict[int, dict[str, str]]:
+        batch = take_batch(self.pending, self.batch_size)
+        self.writing = {key: value for items in batch.values() for key, value in items.items()}
+        return batch
+
+    def flushed(self, written: int, errors: int) -> None:
+        self.writing = {}
+        self.written += written
+        self.errors += errors
+        self.flushes += 1
+
+    def get(self, key: str) -> str | None:
+        """
+        Value queued or being flushed for ``key``, None when the store is up to date
+        """
+        if key in self.pending:
+            return self.pending[key][0]
+        return self.writing.get(key)
+
+    def lookup(self, keys: list[str], values: list[str | None]) -> list[str | None]:
+        """
+        Values still waiting to be written take precedence over what the store returned
+        """
+        return [value if (queued := self.get(key)) is None else queued for key, value in zip(keys, values)]
+
+    def stats(self) -> dict[str, Any]:
+        return {"queued": len(self.pending), "written": self.written, "dropped": self.dropped, "flushes": self.flushes, "errors": self.errors}
+
+
+class WriteBehindStore:
+    """
+    Returns from cache_set/cache_set_many right away, a background thread writes the queued values to ``store`` in
+    cache_set_many batches (one pipelined round trip each). close() writes what is left before closing ``store``.
+    """
+
+    def __init__(self, store: Store, max_queue: int = 10000, batch_size: int = 500, policy: str = DROP_OLDEST) -> None:
+        self.store = store
+        self.queue = WriteBehind(max_queue, batch_size, policy)
+        self._changed = threading.Condition()
+        self._thread: threading.Thread | None = None
+
+    def cache_get(self, key: str) -> str | None:
+        with self._changed:
+            queued = self.queue.get(key)
+        return self.store.cache_get(key) if queued is None else queued
+
+    def cache_set(self, key: str, value: Any, expired: int) -> None:
+        self.cache_set_many({key: value}, expired)
+
+    def get(self, key: str) -> str | None:
+        return self.store.get(key)
+
+    def get_many(self, keys: list[str]) -> list[str | None]:
+        return self.store.get_many(keys)
+
+    def cache_get_many(self, keys: list[str]) -> list[str | None]:
+        values = self.store.cache_get_many(keys)
+        with self._changed:
+            return self.queue.lookup(keys, values)
+
+    def cache_set_many(self, items: dict[str, Any], expired: int) -> None:
+        with self._changed:
+            if self.queue.closed:
+                self.store.cache_set_many(items, expired)
+                return
+            if self._thread is None:
+                self._thread = threading.Thread(target=self.flusher, name="write-behind", daemon=True)
+                self._thread.start()
+            for key, value in items.items():
+                if self.queue.policy == BLOCK:
+                    self._changed.wait_for(functools.partial(self.queue.has_room, key))
+                self.queue.put(key, value, expired)
+                self._changed.notify_all()
+
+    def flusher(self) -> None:
+        while True:
+            with self._changed:
+                self._changed.wait_for(lambda: self.queue.pending or self.queue.closed)
+                if not self.queue.pending:
+                    return
+                batch = self.queue.take()
+                self._changed.notify_all()
+            written = errors = 0
+            for expired, items in batch.items():
+                try:
+                    self.store.cache_set_many(items, expired)
+                    written += len(items)
+                except Exception:
+                    errors += 1
+                    logging.exception("Write-behind flush of %s keys failed" % len(items))
+            with self._changed:
+                self.queue.flushed(written, errors)
+
+    def stats(self) -> dict[str, Any]:
+        with self._changed:
+            return self.queue.stats()
+
+    def close(self) -> None:
+        with self._changed:
+            self.queue.closed = True
+            self._changed.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+        if hasattr(self.store, "close"):
+            self.store.close()
+
+
+class AsyncWriteBehindStore:
+    """
+    WriteBehindStore for an AsyncStore, the queue is flushed by a task of the running event loop
+    """
+
+    def __init__(self, store: AsyncStore, max_queue: int = 10000, batch_size: int = 500, policy: str = DROP_OLDEST) -> None:
+        self.store = store
+        self.queue = WriteBehind(max_queue, batch_size, policy)
+        self._changed = asyncio.Condition()
+        self._task: asyncio.Task[None] | None = None
+
+    async def cache_get(self, key: str) -> str | None:
+        queued = self.queue.get(key)
+        return await self.store.cache_get(key) if queued is None else queued
+
+    async def cache_set(self, key: str, value: Any, expired: int) -> None:
+        await self.cache_set_many({key: value}, expired)
+
+    async def get(self, key: str) -> str | None:
+        return await self.store.get(key)
+
+    async def get_many(self, keys: list[str]) -> list[str | None]:
+        return await self.store.get_many(keys)
+
+    async def cache_get_many(self, keys: list[str]) -> list[str | None]:
+        return self.queue.lookup(keys, await self.store.cache_get_many(keys))
+
+    async def cache_set_many(self, items: dict[str, Any], expired: int) -> None:
+        if self.queue.closed:
+            await self.store.cache_set_many(items, expired)
+            return
+        if self._task is None:
+            # A fresh context, the flushes are not part of the request that happens to start the flusher
+            self._task = asyncio.create_task(self.flusher(), context=contextvars.Context())
+        async with self._changed:
+            for key, value in items.items():
+                if self.queue.policy == BLOCK:
+                    await self._changed.wait_for(functools.partial(self.queue.has_room, key))
+                self.queue.put(key, value, expired)
+                self._changed.notify_all()
+
+    async def flusher(self) -> None:
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: self.queue.pending or self.queue.closed)
+                if not self.queue.pending:
+                    return
+                batch = self.queue.take()
+                self._changed.notify_all()
+            written = errors = 0
+            for expired, items in batch.items():
+                try:
+                    await self.store.cache_set_many(items, expired)
+                    written += len(items)
+                except Exception:
+                    errors += 1
+                    logging.exception("Write-behind flush of %s keys failed" % len(items))
+            self.queue.flushed(written, errors)
+
+    def stats(self) -> dict[str, Any]:
+        return self.queue.stats()
+
+    async def close(self) -> None:
+        async with self._changed:
+            self.queue.closed = True
+            self._changed.notify_all()
+        if self._task is not None:
+            await self._task
+        if hasattr(self.store, "close"):
+            closed = self.store.close()
+            if inspect.isawaitable(closed):
+                await closed
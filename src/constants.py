@@ -11,6 +11,7 @@ class ErrorMessage(Enum):
     BAD_REQUEST = "Bad Request"
     FORBIDDEN = "Forbidden"
     NOT_FOUND = "Not Found"
+    PAYLOAD_TOO_LARGE = "Payload Too Large"
     INVALID_REQUEST = "Invalid Request"
     INTERNAL_ERROR = "Internal Server Error"
 
@@ -18,11 +19,14 @@ class ErrorMessage(Enum):
 SALT = "Otus"
 ADMIN_LOGIN = "admin"
 ADMIN_SALT = "42"
+ADMIN_SCORE = {"score": 42}
+STORE_ERROR = "Store connection error"
 
 OK = 200
 BAD_REQUEST = 400
 FORBIDDEN = 403
 NOT_FOUND = 404
+PAYLOAD_TOO_LARGE = 413
 INVALID_REQUEST = 422
 INTERNAL_ERROR = 500
 
@@ -30,6 +34,7 @@ ERRORS = {
     400: ErrorMessage.BAD_REQUEST.value,
     403: ErrorMessage.FORBIDDEN.value,
     404: ErrorMessage.NOT_FOUND.value,
+    413: ErrorMessage.PAYLOAD_TOO_LARGE.value,
     422: ErrorMessage.INVALID_REQUEST.value,
     500: ErrorMessage.INTERNAL_ERROR.value,
 }
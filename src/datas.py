@@ -1,4 +1,5 @@
 import datetime
+import functools
 import re
 from abc import ABC, abstractmethod
 from typing import Any
@@ -64,12 +65,52 @@ class PhoneField(CharField):
         return super().validate(value) and len(value) == 11 and value.startswith("7")
 
 
+def strptime_date(value: str) -> datetime.date | None:
+    try:
+        if re.match(r"^\d{2}\.\d{2}\.\d{4}$", value):
+            return datetime.datetime.strptime(value, "%d.%m.%Y").date()
+    except ValueError:
+        pass
+    return None
+
+
+@functools.lru_cache(maxsize=4096)
+def parse_date(value: str) -> datetime.date | None:
+    """
+    Parses DD.MM.YYYY without strptime, returns None for invalid dates.
+
+    Non-ASCII strings are rare and strptime treats some Unicode digits specially, so they take the old path.
+    """
+    if not value.isascii():
+        return strptime_date(value)
+    if len(value) != 10 or value[2] != "." or value[5] != ".":
+        return None
+    day, month, year = value[:2], value[3:5], value[6:]
+    if not (day.isdigit() and month.isdigit() and year.isdigit()):
+        return None
+    try:
+        return datetime.date(int(year), int(month), int(day))
+    except ValueError:
+        return None
+
+
+_birthday_window: tuple[datetime.date, datetime.date] = (datetime.date.min, datetime.date.min)
+
+
+def birthday_window() -> tuple[datetime.date, datetime.date]:
+    """
+    Earliest and latest accepted birthday, recomputed only when the day changes
+    """
+    global _birthday_window
+    today = datetime.date.today()
+    if _birthday_window[1] != today:
+        _birthday_window = (today - datetime.timedelta(days=365 * 70), today)
+    return _birthday_window
+
+
 class DateField(CharField):
     def validate(self, value: Any) -> bool:
-        try:
-            return super().validate(value) and bool(re.match(r"^\d{2}\.\d{2}\.\d{4}$", value)) and bool(datetime.datetime.strptime(value, "%d.%m.%Y"))
-        except ValueError:
-            return False
+        return super().validate(value) and parse_date(value) is not None
 
     def is_empty(self, value: Any) -> bool:
         return value == "" or value is None
@@ -83,9 +124,9 @@ class BirthDayField(DateField):
         if not super().validate(value):
             return False
 
-        date = datetime.datetime.strptime(value, "%d.%m.%Y").date()
-
-        return datetime.date.today() - datetime.timedelta(days=365 * 70) <= date <= datetime.date.today() if not self.is_empty(value) else True
+        date = parse_date(value)
+        earliest, today = birthday_window()
+        return date is not None and earliest <= date <= today
 
 
 class GenderField(FieldDescriptor):
@@ -104,12 +145,79 @@ class ClientIDsField(FieldDescriptor):
         return value == [] or value is None
 
 
-class ClientsInterestsRequest:
+class PeopleField(FieldDescriptor):
+    """
+    List of person records, each is validated as OnlineScoreRequest arguments on its own
+    """
+
+    def validate(self, value: Any) -> bool:
+        return isinstance(value, list) and all(isinstance(i, dict) for i in value)
+
+    def is_empty(self, value: list[dict[str, Any]]) -> bool:
+        return value == [] or value is None
+
+
+class RequestMeta(type):
+    """
+    Gives request classes ``__slots__`` for the private storage of their descriptor fields
+    """
+
+    def __new__(mcs, name: str, bases: tuple[type, ...], namespace: dict[str, Any]) -> "RequestMeta":
+        if "__slots__" not in namespace:
+            namespace["__slots__"] = tuple("_" + key for key, value in namespace.items() if isinstance(value, FieldDescriptor))
+        return super().__new__(mcs, name, bases, namespace)
+
+
+class Request(metaclass=RequestMeta):
+    __slots__ = ()
+
+
+class RequestValidator:
+    """
+    Field table of a request class collected once, validates an arguments dict in a single pass.
+
+    Applies the same checks as ``FieldDescriptor.__set__`` in ``dir()`` order and fills the instance storage
+    directly, so the result matches assigning every field through the descriptors.
+    """
+
+    def __init__(self, cls: type) -> None:
+        self.cls = cls
+        fields: dict[str, FieldDescriptor] = {}
+        for klass in reversed(cls.__mro__):
+            fields.update((name, value) for name, value in vars(klass).items() if isinstance(value, FieldDescriptor))
+        self.fields = tuple((name, f.private_name, f.required, f.nullable, f.validate, f.is_empty) for name, f in sorted(fields.items()))
+
+    def validate(self, arguments: dict[str, Any]) -> tuple[Any, list[str], list[str]]:
+        """
+        Returns the request instance, names of invalid fields and names of the given valid fields
+        """
+        instance = self.cls()
+        errors = []
+        has = []
+        get = arguments.get
+
+        for name, private_name, required, nullable, validate, is_empty in self.fields:
+            value = get(name, None)
+            if required and value is None:
+                errors.append(name)
+                continue
+            empty = is_empty(value)
+            if (not empty and not validate(value)) or (not nullable and empty):
+                errors.append(name)
+                continue
+            setattr(instance, private_name, value)
+            if value is not None:
+                has.append(name)
+
+        return instance, errors, has
+
+
+class ClientsInterestsRequest(Request):
     client_ids = ClientIDsField(required=True)
     date = DateField(required=False, nullable=True)
 
 
-class OnlineScoreRequest:
+class OnlineScoreRequest(Request):
     first_name = CharField(required=False, nullable=True)
     last_name = CharField(required=False, nullable=True)
     email = EmailField(required=False, nullable=True)
@@ -118,7 +226,11 @@ class OnlineScoreRequest:
     gender = GenderField(required=False, nullable=True)
 
 
-class MethodRequest:
+class OnlineScoreBulkRequest(Request):
+    people = PeopleField(required=True)
+
+
+class MethodRequest(Request):
     account = CharField(required=False, nullable=True)
     login = CharField(required=True, nullable=True)
     token = CharField(required=True, nullable=True)
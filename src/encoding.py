@@ -0,0 +1,92 @@
+import email.utils
+import functools
+import json
+import time
+from http import HTTPStatus
+from typing import Any, Callable
+
+from src.constants import ADMIN_SCORE, ERRORS, INTERNAL_ERROR, OK, STORE_ERROR
+
+Dumps = Callable[[Any], str | bytes]
+
+
+def make_envelope(response: Any, code: int) -> dict[str, Any]:
+    if code not in ERRORS:
+        return {"response": response, "code": code}
+    return {"error": response or ERRORS.get(code, "Unknown Error"), "code": code}
+
+
+def orjson_dumps() -> Dumps:
+    """
+    orjson is optional, it is imported only when selected
+    """
+    import orjson
+
+    return functools.partial(orjson.dumps, option=orjson.OPT_NON_STR_KEYS)
+
+
+JSON_ENCODERS: dict[str, Callable[[], Dumps]] = {
+    "json": lambda: json.dumps,
+    "compact": lambda: json.JSONEncoder(separators=(",", ":")).encode,
+    "orjson": orjson_dumps,
+}
+
+
+class ResponseEncoder:
+    """
+    Encodes response envelopes with ``dumps``.
+
+    The fixed replies, error messages and constant responses such as ADMIN_SCORE, are encoded once and served from
+    their bytes. Constant responses are matched by identity, so only long lived objects may be registered.
+    """
+
+    def __init__(self, dumps: Dumps = json.dumps) -> None:
+        self.dumps = dumps
+        self.static: dict[tuple[Any, int], bytes] = {}
+        for code, message in ERRORS.items():
+            self.register(message, code)
+        self.register(STORE_ERROR, INTERNAL_ERROR)
+        self.register(ADMIN_SCORE, OK)
+
+    @staticmethod
+    def key(response: Any, code: int) -> tuple[Any, int]:
+        return (response if isinstance(response, str) else id(response)), code
+
+    def register(self, response: Any, code: int) -> None:
+        self.static[self.key(response, code)] = self.encode_value(make_envelope(response, code))
+
+    def encode_value(self, value: Any) -> bytes:
+        data = self.dumps(value)
+        return data if isinstance(data, bytes) else data.encode("utf-8")
+
+    def encode(self, response: Any, code: int) -> bytes:
+        if not response and code in ERRORS:
+            response = ERRORS[code]
+        static = self.static.get(self.key(response, code))
+        return static if static is not None else self.encode_value(make_envelope(response, code))
+
+
+ENCODER = ResponseEncoder()
+
+
+@functools.lru_cache(maxsize=1)
+def http_date(second: int) -> str:
+    return email.utils.formatdate(second, usegmt=True)
+
+
+@functools.lru_cache(maxsize=64)
+def status_line(code: int) -> str:
+    return "HTTP/1.1 %d %s\r\n" % (code, HTTPStatus(code).phrase)
+
+
+def response_head(code: int, content_type: str, length: int | None, connection: str | None = None, headers: dict[str, str] | None = None) -> bytes:
+    """
+    Status line and headers up to the empty line, a None ``length`` sends the body with chunked transfer encoding
+    """
+    head = status_line(code) + "Date: %s\r\nContent-Type: %s\r\n" % (http_date(int(time.time())), content_type)
+    head += "Transfer-Encoding: chunked\r\n" if length is None else "Content-Length: %d\r\n" % length
+    if connection is not None:
+        head += "Connection: %s\r\n" % connection
+    if headers:
+        head += "".join("%s: %s\r\n" % item for item in headers.items())
+    return head.encode("latin-1") + b"\r\n"
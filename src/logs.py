@@ -0,0 +1,107 @@
+import json
+import logging
+import os
+import queue
+import random
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any
+
+LOG_FORMAT = "[%(asctime)s] %(levelname).1s %(process)d %(message)s"
+LOG_DATE_FORMAT = "%Y.%m.%d %H:%M:%S"
+
+
+class RequestRecord:
+    """
+    Log message for one request, rendered as a single JSON line only when a handler formats it
+    """
+
+    __slots__ = ("path", "body", "response", "context", "body_limit")
+
+    def __init__(self, path: str, body: bytes | None, response: bytes | None, context: dict[str, Any], body_limit: int) -> None:
+        self.path = path
+        self.body = body
+        self.response = response
+        self.context = context
+        self.body_limit = body_limit
+
+    def truncate(self, data: bytes | None) -> str | None:
+        if data is None or self.body_limit <= 0:
+            return None
+        text = data[: self.body_limit].decode("utf-8", errors="replace")
+        if len(data) > self.body_limit:
+            text += "...(+%d bytes)" % (len(data) - self.body_limit)
+        return text
+
+    def __str__(self) -> str:
+        record = {"path": self.path, **self.context}
+        if self.body_limit > 0:
+            record["body"] = self.truncate(self.body)
+            record["response"] = self.truncate(self.response)
+        return json.dumps(record, default=str)
+
+
+class RequestLog:
+    """
+    Logs one record per request: every error response, and a ``sample_rate`` share of the successful ones.
+
+    Request and response bodies are cut to ``body_limit`` bytes, 0 leaves them out.
+    """
+
+    def __init__(self, sample_rate: float = 1.0, body_limit: int = 1024, logger: logging.Logger | None = None) -> None:
+        self.sample_rate = sample_rate
+        self.body_limit = body_limit
+        self.logger = logger or logging.getLogger()
+
+    def sampled(self, code: int) -> bool:
+        return code >= 400 or self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def log(self, path: str, body: bytes | None, response: bytes | None, context: dict[str, Any]) -> None:
+        code = context.get("code", 0)
+        if not self.sampled(code):
+            return
+        level = logging.ERROR if code >= 500 else logging.INFO
+        if self.logger.isEnabledFor(level):
+            self.logger.log(level, "%s", RequestRecord(path, body, response, context, self.body_limit))
+
+
+REQUEST_LOG = RequestLog()
+
+
+class BackgroundHandler(QueueHandler):
+    """
+    Hands records over to a writer thread that formats them and feeds ``handlers``.
+
+    Records are formatted on the writer thread, so logged arguments must not be changed after the logging call.
+    Each forked process gets its own writer thread, closing the handler drains the queue.
+    """
+
+    def __init__(self, *handlers: logging.Handler) -> None:
+        super().__init__(queue.SimpleQueue())
+        self.handlers = handlers
+        self.listener = QueueListener(self.queue, *handlers, respect_handler_level=True)
+        self.listener.start()
+        self.stopped = False
+        os.register_at_fork(after_in_child=self.restart)
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def restart(self) -> None:
+        # The writer thread of the parent does not exist in a forked child
+        if self.stopped:
+            return
+        self.queue = queue.SimpleQueue()
+        self.listener = QueueListener(self.queue, *self.handlers, respect_handler_level=True)
+        self.listener.start()
+
+    def close(self) -> None:
+        self.stopped = True
+        if self.listener is not None:
+            self.listener.stop()
+        super().close()
+
+
+def configure_logging(filename: str | None, background: bool = False) -> None:
+    handler: logging.Handler = logging.FileHandler(filename) if filename else logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(LOG_FORMAT, datefmt=LOG_DATE_FORMAT))
+    logging.basicConfig(level=logging.INFO, handlers=[BackgroundHandler(handler) if background else handler])
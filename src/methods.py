@@ -1,65 +1,100 @@
 import datetime
+import functools
 import hashlib
+import hmac
+import time
 from typing import Any
 
 from src.constants import ADMIN_SALT, SALT
-from src.datas import ClientsInterestsRequest, MethodRequest, OnlineScoreRequest
+from src.datas import ClientsInterestsRequest, MethodRequest, OnlineScoreBulkRequest, OnlineScoreRequest, RequestValidator
+
+
+class HourlyDigest:
+    """
+    Admin token of the current local hour, hashed once per hour instead of on every request
+    """
+
+    def __init__(self, salt: str) -> None:
+        self.salt = salt
+        self._cached: tuple[float, float, bytes] = (0.0, 0.0, b"")
+
+    def get(self, now: float | None = None) -> bytes:
+        now = time.time() if now is None else now
+        start, end, digest = self._cached
+        if start <= now < end:
+            return digest
+
+        moment = datetime.datetime.fromtimestamp(now)
+        hour = moment.replace(minute=0, second=0, microsecond=0)
+        digest = hashlib.sha512((moment.strftime("%Y%m%d%H") + self.salt).encode("utf-8")).hexdigest().encode("utf-8")
+        self._cached = (hour.timestamp(), (hour + datetime.timedelta(hours=1)).timestamp(), digest)
+        return digest
+
+
+ADMIN_DIGEST = HourlyDigest(ADMIN_SALT)
+
+
+@functools.lru_cache(maxsize=4096)
+def user_digest(account: str, login: str) -> bytes:
+    return hashlib.sha512((account + login + SALT).encode("utf-8")).hexdigest().encode("utf-8")
 
 
 def check_auth(request: MethodRequest) -> bool:
     if request.is_admin:
-        digest = hashlib.sha512((datetime.datetime.now().strftime("%Y%m%d%H") + ADMIN_SALT).encode("utf-8")).hexdigest()
+        digest = ADMIN_DIGEST.get()
     else:
-        digest = hashlib.sha512((request.account + request.login + SALT).encode("utf-8")).hexdigest()
+        digest = user_digest(request.account, request.login)
+
+    return hmac.compare_digest(digest, request.token.encode("utf-8"))
+
 
-    return bool(digest == request.token)
+ONLINE_SCORE_VALIDATOR = RequestValidator(OnlineScoreRequest)
+CLIENTS_INTERESTS_VALIDATOR = RequestValidator(ClientsInterestsRequest)
+ONLINE_SCORE_BULK_VALIDATOR = RequestValidator(OnlineScoreBulkRequest)
+
+SCORE_COUPLES = (("phone", "email"), ("birthday", "gender"), ("first_name", "last_name"))
 
 
 def validate_online_score(arguments: dict[str, Any]) -> tuple[OnlineScoreRequest | list[str], list[str]]:
-    score = OnlineScoreRequest()
-
-    errors = []
-    has = []
-
-    for key in dir(OnlineScoreRequest):
-        if not key.startswith("__"):
-            try:
-                value = arguments.get(key, None)
-                setattr(score, key, value)
-                if value is not None:
-                    has.append(key)
-            except ValueError:
-                errors.append(f"Incorrect {key} value")
+    score, errors, has = ONLINE_SCORE_VALIDATOR.validate(arguments)
+
     if len(errors) > 0:
-        return errors, has
+        return [f"Incorrect {key} value" for key in errors], has
+
+    # Without errors every non-null argument is listed in has
+    if any(first in has and second in has for first, second in SCORE_COUPLES):
+        return score, has
     else:
-        phone = arguments.get("phone", None)
-        email = arguments.get("email", None)
-        birthday = arguments.get("birthday", None)
-        gender = arguments.get("gender", None)
-        first_name = arguments.get("first_name", None)
-        last_name = arguments.get("last_name", None)
-
-        if (phone is not None and email is not None) or (birthday is not None and gender is not None) or (first_name is not None and last_name is not None):
-            return score, has
-        else:
-            return ["No couple"], has
+        return ["No couple"], has
 
 
 def validate_clients_interests(arguments: dict[str, Any]) -> tuple[ClientsInterestsRequest | list[str], int]:
-    interests = ClientsInterestsRequest()
-
-    errors = []
     nclients = len(arguments.get("client_ids", []))
 
-    for key in dir(ClientsInterestsRequest):
-        if not key.startswith("__"):
-            try:
-                value = arguments.get(key, None)
-                setattr(interests, key, value)
-            except ValueError:
-                errors.append(f"Incorrect {key} value")
+    interests, errors, _ = CLIENTS_INTERESTS_VALIDATOR.validate(arguments)
     if len(errors) > 0:
-        return errors, nclients
+        return [f"Incorrect {key} value" for key in errors], nclients
     else:
         return interests, nclients
+
+
+def validate_online_score_bulk(arguments: dict[str, Any]) -> tuple[list[OnlineScoreRequest | None], dict[int, str]] | list[str]:
+    """
+    Validates every person record, invalid ones are None with their error message by index.
+
+    Returns the error messages when the ``people`` list itself is invalid.
+    """
+    bulk, errors, _ = ONLINE_SCORE_BULK_VALIDATOR.validate(arguments)
+    if len(errors) > 0:
+        return [f"Incorrect {key} value" for key in errors]
+
+    records: list[OnlineScoreRequest | None] = []
+    invalid = {}
+    for i, record in enumerate(bulk.people):
+        score, _ = validate_online_score(record)
+        if isinstance(score, list):
+            invalid[i] = ", ".join(score)
+            records.append(None)
+        else:
+            records.append(score)
+    return records, invalid
@@ -0,0 +1,265 @@
+import inspect
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Iterable, cast
+
+from src.scoring import AsyncStore, Store
+from src.timing import record, store_span
+
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+ROUTED_METHODS = frozenset(["online_score", "online_score_bulk", "clients_interests", "batch"])
+
+Labels = tuple[str, ...]
+Collector = Callable[[], Iterable[tuple[str, str, dict[str, Any]]]]
+
+
+def format_labels(names: Labels, values: Labels, extra: str = "") -> str:
+    pairs = ['{}="{}"'.format(name, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Labels = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values: dict[Labels, float] = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def get(self, *labels: str) -> float:
+        return self.values.get(labels, 0)
+
+    def collect(self) -> list[str]:
+        with self.lock:
+            values = list(self.values.items())
+        return ["{}{} {}".format(self.name, format_labels(self.labels, labels), value) for labels, value in values]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value: float, *labels: str) -> None:
+        with self.lock:
+            self.values[labels] = value
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram, each series keeps one counter per bucket plus its sum
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Labels = (), buckets: tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self.series: dict[Labels, list[float]] = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        # counts for every bucket and +Inf, then the sum
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [0.0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def count(self, *labels: str) -> int:
+        series = self.series.get(labels)
+        return int(sum(series[:-1])) if series else 0
+
+    def collect(self) -> list[str]:
+        with self.lock:
+            all_series = [(labels, list(series)) for labels, series in self.series.items()]
+        lines = []
+        for labels, series in all_series:
+            total = 0.0
+            for bound, count in zip([*map(str, self.buckets), "+Inf"], series):
+                total += count
+                lines.append("{}_bucket{} {}".format(self.name, format_labels(self.labels, labels, 'le="{}"'.format(bound)), int(total)))
+            lines.append("{}_sum{} {}".format(self.name, format_labels(self.labels, labels), series[-1]))
+            lines.append("{}_count{} {}".format(self.name, format_labels(self.labels, labels), int(total)))
+        return lines
+
+
+class Metrics:
+    """
+    Request, validation, auth and store instruments of one process, rendered in the Prometheus text format.
+
+    Collectors are called on every scrape and return ``(name, help, {label: value})`` gauges, e.g. pool stats.
+    """
+
+    def __init__(self) -> None:
+        self.requests = Counter("api_requests_total", "Requests by method and response code", ("method", "code"))
+        self.latency = Histogram("api_request_duration_seconds", "Request handling time by method", ("method",))
+        self.auth = Histogram("api_auth_duration_seconds", "Method request parsing and token check time")
+        self.validation = Histogram("api_validation_duration_seconds", "Method arguments validation time", ("method",))
+        self.store = Histogram("api_store_duration_seconds", "Store call time by operation", ("op",))
+        self.store_errors = Counter("api_store_errors_total", "Store calls that raised by operation", ("op",))
+        self.score_cache = Counter("api_score_cache_lookups_total", "Score cache lookups in the store by result", ("result",))
+        self.in_flight = Gauge("api_requests_in_flight", "Requests being handled")
+        self.instruments: list[Counter | Histogram] = [
+            self.requests,
+            self.latency,
+            self.auth,
+            self.validation,
+            self.store,
+            self.store_errors,
+            self.score_cache,
+            self.in_flight,
+        ]
+        self.collectors: list[Collector] = []
+
+    def observe_request(self, ctx: dict[str, Any], seconds: float) -> None:
+        method = ctx.get("method")
+        method = method if method in ROUTED_METHODS else "unknown"
+        self.requests.inc(method, str(ctx.get("code", 0)))
+        self.latency.observe(seconds, method)
+        for item in ctx.get("batch", [ctx]):
+            self.observe_validation(item)
+
+    def observe_validation(self, ctx: dict[str, Any]) -> None:
+        if "auth_seconds" in ctx:
+            self.auth.observe(ctx["auth_seconds"])
+        if "validation_seconds" in ctx:
+            self.validation.observe(ctx["validation_seconds"], ctx["method"])
+
+    def observe_store(self, op: str, seconds: float, result: Any = None) -> None:
+        self.store.observe(seconds, op)
+        if op == "cache_get":
+            self.score_cache.inc("miss" if result is None else "hit")
+        elif op == "cache_get_many":
+            hits = sum(value is not None for value in result)
+            self.score_cache.inc("hit", amount=hits)
+            self.score_cache.inc("miss", amount=len(result) - hits)
+
+    def render(self) -> str:
+        lines = []
+        for instrument in self.instruments:
+            lines.append("# HELP {} {}".format(instrument.name, instrument.help))
+            lines.append("# TYPE {} {}".format(instrument.name, instrument.kind))
+            lines.extend(instrument.collect())
+        for collector in self.collectors:
+            for name, help, values in collector():
+                lines.append("# HELP {} {}".format(name, help))
+                lines.append("# TYPE {} gauge".format(name))
+                lines.extend("{}{} {}".format(name, format_labels(("stat",), (stat,)), float(value)) for stat, value in values.items())
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
+
+
+def stats_collector(name: str, help: str, stats: Callable[[], dict[str, Any]]) -> Collector:
+    """
+    Exposes the numeric values of a ``stats()`` dict as one gauge labelled by stat
+    """
+
+    def collect() -> list[tuple[str, str, dict[str, Any]]]:
+        return [(name, help, {stat: value for stat, value in stats().items() if isinstance(value, (int, float))})]
+
+    return collect
+
+
+class InstrumentedStore:
+    """
+    Store wrapper timing every call into ``metrics`` and the timings of the request making it
+    """
+
+    def __init__(self, store: Store, metrics: Metrics) -> None:
+        self.store = store
+        self.metrics = metrics
+
+    def call(self, op: str, *args: Any) -> Any:
+        started = time.perf_counter()
+        try:
+            result = getattr(self.store, op)(*args)
+        except Exception:
+            self.metrics.store_errors.inc(op)
+            raise
+        finally:
+            record(store_span(op, args), time.perf_counter() - started)
+        self.metrics.observe_store(op, time.perf_counter() - started, result)
+        return result
+
+    def cache_get(self, key: str) -> str | None:
+        return cast(str | None, self.call("cache_get", key))
+
+    def cache_set(self, key: str, value: Any, expired: int) -> None:
+        self.call("cache_set", key, value, expired)
+
+    def get(self, key: str) -> str | None:
+        return cast(str | None, self.call("get", key))
+
+    def get_many(self, keys: list[str]) -> list[str | None]:
+        return cast(list[str | None], self.call("get_many", keys))
+
+    def cache_get_many(self, keys: list[str]) -> list[str | None]:
+        return cast(list[str | None], self.call("cache_get_many", keys))
+
+    def cache_set_many(self, items: dict[str, Any], expired: int) -> None:
+        self.call("cache_set_many", items, expired)
+
+    def close(self) -> None:
+        if hasattr(self.store, "close"):
+            self.store.close()
+
+
+class AsyncInstrumentedStore:
+    def __init__(self, store: AsyncStore, metrics: Metrics) -> None:
+        self.store = store
+        self.metrics = metrics
+
+    async def call(self, op: str, *args: Any) -> Any:
+        started = time.perf_counter()
+        try:
+            result = await getattr(self.store, op)(*args)
+        except Exception:
+            self.metrics.store_errors.inc(op)
+            raise
+        finally:
+            record(store_span(op, args), time.perf_counter() - started)
+        self.metrics.observe_store(op, time.perf_counter() - started, result)
+        return result
+
+    async def cache_get(self, key: str) -> str | None:
+        return cast(str | None, await self.call("cache_get", key))
+
+    async def cache_set(self, key: str, value: Any, expired: int) -> None:
+        await self.call("cache_set", key, value, expired)
+
+    async def get(self, key: str) -> str | None:
+        return cast(str | None, await self.call("get", key))
+
+    async def get_many(self, keys: list[str]) -> list[str | None]:
+        return cast(list[str | None], await self.call("get_many", keys))
+
+    async def cache_get_many(self, keys: list[str]) -> list[str | None]:
+        return cast(list[str | None], await self.call("cache_get_many", keys))
+
+    async def cache_set_many(self, items: dict[str, Any], expired: int) -> None:
+        await self.call("cache_set_many", items, expired)
+
+    async def close(self) -> None:
+        if hasattr(self.store, "close"):
+            closed = self.store.close()
+            if inspect.isawaitable(closed):
+                await closed
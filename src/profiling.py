@@ -0,0 +1,127 @@
+import cProfile
+import hmac
+import io
+import os
+import pstats
+import random
+import threading
+from typing import Any, Awaitable, Callable, Mapping, TypeVar
+from urllib.parse import parse_qs
+
+from src.metrics import ROUTED_METHODS
+
+PROFILE_HEADER = "X-Profile-Token"
+PROFILE_PATH = "/debug/profile"
+REPORT_CONTENT_TYPE = "text/plain; charset=utf-8"
+
+T = TypeVar("T")
+
+
+class RequestProfiler:
+    """
+    Runs the route handler under cProfile for a ``sample_rate`` share of the requests, and for every request whose
+    X-Profile-Token header matches ``token``, and adds the stats up per method.
+
+    cProfile can only be enabled once per process, so one request is profiled at a time and a request picked meanwhile
+    runs unprofiled. Other threads (or tasks, in async mode) running while a request is profiled show up in its stats.
+    """
+
+    def __init__(self, sample_rate: float = 0.0, token: str | None = None, directory: str | None = None, top: int = 30) -> None:
+        self.sample_rate = sample_rate
+        self.token = token
+        self.directory = directory
+        self.top = top
+        self.profiles: dict[str, pstats.Stats] = {}
+        self.requests: dict[str, int] = {}
+        self.skipped = 0
+        self._busy = threading.Lock()
+        self._lock = threading.Lock()
+
+    def authorized(self, headers: Mapping[str, Any]) -> bool:
+        value = headers.get(PROFILE_HEADER)
+        return self.token is not None and value is not None and hmac.compare_digest(value.encode("utf-8"), self.token.encode("utf-8"))
+
+    def wanted(self, headers: Mapping[str, Any]) -> bool:
+        return self.authorized(headers) or (self.sample_rate > 0 and random.random() < self.sample_rate)
+
+    def start(self) -> cProfile.Profile | None:
+        if self._busy.acquire(blocking=False):
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+                return profile
+            except ValueError:
+                # Another profiler is active in this process
+                self._busy.release()
+        with self._lock:
+            self.skipped += 1
+        return None
+
+    def stop(self, profile: cProfile.Profile, ctx: dict[str, Any]) -> None:
+        profile.disable()
+        self._busy.release()
+        method = ctx.get("method")
+        method = method if method in ROUTED_METHODS else "unknown"
+        with self._lock:
+            if method in self.profiles:
+                self.profiles[method].add(profile)
+            else:
+                self.profiles[method] = pstats.Stats(profile)
+            self.requests[method] = self.requests.get(method, 0) + 1
+
+    def run(self, headers: Mapping[str, Any], ctx: dict[str, Any], func: Callable[[], T]) -> T:
+        profile = self.start() if self.wanted(headers) else None
+        if profile is None:
+            return func()
+        try:
+            return func()
+        finally:
+            self.stop(profile, ctx)
+
+    async def async_run(self, headers: Mapping[str, Any], ctx: dict[str, Any], func: Callable[[], Awaitable[T]]) -> T:
+        profile = self.start() if self.wanted(headers) else None
+        if profile is None:
+            return await func()
+        try:
+            return await func()
+        finally:
+            self.stop(profile, ctx)
+
+    def report(self, method: str | None = None) -> str:
+        """
+        The ``top`` functions by cumulative time of each method, or of ``method`` only
+        """
+        out = io.StringIO()
+        with self._lock:
+            for name, stats in sorted(self.profiles.items()):
+                if method is None or name == method:
+                    out.write("%s: %d requests\n" % (name, self.requests[name]))
+                    pstats.Stats(stream=out).add(stats).sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self.top)
+        return out.getvalue()
+
+    def dump(self, directory: str) -> list[str]:
+        """
+        Writes the stats of each method to ``<method>.<pid>.prof``, a file pstats and snakeviz read
+        """
+        os.makedirs(directory, exist_ok=True)
+        paths = []
+        with self._lock:
+            for name, stats in self.profiles.items():
+                paths.append(os.path.join(directory, "%s.%d.prof" % (name, os.getpid())))
+                stats.dump_stats(paths[-1])
+        return paths
+
+    def close(self) -> None:
+        if self.directory:
+            self.dump(self.directory)
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {"profiled": sum(self.requests.values()), "skipped": self.skipped}
+
+
+def report_method(query: str) -> str | None:
+    """
+    The ``method`` parameter of a report query string, None reports every method
+    """
+    return parse_qs(query).get("method", [None])[0]
@@ -1,7 +1,10 @@
+import functools
 import hashlib
 import json
-from datetime import datetime
-from typing import Any, Optional, Protocol
+import logging
+from typing import Any, AsyncIterator, Iterator, Optional, Protocol
+
+from src.flight import AsyncSingleFlight, SingleFlight
 
 
 class Store(Protocol):
@@ -14,26 +17,58 @@ class Store(Protocol):
     def get(self, key: str) -> str | None:
         pass
 
+    def get_many(self, keys: list[str]) -> list[str | None]:
+        pass
 
-def get_score(
-    store: Store,
+    def cache_get_many(self, keys: list[str]) -> list[str | None]:
+        pass
+
+    def cache_set_many(self, items: dict[str, Any], expired: int) -> None:
+        pass
+
+
+class AsyncStore(Protocol):
+    async def cache_get(self, key: str) -> str | None:
+        pass
+
+    async def cache_set(self, key: str, value: Any, expired: int) -> None:
+        pass
+
+    async def get(self, key: str) -> str | None:
+        pass
+
+    async def get_many(self, keys: list[str]) -> list[str | None]:
+        pass
+
+    async def cache_get_many(self, keys: list[str]) -> list[str | None]:
+        pass
+
+    async def cache_set_many(self, items: dict[str, Any], expired: int) -> None:
+        pass
+
+
+SCORE_TTL = 60 * 60
+
+
+def score_key(
     phone: Optional[str] = None,
-    email: Optional[str] = None,
     birthday: Optional[str] = None,
-    gender: Optional[int] = None,
     first_name: Optional[str] = None,
     last_name: Optional[str] = None,
-) -> float:
+) -> str:
     key_parts = [first_name or "", last_name or "", phone or "", birthday or ""]
-    key = "uid:" + hashlib.md5("".join(key_parts).encode("utf-8")).hexdigest()
+    return "uid:" + hashlib.md5("".join(key_parts).encode("utf-8")).hexdigest()
 
-    # Try to get from cache
-    score: str = store.cache_get(key)
-    if score is not None:
-        return float(score)
 
-    # Calculate score
-    score: float = 0.0
+def compute_score(
+    phone: Optional[str] = None,
+    email: Optional[str] = None,
+    birthday: Optional[str] = None,
+    gender: Optional[int] = None,
+    first_name: Optional[str] = None,
+    last_name: Optional[str] = None,
+) -> float:
+    score = 0.0
     if phone:
         score += 1.5
     if email:
@@ -42,12 +77,172 @@ def get_score(
         score += 1.5
     if first_name and last_name:
         score += 0.5
+    return score
+
+
+def fill_score(store: Store, key: str, **person: Any) -> float:
+    """
+    Score cached under ``key``, computed and cached on a miss
+    """
+    # Try to get from cache
+    cached = store.cache_get(key)
+    if cached is not None:
+        return float(cached)
+
+    score = compute_score(**person)
 
     # Cache the score for 60 minutes
-    store.cache_set(key, score, 60 * 60)
+    store.cache_set(key, score, SCORE_TTL)
     return score
 
 
-def get_interests(store: Store, cid: str) -> list:
+def get_score(
+    store: Store,
+    phone: Optional[str] = None,
+    email: Optional[str] = None,
+    birthday: Optional[str] = None,
+    gender: Optional[int] = None,
+    first_name: Optional[str] = None,
+    last_name: Optional[str] = None,
+    flight: SingleFlight | None = None,
+) -> float:
+    """
+    With ``flight`` concurrent callers of the same cache key share one cache lookup and fill
+    """
+    key = score_key(phone, birthday, first_name, last_name)
+    fill = functools.partial(fill_score, store, key, phone=phone, email=email, birthday=birthday, gender=gender, first_name=first_name, last_name=last_name)
+    return fill() if flight is None else flight.do(key, fill)
+
+
+async def async_fill_score(store: AsyncStore, key: str, **person: Any) -> float:
+    cached = await store.cache_get(key)
+    if cached is not None:
+        return float(cached)
+
+    score = compute_score(**person)
+
+    await store.cache_set(key, score, SCORE_TTL)
+    return score
+
+
+async def async_get_score(
+    store: AsyncStore,
+    phone: Optional[str] = None,
+    email: Optional[str] = None,
+    birthday: Optional[str] = None,
+    gender: Optional[int] = None,
+    first_name: Optional[str] = None,
+    last_name: Optional[str] = None,
+    flight: AsyncSingleFlight | None = None,
+) -> float:
+    key = score_key(phone, birthday, first_name, last_name)
+    fill = functools.partial(async_fill_score, store, key, phone=phone, email=email, birthday=birthday, gender=gender, first_name=first_name, last_name=last_name)
+    return await (fill() if flight is None else flight.do(key, fill))
+
+
+def person_keys(people: list[dict[str, Any]]) -> list[str | None]:
+    """
+    Cache key of each person, None for a record its key cannot be built from, so it does not fail the others
+    """
+    keys: list[str | None] = []
+    for person in people:
+        try:
+            keys.append(score_key(person.get("phone"), person.get("birthday"), person.get("first_name"), person.get("last_name")))
+        except Exception:
+            logging.exception("Cannot build the score key of a person")
+            keys.append(None)
+    return keys
+
+
+def score_people(people: list[dict[str, Any]], keys: list[str | None], cached: dict[str, str | None]) -> tuple[list[float | None], dict[str, float]]:
+    """
+    Scores people in order from cached values, computes the misses and returns the new values to cache. People
+    without a key are scored None.
+
+    A key repeated in the batch reuses the first computed score, as sequential get_score calls would.
+    """
+    scores: list[float | None] = []
+    fresh: dict[str, float] = {}
+    for person, key in zip(people, keys):
+        if key is None:
+            scores.append(None)
+            continue
+        value = cached.get(key)
+        if value is not None:
+            scores.append(float(value))
+        elif key in fresh:
+            scores.append(fresh[key])
+        else:
+            fresh[key] = compute_score(**person)
+            scores.append(fresh[key])
+    return scores, fresh
+
+
+def get_scores(store: Store, people: list[dict[str, Any]]) -> list[float | None]:
+    """
+    Batch get_score: one cache lookup for all people and one write for the computed misses
+    """
+    keys = person_keys(people)
+    unique = list(dict.fromkeys(key for key in keys if key is not None))
+    cached = dict(zip(unique, store.cache_get_many(unique))) if unique else {}
+
+    scores, fresh = score_people(people, keys, cached)
+    if fresh:
+        store.cache_set_many(fresh, SCORE_TTL)
+    return scores
+
+
+async def async_get_scores(store: AsyncStore, people: list[dict[str, Any]]) -> list[float | None]:
+    keys = person_keys(people)
+    unique = list(dict.fromkeys(key for key in keys if key is not None))
+    cached = dict(zip(unique, await store.cache_get_many(unique))) if unique else {}
+
+    scores, fresh = score_people(people, keys, cached)
+    if fresh:
+        await store.cache_set_many(fresh, SCORE_TTL)
+    return scores
+
+
+def get_interests(store: Store, cid: str) -> list[str]:
     r = store.get(f"i:{cid}")
     return json.loads(r) if r else []
+
+
+async def async_get_interests(store: AsyncStore, cid: str) -> list[str]:
+    r = await store.get(f"i:{cid}")
+    return json.loads(r) if r else []
+
+
+def interests_keys(cids: list[Any]) -> tuple[list[Any], list[str]]:
+    unique = list(dict.fromkeys(cids))
+    return unique, [f"i:{cid}" for cid in unique]
+
+
+def get_interests_many(store: Store, cids: list[Any]) -> dict[Any, list[str]]:
+    """
+    Loads interests of all clients with a single store round trip, repeated ids are fetched once
+    """
+    unique, keys = interests_keys(cids)
+    values = store.get_many(keys)
+    return {cid: json.loads(r) if r else [] for cid, r in zip(unique, values)}
+
+
+async def async_get_interests_many(store: AsyncStore, cids: list[Any]) -> dict[Any, list[str]]:
+    unique, keys = interests_keys(cids)
+    values = await store.get_many(keys)
+    return {cid: json.loads(r) if r else [] for cid, r in zip(unique, values)}
+
+
+def iter_interests(store: Store, cids: list[Any], chunk_size: int) -> Iterator[dict[Any, list[str]]]:
+    """
+    get_interests_many in chunks of at most ``chunk_size`` clients, one store round trip each
+    """
+    unique = list(dict.fromkeys(cids))
+    for start in range(0, len(unique), chunk_size):
+        yield get_interests_many(store, unique[start : start + chunk_size])
+
+
+async def async_iter_interests(store: AsyncStore, cids: list[Any], chunk_size: int) -> AsyncIterator[dict[Any, list[str]]]:
+    unique = list(dict.fromkeys(cids))
+    for start in range(0, len(unique), chunk_size):
+        yield await async_get_interests_many(store, unique[start : start + chunk_size])
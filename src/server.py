@@ -0,0 +1,281 @@
+import logging
+import os
+import signal
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from types import FrameType
+from typing import Any, Callable
+
+from src import aio
+
+SettingsFactory = Callable[[], dict[str, Any]]
+
+
+class PooledHTTPServer(HTTPServer):
+    """
+    HTTP server that handles connections on a fixed thread pool.
+
+    At most ``threads + queue_size`` connections are accepted at once, after that the accept loop waits
+    for a free slot and new clients queue up in the listen backlog. A keep-alive connection holds its thread
+    between requests, so idle connections are closed as soon as another connection waits for a thread, and
+    when the server drains.
+    """
+
+    def __init__(
+        self,
+        server_address: tuple[str, int],
+        handler: type[BaseHTTPRequestHandler],
+        threads: int = 1,
+        queue_size: int | None = None,
+        reuse_port: bool = False,
+    ) -> None:
+        self.threads = threads
+        self.allow_reuse_port = reuse_port
+        self._slots = threading.BoundedSemaphore(threads + (threads if queue_size is None else queue_size))
+        self._executor: ThreadPoolExecutor | None = None
+        self._lock = threading.Lock()
+        self._idle: dict[socket.socket, None] = {}
+        self.active = 0
+        self.queued = 0
+        self.draining = False
+        super().__init__(server_address, handler)
+
+    def serve_forever(self, poll_interval: float = 0.5) -> None:
+        # Threads do not survive fork, so the pool is created by the process that actually serves
+        self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="http")
+        super().serve_forever(poll_interval)
+
+    def shutdown(self) -> None:
+        # Handlers answer the requests still in flight with Connection: close, idle connections are closed now
+        self.draining = True
+        self.close_idle()
+        super().shutdown()
+
+    def enter_idle(self, connection: socket.socket) -> bool:
+        """
+        Registers a keep-alive connection waiting for its next request. Returns False when it should be closed
+        instead, because the server drains or another connection waits for a thread.
+        """
+        with self._lock:
+            if self.draining or self.active + self.queued > self.threads:
+                return False
+            self._idle[connection] = None
+            return True
+
+    def leave_idle(self, connection: socket.socket) -> None:
+        with self._lock:
+            self._idle.pop(connection, None)
+
+    def close_idle(self, count: int | None = None) -> None:
+        """
+        Shuts down ``count`` idle connections, the longest idle first, or all of them. Their handlers see the end of
+        the stream and free their threads.
+        """
+        with self._lock:
+            closing = list(self._idle)[:count]
+            for connection in closing:
+                del self._idle[connection]
+        for connection in closing:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def process_request(self, request: Any, client_address: Any) -> None:
+        if self._executor is None:
+            super().process_request(request, client_address)
+            return
+
+        with self._lock:
+            waits = self.active + self.queued >= self.threads
+        if waits:
+            self.close_idle(1)
+        self._slots.acquire()
+        with self._lock:
+            self.queued += 1
+        try:
+            self._executor.submit(self.process_request_thread, request, client_address)
+        except RuntimeError:
+            with self._lock:
+                self.queued -= 1
+            self._slots.release()
+            raise
+
+    def process_request_thread(self, request: Any, client_address: Any) -> None:
+        with self._lock:
+            self.queued -= 1
+            self.active += 1
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            with self._lock:
+                self.active -= 1
+            self._slots.release()
+
+    def server_close(self) -> None:
+        super().server_close()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+def close_settings(settings: dict[str, Any]) -> None:
+    store = settings.get("store")
+    if store is not None and hasattr(store, "close"):
+        store.close()
+    profiler = settings.get("profiler")
+    if profiler is not None:
+        profiler.close()
+
+
+def run_worker(server: PooledHTTPServer, handler: type[Any], make_settings: SettingsFactory) -> None:
+    """
+    Serves until SIGTERM/SIGINT, then waits for in-flight requests and releases the store
+    """
+    settings = make_settings()
+    handler.settings = settings
+
+    def stop(signum: int, frame: FrameType | None) -> None:
+        # shutdown() blocks until serve_forever returns, so it can not run on the serving thread
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        close_settings(settings)
+
+
+def serve_threaded(address: tuple[str, int], handler: type[Any], make_settings: SettingsFactory, threads: int = 1, queue_size: int | None = None) -> None:
+    server = PooledHTTPServer(address, handler, threads=threads, queue_size=queue_size)
+    logging.info("Starting server at %s with %s threads" % (address[1], threads))
+    run_worker(server, handler, make_settings)
+
+
+class PreforkMaster:
+    """
+    Keeps ``workers`` forked processes running ``target`` on an inherited listening socket, respawns the ones that die
+    """
+
+    def __init__(self, target: Callable[[], None], workers: int) -> None:
+        self.target = target
+        self.workers = workers
+        self.children: dict[int, float] = {}
+        self.stopping = False
+
+    def spawn(self) -> None:
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                self.target()
+            except Exception:
+                logging.exception("Worker %s failed" % os.getpid())
+                code = 1
+            finally:
+                # os._exit skips atexit, the log handlers still have to be drained
+                logging.shutdown()
+                os._exit(code)
+        self.children[pid] = time.monotonic()
+
+    def stop(self, signum: int, frame: FrameType | None) -> None:
+        self.stopping = True
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self) -> None:
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        for _ in range(self.workers):
+            self.spawn()
+
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            started = self.children.pop(pid, None)
+            if self.stopping or started is None:
+                continue
+            logging.warning("Worker %s exited with status %s, respawning" % (pid, os.waitstatus_to_exitcode(status)))
+            # Do not spin when workers die right at startup, e.g. the store is misconfigured
+            if time.monotonic() - started < 1:
+                time.sleep(1)
+            self.spawn()
+
+
+def reserve_port(address: tuple[str, int]) -> socket.socket:
+    """
+    Bound but not listening SO_REUSEPORT socket: the port is checked once in the master and stays reserved for the
+    workers' listening sockets, without taking connections itself
+    """
+    reserved = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    reserved.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    reserved.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    reserved.bind(address)
+    return reserved
+
+
+def serve_prefork(
+    address: tuple[str, int],
+    handler: type[Any],
+    make_settings: SettingsFactory,
+    workers: int,
+    threads: int = 1,
+    queue_size: int | None = None,
+) -> None:
+    """
+    Each worker binds its own SO_REUSEPORT listening socket, so the kernel spreads new connections across the workers
+    """
+    reserved = reserve_port(address)
+    address = reserved.getsockname()[:2]
+
+    def worker() -> None:
+        run_worker(PooledHTTPServer(address, handler, threads=threads, queue_size=queue_size, reuse_port=True), handler, make_settings)
+
+    logging.info("Starting server at %s with %s workers x %s threads" % (address[1], workers, threads))
+    try:
+        PreforkMaster(worker, workers).run()
+    finally:
+        reserved.close()
+
+
+def serve_async(address: tuple[str, int], make_settings: SettingsFactory, workers: int = 1) -> None:
+    """
+    Runs one asyncio event loop per worker process, each worker binds its own SO_REUSEPORT listening socket as in
+    serve_prefork
+    """
+    reserved = reserve_port(address) if workers > 1 else None
+    if reserved is not None:
+        address = reserved.getsockname()[:2]
+
+    def worker() -> None:
+        sock = socket.create_server(address, reuse_port=workers > 1)
+        sock.setblocking(False)
+        try:
+            aio.run_worker(sock, make_settings)
+        finally:
+            sock.close()
+
+    logging.info("Starting async server at %s with %s workers" % (address[1], workers))
+    try:
+        if workers > 1:
+            PreforkMaster(worker, workers).run()
+        else:
+            worker()
+    finally:
+        if reserved is not None:
+            reserved.close()
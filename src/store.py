@@ -1,37 +1,507 @@
+import functools
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, cast
+
 import redis
+import redis.asyncio
+from redis.asyncio.retry import Retry as AsyncRetry
 from redis.backoff import ExponentialBackoff
+from redis.connection import BlockingConnectionPool
 from redis.exceptions import ConnectionError, TimeoutError
 from redis.retry import Retry
 
+from src.breaker import CircuitBreaker, CircuitOpenError
+
+# Errors of a Redis round trip: the cache methods swallow them, the others let them reach the handler
+STORE_ERRORS = (ConnectionError, TimeoutError)
+
+# Message of the ConnectionError BlockingConnectionPool raises when no connection frees up within its timeout
+POOL_EXHAUSTED = "No connection available."
+
+# Keeps a single MGET reply reasonably small on the Redis side for very long id lists
+MGET_CHUNK = 1000
+
+
+class ObservedConnectionPool(BlockingConnectionPool):
+    """
+    Blocking pool that keeps checkout statistics and closes connections idle for longer than ``idle_timeout``
+    """
+
+    def __init__(self, max_connections: int = 50, timeout: float = 20, idle_timeout: float | None = None, **connection_kwargs: Any) -> None:
+        self.idle_timeout = idle_timeout
+        self._stats_lock = threading.Lock()
+        self._idle_since: dict[Any, float] = {}
+        self._last_reap = time.monotonic()
+        self.connections = 0
+        self.checkouts = 0
+        self.timeouts = 0
+        self.connect_errors = 0
+        # Released connections are only counted back when they were handed out, redis also releases the connections
+        # it failed to connect
+        self._checked_out: set[Any] = set()
+        self.peak_in_use = 0
+        self.reaped = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        super().__init__(max_connections=max_connections, timeout=timeout, **connection_kwargs)
+
+    def make_connection(self) -> Any:
+        connection = super().make_connection()
+        with self._stats_lock:
+            self.connections += 1
+        return connection
+
+    def forget(self, connection: Any) -> None:
+        """
+        Drops a reaped connection from the list redis keeps of every connection the pool created
+        """
+        created = getattr(self, "_connections", None)
+        if created is not None and connection in created:
+            created.remove(connection)
+
+    def get_connection(self, *args: Any, **kwargs: Any) -> Any:
+        start = time.perf_counter()
+        try:
+            connection = super().get_connection(*args, **kwargs)
+        except ConnectionError as e:
+            with self._stats_lock:
+                if e.args == (POOL_EXHAUSTED,):
+                    self.timeouts += 1
+                else:
+                    self.connect_errors += 1
+            raise
+        waited = time.perf_counter() - start
+
+        with self._stats_lock:
+            self._idle_since.pop(connection, None)
+            self.checkouts += 1
+            self._checked_out.add(connection)
+            self.peak_in_use = max(self.peak_in_use, len(self._checked_out))
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+        return connection
+
+    def release(self, connection: Any) -> None:
+        now = time.monotonic()
+        with self._stats_lock:
+            self._idle_since[connection] = now
+            self._checked_out.discard(connection)
+        super().release(connection)
+
+        if self.idle_timeout and now - self._last_reap >= self.idle_timeout:
+            self.reap_idle(now)
+
+    def reap_idle(self, now: float | None = None) -> int:
+        """
+        Disconnects free connections idle for longer than ``idle_timeout`` and frees their pool slots
+        """
+        if not self.idle_timeout:
+            return 0
+        now = time.monotonic() if now is None else now
+        self._last_reap = now
+        reaped = 0
+
+        # Holding the queue mutex keeps other threads from checking out a connection while it is being closed
+        with self.pool.mutex:
+            for i, connection in enumerate(self.pool.queue):
+                if connection is None:
+                    continue
+                with self._stats_lock:
+                    idle_since = self._idle_since.get(connection, now)
+                if now - idle_since < self.idle_timeout:
+                    continue
+                connection.disconnect()
+                self.pool.queue[i] = None
+                with self._stats_lock:
+                    self._idle_since.pop(connection, None)
+                self.forget(connection)
+                reaped += 1
+
+        with self._stats_lock:
+            self.reaped += reaped
+            self.connections -= reaped
+        return reaped
+
+    def stats(self) -> dict[str, Any]:
+        with self._stats_lock:
+            return {
+                "max_connections": self.max_connections,
+                "created": self.connections,
+                "in_use": len(self._checked_out),
+                "peak_in_use": self.peak_in_use,
+                "saturation": len(self._checked_out) / self.max_connections,
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "connect_errors": self.connect_errors,
+                "reaped": self.reaped,
+                "wait_avg": self.wait_total / self.checkouts if self.checkouts else 0.0,
+                "wait_max": self.wait_max,
+            }
+
 
 class RedisHandler:
-    def __init__(self) -> None:
-        retry = Retry(ExponentialBackoff(), retries=3)
+    def __init__(
+        self,
+        host: str = "localhost",
+        port: int = 6379,
+        db: int = 0,
+        max_connections: int = 50,
+        pool_timeout: float = 5,
+        idle_timeout: float | None = 300,
+        retries: int = 3,
+        socket_timeout: float = 5,
+        connect_timeout: float = 5,
+        breaker: CircuitBreaker | None = None,
+    ) -> None:
+        self.breaker = breaker
+        retry = Retry(ExponentialBackoff(), retries=retries)
 
-        self.r = redis.Redis(
-            host="localhost",
-            port=6379,
-            db=0,
+        self.pool = ObservedConnectionPool(
+            max_connections=max_connections,
+            timeout=pool_timeout,
+            idle_timeout=idle_timeout,
+            host=host,
+            port=port,
+            db=db,
             decode_responses=True,
             retry=retry,
             retry_on_timeout=True,
             retry_on_error=[ConnectionError, TimeoutError],
             health_check_interval=30,
-            socket_timeout=5,
-            socket_connect_timeout=5,
+            socket_timeout=socket_timeout,
+            socket_connect_timeout=connect_timeout,
         )
+        self.r = redis.Redis(connection_pool=self.pool, decode_responses=True)
+
+    def call(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """
+        Runs one Redis round trip through the circuit breaker, calls rejected by an open circuit raise CircuitOpenError
+        """
+        if self.breaker is None:
+            return func(*args, **kwargs)
+        if not self.breaker.allow():
+            raise CircuitOpenError("Circuit %s is open" % self.breaker.name)
+        try:
+            result = func(*args, **kwargs)
+        except STORE_ERRORS:
+            self.breaker.record_failure()
+            raise
+        except Exception:
+            # Redis answered, with an error reply for instance: the connection works
+            self.breaker.record_success()
+            raise
+        except BaseException:
+            self.breaker.release()
+            raise
+        self.breaker.record_success()
+        return result
 
     def cache_set(self, key: str, value: str | int, expired: int) -> None:
         try:
-            self.r.set(key, value, ex=expired)
-        except ConnectionError:
+            self.call(self.r.set, key, value, ex=expired)
+        except STORE_ERRORS:
             pass
 
     def cache_get(self, key: str) -> str | None:
         try:
-            return self.r.get(key)
-        except ConnectionError:
+            return cast(str | None, self.call(self.r.get, key))
+        except STORE_ERRORS:
             return None
 
     def get(self, key: str) -> str | None:
-        return self.r.get(key)
+        return cast(str | None, self.call(self.r.get, key))
+
+    def get_many(self, keys: list[str]) -> list[str | None]:
+        """
+        MGET in chunks of ``MGET_CHUNK`` keys, all chunks are sent in one pipeline
+        """
+        if not keys:
+            return []
+        pipe = self.r.pipeline(transaction=False)
+        for i in range(0, len(keys), MGET_CHUNK):
+            pipe.mget(keys[i : i + MGET_CHUNK])
+        return [value for chunk in self.call(pipe.execute) for value in chunk]
+
+    def cache_get_many(self, keys: list[str]) -> list[str | None]:
+        try:
+            return self.get_many(keys)
+        except STORE_ERRORS:
+            return [None] * len(keys)
+
+    def cache_set_many(self, items: dict[str, Any], expired: int) -> None:
+        pipe = self.r.pipeline(transaction=False)
+        for key, value in items.items():
+            pipe.set(key, value, ex=expired)
+        try:
+            self.call(pipe.execute)
+        except STORE_ERRORS:
+            pass
+
+    def pool_stats(self) -> dict[str, Any]:
+        return self.pool.stats()
+
+    def close(self) -> None:
+        self.pool.disconnect()
+
+
+class AsyncRedisHandler:
+    """
+    AsyncStore on top of redis.asyncio, one instance per event loop
+    """
+
+    def __init__(
+        self,
+        host: str = "localhost",
+        port: int = 6379,
+        db: int = 0,
+        max_connections: int = 50,
+        pool_timeout: float = 5,
+        retries: int = 3,
+        socket_timeout: float = 5,
+        connect_timeout: float = 5,
+        breaker: CircuitBreaker | None = None,
+    ) -> None:
+        self.breaker = breaker
+        retry = AsyncRetry(ExponentialBackoff(), retries=retries)
+
+        # types-redis declares the timeout in whole seconds, redis.asyncio takes any number of seconds
+        self.pool = redis.asyncio.BlockingConnectionPool(  # type: ignore[call-overload]
+            max_connections=max_connections,
+            timeout=pool_timeout,
+            host=host,
+            port=port,
+            db=db,
+            decode_responses=True,
+            retry=retry,
+            retry_on_timeout=True,
+            retry_on_error=[ConnectionError, TimeoutError],
+            health_check_interval=30,
+            socket_timeout=socket_timeout,
+            socket_connect_timeout=connect_timeout,
+        )
+        self.r = redis.asyncio.Redis(connection_pool=self.pool, decode_responses=True)
+
+    async def call(self, func: Callable[..., Awaitable[Any]], *args: Any, **kwargs: Any) -> Any:
+        if self.breaker is None:
+            return await func(*args, **kwargs)
+        if not self.breaker.allow():
+            raise CircuitOpenError("Circuit %s is open" % self.breaker.name)
+        try:
+            result = await func(*args, **kwargs)
+        except STORE_ERRORS:
+            self.breaker.record_failure()
+            raise
+        except Exception:
+            # Redis answered, with an error reply for instance: the connection works
+            self.breaker.record_success()
+            raise
+        except BaseException:
+            self.breaker.release()
+            raise
+        self.breaker.record_success()
+        return result
+
+    async def cache_set(self, key: str, value: str | int, expired: int) -> None:
+        try:
+            await self.call(self.r.set, key, value, ex=expired)
+        except STORE_ERRORS:
+            pass
+
+    async def cache_get(self, key: str) -> str | None:
+        try:
+            return cast(str | None, await self.call(self.r.get, key))
+        except STORE_ERRORS:
+            return None
+
+    async def get(self, key: str) -> str | None:
+        return cast(str | None, await self.call(self.r.get, key))
+
+    async def get_many(self, keys: list[str]) -> list[str | None]:
+        if not keys:
+            return []
+        pipe = self.r.pipeline(transaction=False)
+        for i in range(0, len(keys), MGET_CHUNK):
+            pipe.mget(keys[i : i + MGET_CHUNK])
+        return [value for chunk in await self.call(pipe.execute) for value in chunk]
+
+    async def cache_get_many(self, keys: list[str]) -> list[str | None]:
+        try:
+            return await self.get_many(keys)
+        except STORE_ERRORS:
+            return [None] * len(keys)
+
+    async def cache_set_many(self, items: dict[str, Any], expired: int) -> None:
+        pipe = self.r.pipeline(transaction=False)
+        for key, value in items.items():
+            pipe.set(key, value, ex=expired)
+        try:
+            await self.call(pipe.execute)
+        except STORE_ERRORS:
+            pass
+
+    async def close(self) -> None:
+        # aclose is missing from types-redis, close is deprecated in redis.asyncio
+        await self.r.aclose()  # type: ignore[attr-defined]
+        await self.pool.disconnect()
+
+
+# Approximate per-entry cost of the dict slot, tuple and str headers on top of the key and value characters
+ENTRY_OVERHEAD = 160
+
+
+def load_interests(path: str) -> dict[str, str]:
+    """
+    Reads a JSON object of client id to interests list into ``i:<cid>`` store entries
+    """
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    return {"i:%s" % cid: json.dumps(interests) for cid, interests in data.items()}
+
+
+class MemoryStore:
+    """
+    In-process Store without network round trips.
+
+    ``data`` holds the persistent keys read by ``get`` (e.g. interests), they never expire and are never evicted.
+    Cache entries expire after their TTL and the least recently used ones are evicted once their approximate
+    size exceeds ``max_bytes``, like Redis with the volatile-lru policy.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, data: dict[str, str] | None = None) -> None:
+        self.max_bytes = max_bytes
+        self.data = dict(data or {})
+        self._cache: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def entry_size(key: str, value: str) -> int:
+        return len(key) + len(value) + ENTRY_OVERHEAD
+
+    def lookup(self, key: str, now: float) -> str | None:
+        item = self._cache.get(key)
+        if item is None:
+            return self.data.get(key)
+        expires, value = item
+        if expires <= now:
+            del self._cache[key]
+            self.bytes -= self.entry_size(key, value)
+            self.expirations += 1
+            return self.data.get(key)
+        self._cache.move_to_end(key)
+        return value
+
+    def store(self, key: str, value: Any, expires: float) -> None:
+        value = str(value)
+        old = self._cache.pop(key, None)
+        if old is not None:
+            self.bytes -= self.entry_size(key, old[1])
+        self._cache[key] = (expires, value)
+        self.bytes += self.entry_size(key, value)
+        while self.bytes > self.max_bytes and self._cache:
+            evicted, (_, evicted_value) = self._cache.popitem(last=False)
+            self.bytes -= self.entry_size(evicted, evicted_value)
+            self.evictions += 1
+
+    def cache_get(self, key: str) -> str | None:
+        now = time.monotonic()
+        with self._lock:
+            value = self.lookup(key, now)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return value
+
+    def cache_set(self, key: str, value: Any, expired: int) -> None:
+        expires = time.monotonic() + expired
+        with self._lock:
+            self.store(key, value, expires)
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            return self.lookup(key, time.monotonic())
+
+    def get_many(self, keys: list[str]) -> list[str | None]:
+        now = time.monotonic()
+        with self._lock:
+            return [self.lookup(key, now) for key in keys]
+
+    def cache_get_many(self, keys: list[str]) -> list[str | None]:
+        now = time.monotonic()
+        with self._lock:
+            values = [self.lookup(key, now) for key in keys]
+            found = sum(value is not None for value in values)
+            self.hits += found
+            self.misses += len(values) - found
+            return values
+
+    def cache_set_many(self, items: dict[str, Any], expired: int) -> None:
+        expires = time.monotonic() + expired
+        with self._lock:
+            for key, value in items.items():
+                self.store(key, value, expires)
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "keys": len(self.data),
+                "cache_size": len(self._cache),
+                "cache_bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+    def close(self) -> None:
+        pass
+
+
+class AsyncMemoryStore:
+    """
+    AsyncStore face of a MemoryStore, every call completes without suspending
+    """
+
+    def __init__(self, store: MemoryStore) -> None:
+        self.store = store
+
+    async def cache_get(self, key: str) -> str | None:
+        return self.store.cache_get(key)
+
+    async def cache_set(self, key: str, value: Any, expired: int) -> None:
+        self.store.cache_set(key, value, expired)
+
+    async def get(self, key: str) -> str | None:
+        return self.store.get(key)
+
+    async def get_many(self, keys: list[str]) -> list[str | None]:
+        return self.store.get_many(keys)
+
+    async def cache_get_many(self, keys: list[str]) -> list[str | None]:
+        return self.store.cache_get_many(keys)
+
+    async def cache_set_many(self, items: dict[str, Any], expired: int) -> None:
+        self.store.cache_set_many(items, expired)
+
+    def stats(self) -> dict[str, Any]:
+        return self.store.stats()
+
+    async def close(self) -> None:
+        self.store.close()
+
+
+@functools.cache
+def default_store() -> RedisHandler:
+    """
+    Process-wide store for callers that do not inject one through the handler settings
+    """
+    return RedisHandler()
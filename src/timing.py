@@ -0,0 +1,70 @@
+from contextvars import ContextVar
+from typing import Any
+
+
+class Timings:
+    """
+    Time spent in each stage of one request, by span name. Spans of the same name, such as the store calls of a batch,
+    add up.
+    """
+
+    __slots__ = ("spans",)
+
+    def __init__(self) -> None:
+        self.spans: dict[str, list[float]] = {}
+
+    def add(self, name: str, seconds: float) -> None:
+        span = self.spans.get(name)
+        if span is None:
+            self.spans[name] = [1, seconds]
+        else:
+            span[0] += 1
+            span[1] += seconds
+
+    def fields(self) -> dict[str, float]:
+        """
+        Milliseconds by span, for the request log
+        """
+        return {name: round(seconds * 1000, 3) for name, (_, seconds) in self.spans.items()}
+
+    def header(self) -> str:
+        """
+        Server-Timing value, repeated spans carry their count as the description
+        """
+        return ", ".join(
+            "%s;dur=%.3f" % (name, seconds * 1000) if count == 1 else '%s;dur=%.3f;desc="%d calls"' % (name, seconds * 1000, count)
+            for name, (count, seconds) in self.spans.items()
+        )
+
+
+TIMINGS: ContextVar[Timings | None] = ContextVar("timings", default=None)
+
+
+def record(name: str, seconds: float) -> None:
+    """
+    Adds a span to the timings of the request being handled, if any
+    """
+    timings = TIMINGS.get()
+    if timings is not None:
+        timings.add(name, seconds)
+
+
+def store_span(op: str, args: tuple[Any, ...]) -> str:
+    """
+    Span name of a store call, tagged with the prefix of its first key: store.cache_get.uid, store.get_many.i
+    """
+    keys = args[0] if args else None
+    if isinstance(keys, (dict, list)):
+        keys = next(iter(keys), None)
+    prefix, colon, _ = keys.partition(":") if isinstance(keys, str) else ("", "", "")
+    return "store.%s.%s" % (op, prefix) if colon else "store." + op
+
+
+def server_timing(enabled: bool) -> dict[str, str] | None:
+    """
+    Server-Timing header of the request being handled, when ``enabled`` and it has spans
+    """
+    timings = TIMINGS.get()
+    if not enabled or timings is None or not timings.spans:
+        return None
+    return {"Server-Timing": timings.header()}
@@ -0,0 +1,271 @@
+import asyncio
+import json
+import socket
+from typing import Any
+
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from src.aio import AsyncHTTPServer
+from src.api import async_method_handler
+from src.constants import INTERNAL_ERROR, OK
+from src.metrics import Metrics
+from src.profiling import RequestProfiler
+from tests.conftest import AsyncRecordingStore, make_body
+
+
+class FailingStore(AsyncRecordingStore):
+    async def get_many(self, keys: list[str]) -> list[str | None]:
+        raise RedisConnectionError()
+
+
+class TestAsyncMethodHandler:
+    def test_online_score(self):
+        store = AsyncRecordingStore()
+        body = make_body("online_score", {"first_name": "a", "last_name": "b"})
+
+        response, code = asyncio.run(async_method_handler({"body": body, "headers": {}}, {}, {"store": store}))
+
+        assert code == OK
+        assert response == {"score": 0.5}
+        assert list(store.cache.values()) == ["0.5"]
+
+    def test_clients_interests(self):
+        store = AsyncRecordingStore()
+        store.data["i:2"] = json.dumps(["cars"])
+        body = make_body("clients_interests", {"client_ids": [1, 2]})
+
+        response, code = asyncio.run(async_method_handler({"body": body, "headers": {}}, {}, {"store": store}))
+
+        assert code == OK
+        assert response == {1: [], 2: ["cars"]}
+
+    def test_clients_interests_store_error(self):
+        body = make_body("clients_interests", {"client_ids": [1]})
+
+        response, code = asyncio.run(async_method_handler({"body": body, "headers": {}}, {}, {"store": FailingStore()}))
+
+        assert code == INTERNAL_ERROR
+        assert response == "Store connection error"
+
+    def test_batch(self):
+        store = AsyncRecordingStore()
+        store.data["i:2"] = json.dumps(["cars"])
+        bodies = [make_body("clients_interests", {"client_ids": [2]}), make_body("online_score", {"first_name": "a", "last_name": "b"}), {}]
+
+        response, code = asyncio.run(async_method_handler({"body": bodies, "headers": {}}, {}, {"store": store}))
+
+        assert code == OK
+        assert response == [
+            {"response": {2: ["cars"]}, "code": OK},
+            {"response": {"score": 0.5}, "code": OK},
+            {"error": "Invalid Request", "code": 422},
+        ]
+
+
+async def exchange(raw: bytes, store: AsyncRecordingStore, half_close: bool = True, **settings: Any) -> bytes:
+    sock = socket.create_server(("localhost", 0))
+    server = await asyncio.start_server(AsyncHTTPServer({"store": store, **settings}).handle, sock=sock)
+    reader, writer = await asyncio.open_connection(*sock.getsockname()[:2])
+    writer.write(raw)
+    await writer.drain()
+    if half_close:
+        writer.write_eof()
+    data = await reader.read()
+    writer.close()
+    server.close()
+    await server.wait_closed()
+    return data
+
+
+class TestAsyncHTTPServer:
+    def test_post_method(self):
+        body = json.dumps(make_body("online_score", {"phone": "79175002040", "email": "stupnikov@otus.ru"})).encode("utf-8")
+        raw = b"POST /method HTTP/1.1\r\nHost: localhost\r\nContent-Length: %d\r\n\r\n%s" % (len(body), body)
+
+        data = asyncio.run(exchange(raw, AsyncRecordingStore()))
+
+        head, _, payload = data.partition(b"\r\n\r\n")
+        assert head.startswith(b"HTTP/1.1 200 OK")
+        assert b"Content-Length: %d" % len(payload) in head
+        assert json.loads(payload) == {"response": {"score": 3.0}, "code": 200}
+
+    def test_not_found(self):
+        raw = b'POST /unknown HTTP/1.1\r\nContent-Length: 8\r\n\r\n{"a": 1}'
+
+        data = asyncio.run(exchange(raw, AsyncRecordingStore()))
+
+        assert json.loads(data.partition(b"\r\n\r\n")[2]) == {"error": "Not Found", "code": 404}
+
+    def test_bad_request(self):
+        raw = b"POST /method HTTP/1.1\r\nContent-Length: 3\r\n\r\nxxx"
+
+        data = asyncio.run(exchange(raw, AsyncRecordingStore()))
+
+        assert json.loads(data.partition(b"\r\n\r\n")[2]) == {"error": "Bad Request", "code": 400}
+
+
+class TestAsyncKeepAlive:
+    body = json.dumps(make_body("online_score", {"phone": "79175002040", "email": "stupnikov@otus.ru"})).encode("utf-8")
+
+    def request(self, headers: bytes = b"") -> bytes:
+        return b"POST /method HTTP/1.1\r\nContent-Length: %d\r\n%s\r\n%s" % (len(self.body), headers, self.body)
+
+    def test_pipelined_requests(self):
+        data = asyncio.run(exchange(self.request() * 2, AsyncRecordingStore()))
+
+        assert data.count(b"HTTP/1.1 200 OK") == 2
+        assert b"Connection" not in data
+
+    def test_max_requests(self):
+        data = asyncio.run(exchange(self.request() * 3, AsyncRecordingStore(), keepalive_requests=2))
+
+        assert data.count(b"HTTP/1.1 200 OK") == 2
+        assert data.count(b"Connection: close") == 1
+
+    def test_client_close(self):
+        data = asyncio.run(exchange(self.request(b"Connection: close\r\n") + self.request(), AsyncRecordingStore(), half_close=False))
+
+        assert data.count(b"HTTP/1.1 200 OK") == 1
+
+    def test_http10_closes_by_default(self):
+        raw = self.request().replace(b"HTTP/1.1", b"HTTP/1.0", 1)
+
+        data = asyncio.run(exchange(raw, AsyncRecordingStore(), half_close=False))
+
+        assert b"Connection: close" in data
+
+    def test_idle_timeout(self):
+        data = asyncio.run(exchange(self.request(), AsyncRecordingStore(), half_close=False, keepalive_timeout=0.1))
+
+        assert data.count(b"HTTP/1.1 200 OK") == 1
+        assert b"Connection" not in data
+
+    def test_body_timeout(self):
+        metrics = Metrics()
+        raw = b"POST /method HTTP/1.1\r\nContent-Length: 100\r\n\r\n{"
+
+        data = asyncio.run(asyncio.wait_for(exchange(raw, AsyncRecordingStore(), half_close=False, keepalive_timeout=0.1, metrics=metrics), 2))
+
+        assert data.startswith(b"HTTP/1.1 400")
+        assert b"Connection: close" in data
+        assert metrics.in_flight.values[()] == 0
+
+
+class TestAsyncBodyLimits:
+    body = TestAsyncKeepAlive.body
+
+    def test_content_length_over_limit(self):
+        raw = b"POST /method HTTP/1.1\r\nContent-Length: %d\r\n\r\n%s" % (len(self.body), self.body)
+
+        data = asyncio.run(exchange(raw * 2, AsyncRecordingStore(), body_limits={"method": len(self.body) - 1}))
+
+        assert data.startswith(b"HTTP/1.1 413")
+        assert data.count(b"HTTP/1.1") == 1
+        assert b"Connection: close" in data
+
+    def test_chunked_body(self):
+        raw = b"POST /method HTTP/1.1\r\nTransfer-Encoding: chunked\r\nExpect: 100-continue\r\n\r\n%x\r\n%s\r\n0\r\n\r\n" % (len(self.body), self.body)
+
+        data = asyncio.run(exchange(raw, AsyncRecordingStore(), max_body_size=len(self.body)))
+
+        assert data.startswith(b"HTTP/1.1 100 Continue\r\n\r\nHTTP/1.1 200 OK")
+        assert json.loads(data.rpartition(b"\r\n\r\n")[2]) == {"response": {"score": 3.0}, "code": 200}
+
+    def test_chunked_body_over_limit(self):
+        raw = b"POST /method HTTP/1.1\r\nTransfer-Encoding: chunked\r\nExpect: 100-continue\r\n\r\n%x\r\n%s\r\n0\r\n\r\n" % (len(self.body), self.body)
+
+        data = asyncio.run(exchange(raw, AsyncRecordingStore(), max_body_size=len(self.body) - 1))
+
+        assert data.startswith(b"HTTP/1.1 100 Continue\r\n\r\nHTTP/1.1 413")
+
+
+class TestAsyncServerTiming:
+    def test_header(self):
+        body = json.dumps(make_body("online_score", {"phone": "79175002040", "email": "stupnikov@otus.ru"})).encode("utf-8")
+        raw = b"POST /method HTTP/1.1\r\nContent-Length: %d\r\n\r\n%s" % (len(body), body)
+
+        data = asyncio.run(exchange(raw, AsyncRecordingStore(), server_timing=True))
+
+        head = data.partition(b"\r\n\r\n")[0].decode("latin-1")
+        (header,) = [line for line in head.split("\r\n") if line.startswith("Server-Timing: ")]
+        assert [span.split(";")[0] for span in header[len("Server-Timing: ") :].split(", ")] == ["read", "parse", "auth", "validation", "encode"]
+
+
+class TestAsyncMetricsEndpoint:
+    def test_metrics(self):
+        metrics = Metrics()
+        body = json.dumps(make_body("online_score", {"phone": "79175002040", "email": "stupnikov@otus.ru"})).encode("utf-8")
+        raw = b"POST /method HTTP/1.1\r\nContent-Length: %d\r\n\r\n%s" % (len(body), body) + b"GET /metrics HTTP/1.1\r\n\r\n"
+
+        data = asyncio.run(exchange(raw, AsyncRecordingStore(), metrics=metrics))
+
+        assert b"Content-Type: text/plain; version=0.0.4" in data
+        assert b'api_requests_total{method="online_score",code="200"} 1\n' in data
+
+
+class TestAsyncProfileEndpoint:
+    def test_report_needs_token(self):
+        profiler = RequestProfiler(token="s3cret")
+        body = json.dumps(make_body("online_score", {"phone": "79175002040", "email": "stupnikov@otus.ru"})).encode("utf-8")
+        raw = (
+            b"POST /method HTTP/1.1\r\nX-Profile-Token: s3cret\r\nContent-Length: %d\r\n\r\n%s" % (len(body), body)
+            + b"GET /debug/profile HTTP/1.1\r\n\r\n"
+            + b"GET /debug/profile HTTP/1.1\r\nX-Profile-Token: s3cret\r\n\r\n"
+        )
+
+        data = asyncio.run(exchange(raw, AsyncRecordingStore(), profiler=profiler))
+
+        assert b"HTTP/1.1 403 Forbidden" in data
+        assert b"online_score: 1 requests" in data
+        assert b"async_method_handler" in data
+
+
+def dechunk(payload: bytes) -> tuple[bytes, bool]:
+    """
+    Body of a chunked payload and whether it ended with the last chunk
+    """
+    body = b""
+    while payload:
+        size, _, payload = payload.partition(b"\r\n")
+        if int(size, 16) == 0:
+            return body, True
+        body += payload[: int(size, 16)]
+        payload = payload[int(size, 16) + 2 :]
+    return body, False
+
+
+class TestAsyncInterestsStream:
+    def request(self, store: AsyncRecordingStore, size: int, version: bytes = b"HTTP/1.1") -> tuple[bytes, bytes]:
+        body = json.dumps(make_body("clients_interests", {"client_ids": list(range(size))})).encode("utf-8")
+        raw = b"POST /method %s\r\nHost: localhost\r\nContent-Length: %d\r\n\r\n%s" % (version, len(body), body)
+        head, _, payload = asyncio.run(exchange(raw, store, stream_threshold=100, stream_chunk_size=100)).partition(b"\r\n\r\n")
+        return head, payload
+
+    def test_chunked_response(self):
+        store = AsyncRecordingStore()
+        store.data.update({"i:%d" % cid: json.dumps(["cars"]) for cid in range(250)})
+
+        head, payload = self.request(store, 250)
+        body, complete = dechunk(payload)
+
+        assert b"Transfer-Encoding: chunked" in head
+        assert complete
+        assert json.loads(body) == {"response": {str(cid): ["cars"] for cid in range(250)}, "code": 200}
+
+    def test_http10_buffered(self):
+        head, payload = self.request(AsyncRecordingStore(), 150, b"HTTP/1.0")
+
+        assert b"Content-Length: %d" % len(payload) in head
+        assert json.loads(payload)["code"] == 200
+
+    def test_store_error_cuts_the_response(self):
+        class FailingLater(AsyncRecordingStore):
+            async def get_many(self, keys: list[str]) -> list[str | None]:
+                if self.called("get_many"):
+                    raise RedisConnectionError()
+                return await super().get_many(keys)
+
+        head, payload = self.request(FailingLater(), 250)
+
+        assert head.startswith(b"HTTP/1.1 200 OK")
+        assert dechunk(payload)[1] is False
@@ -0,0 +1,244 @@
+import hashlib
+import json
+from datetime import datetime
+from typing import Any
+
+import pytest
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from src.api import InterestsStream, make_envelope, method_handler
+from src.constants import ADMIN_SALT, ADMIN_SCORE, FORBIDDEN, INTERNAL_ERROR, INVALID_REQUEST, OK
+from tests.conftest import RecordingStore, make_body
+
+
+def admin_token() -> str:
+    return hashlib.sha512((datetime.now().strftime("%Y%m%d%H") + ADMIN_SALT).encode("utf-8")).hexdigest()
+
+
+class TestMethodHandler:
+    @pytest.fixture
+    def store(self):
+        return RecordingStore()
+
+    def test_online_score_uses_injected_store(self, store):
+        ctx: dict[str, Any] = {}
+        body = make_body("online_score", {"phone": "79175002040", "email": "stupnikov@otus.ru"})
+
+        response, code = method_handler({"body": body, "headers": {}}, ctx, {"store": store})
+
+        assert code == OK
+        assert response == {"score": 3.0}
+        assert list(store.cache.values()) == ["3.0"]
+        assert sorted(ctx["has"]) == ["email", "phone"]
+
+    def test_clients_interests_uses_injected_store(self, store):
+        ctx: dict[str, Any] = {}
+        store.data["i:1"] = json.dumps(["books"])
+        body = make_body("clients_interests", {"client_ids": [1, 2]})
+
+        response, code = method_handler({"body": body, "headers": {}}, ctx, {"store": store})
+
+        assert code == OK
+        assert response == {1: ["books"], 2: []}
+        assert ctx["nclients"] == 2
+
+    def test_forbidden(self, store):
+        body = make_body("online_score", {"phone": "79175002040", "email": "stupnikov@otus.ru"})
+        body["token"] = "bad"
+
+        response, code = method_handler({"body": body, "headers": {}}, {}, {"store": store})
+
+        assert code == FORBIDDEN
+
+    def test_empty_body(self, store):
+        _, code = method_handler({"body": {}, "headers": {}}, {}, {"store": store})
+
+        assert code == INVALID_REQUEST
+
+
+class TestInterestsStream:
+    @pytest.fixture
+    def store(self):
+        store = RecordingStore()
+        store.data.update({"i:%d" % cid: json.dumps(["books", "cars"]) for cid in range(0, 25, 2)})
+        return store
+
+    def test_same_envelope_as_buffered(self, store):
+        body = make_body("clients_interests", {"client_ids": list(range(25)) + [3, 2]})
+        settings = {"store": store, "stream_threshold": 10, "stream_chunk_size": 10}
+
+        stream, code = method_handler({"body": body, "headers": {}}, {}, settings)
+        streamed = b"".join(stream.encode())
+        response, _ = method_handler({"body": body, "headers": {}}, {}, {"store": store})
+
+        assert code == OK
+        assert isinstance(stream, InterestsStream)
+        assert streamed == json.dumps(make_envelope(response, OK)).encode("utf-8")
+        assert stream.chunks == 3
+        assert store.round_trips == 3 + 1
+
+    def test_below_threshold_not_streamed(self, store):
+        body = make_body("clients_interests", {"client_ids": [1, 2]})
+
+        response, code = method_handler({"body": body, "headers": {}}, {}, {"store": store, "stream_threshold": 10})
+
+        assert response == {1: [], 2: ["books", "cars"]}
+
+    def test_store_error_before_first_chunk(self, store):
+        def fail(keys):
+            raise RedisConnectionError()
+
+        store.get_many = fail
+        body = make_body("clients_interests", {"client_ids": list(range(25))})
+
+        response, code = method_handler({"body": body, "headers": {}}, {}, {"store": store, "stream_threshold": 10})
+
+        assert (response, code) == ("Store connection error", INTERNAL_ERROR)
+
+
+class TestOnlineScoreBulk:
+    @pytest.fixture
+    def store(self):
+        return RecordingStore()
+
+    def test_scores_in_record_order(self, store):
+        people = [
+            {"phone": "79175002040", "email": "stupnikov@otus.ru"},
+            {"phone": "89175002040", "email": "stupnikov@otus.ru"},
+            {"first_name": "a", "last_name": "b"},
+            {"phone": "79175002040", "email": "stupnikov@otus.ru"},
+        ]
+        ctx: dict[str, Any] = {}
+
+        response, code = method_handler({"body": make_body("online_score_bulk", {"people": people}), "headers": {}}, ctx, {"store": store})
+
+        assert code == OK
+        assert response == {"scores": [3.0, None, 0.5, 3.0], "errors": {1: "Incorrect phone value"}}
+        assert ctx["method"] == "online_score_bulk"
+        assert ctx["npeople"] == 4
+        assert store.round_trips == 2
+        assert sorted(store.cache.values()) == ["0.5", "3.0"]
+
+    @pytest.mark.parametrize("arguments", [{}, {"people": []}, {"people": {"phone": "79175002040"}}, {"people": ["79175002040"]}])
+    def test_invalid_people(self, store, arguments):
+        response, code = method_handler({"body": make_body("online_score_bulk", arguments), "headers": {}}, {}, {"store": store})
+
+        assert code == INVALID_REQUEST
+        assert response == "Incorrect people value"
+
+    def test_admin(self, store):
+        body = make_body("online_score_bulk", {"people": [{"first_name": "a", "last_name": "b"}, {"phone": "1"}]}, login="admin")
+        body["token"] = admin_token()
+
+        response, code = method_handler({"body": body, "headers": {}}, {}, {"store": store})
+
+        assert code == OK
+        assert response["scores"] == [42, None]
+        assert json.dumps(response["scores"]) == json.dumps([ADMIN_SCORE["score"], None])
+        assert store.round_trips == 0
+
+    def test_in_batch(self, store):
+        bodies = [
+            make_body("online_score_bulk", {"people": [{"first_name": "a", "last_name": "b"}, {"phone": "79175002040", "email": "a@b"}]}),
+            make_body("online_score", {"phone": "79175002040", "email": "a@b"}),
+            make_body("online_score_bulk", {"people": [{"first_name": "c", "last_name": "d"}]}),
+        ]
+
+        response, code = method_handler({"body": bodies, "headers": {}}, {}, {"store": store})
+
+        assert code == OK
+        assert [item["response"] for item in response] == [{"scores": [0.5, 3.0], "errors": {}}, {"score": 3.0}, {"scores": [0.5], "errors": {}}]
+        assert store.round_trips == 2
+
+
+class TestBatch:
+    @pytest.fixture
+    def store(self):
+        return RecordingStore()
+
+    def test_results_in_request_order(self, store):
+        store.data["i:1"] = json.dumps(["books"])
+        bodies = [
+            make_body("online_score", {"phone": "79175002040", "email": "stupnikov@otus.ru"}),
+            make_body("clients_interests", {"client_ids": [1, 2]}),
+            make_body("online_score", {"first_name": "a", "last_name": "b"}),
+            make_body("clients_interests", {"client_ids": [2]}),
+        ]
+
+        response, code = method_handler({"body": bodies, "headers": {}}, {}, {"store": store})
+
+        assert code == OK
+        assert response == [
+            {"response": {"score": 3.0}, "code": OK},
+            {"response": {1: ["books"], 2: []}, "code": OK},
+            {"response": {"score": 0.5}, "code": OK},
+            {"response": {2: []}, "code": OK},
+        ]
+
+    def test_store_round_trips(self, store):
+        bodies = [make_body("online_score", {"phone": "7917500204" + str(i), "email": "a@b"}) for i in range(10)]
+        bodies += [make_body("clients_interests", {"client_ids": [i]}) for i in range(10)]
+
+        method_handler({"body": bodies, "headers": {}}, {}, {"store": store})
+
+        assert store.round_trips == 3
+
+    def test_per_item_errors(self, store):
+        bad_token = make_body("online_score", {"phone": "79175002040", "email": "stupnikov@otus.ru"})
+        bad_token["token"] = "bad"
+        bodies = [
+            bad_token,
+            make_body("online_score", {"phone": "79175002040"}),
+            make_body("unknown", {}),
+            "not an object",
+            {},
+        ]
+        ctx: dict[str, Any] = {}
+
+        response, code = method_handler({"body": bodies, "headers": {}}, ctx, {"store": store})
+
+        assert code == OK
+        assert [item["code"] for item in response] == [FORBIDDEN, INVALID_REQUEST, INVALID_REQUEST, INVALID_REQUEST, INVALID_REQUEST]
+        assert "error" in response[0]
+        assert len(ctx["batch"]) == len(bodies)
+        assert store.round_trips == 0
+
+    @pytest.mark.parametrize(
+        "bad",
+        [
+            {"login": "h&f", "method": "online_score", "token": "x", "arguments": {}},
+            make_body("online_score", "abc"),
+            make_body("online_score", {"phone": 79175002040, "email": "a@b"}),
+        ],
+    )
+    def test_failing_item_isolated(self, store, bad):
+        bodies = [make_body("online_score", {"first_name": "a", "last_name": "b"}), bad]
+
+        response, code = method_handler({"body": bodies, "headers": {}}, {}, {"store": store})
+
+        assert code == OK
+        assert response == [{"response": {"score": 0.5}, "code": OK}, {"error": "Internal Server Error", "code": INTERNAL_ERROR}]
+
+    def test_failing_bulk_record_isolated(self, store):
+        people = [{"first_name": "a", "last_name": "b"}, {"phone": 79175002040, "email": "a@b"}]
+
+        response, code = method_handler({"body": make_body("online_score_bulk", {"people": people}), "headers": {}}, {}, {"store": store})
+
+        assert code == OK
+        assert response == {"scores": [0.5, None], "errors": {1: "Internal Server Error"}}
+
+    def test_interests_store_error(self, store):
+        def fail(keys):
+            raise RedisConnectionError()
+
+        store.get_many = fail
+        bodies = [
+            make_body("clients_interests", {"client_ids": [1]}),
+            make_body("online_score", {"phone": "79175002040", "email": "stupnikov@otus.ru"}),
+        ]
+
+        response, code = method_handler({"body": bodies, "headers": {}}, {}, {"store": store})
+
+        assert code == OK
+        assert response[0] == {"error": "Store connection error", "code": INTERNAL_ERROR}
+        assert response[1] == {"response": {"score": 3.0}, "code": OK}
@@ -0,0 +1,71 @@
+import asyncio
+import io
+from email.message import Message
+
+import pytest
+
+from src.bodies import MAX_BODY_SIZE, BodyTooLarge, async_read_chunked, body_limit, chunked, content_length, read_chunked
+
+
+def make_headers(**fields: str) -> Message:
+    headers = Message()
+    for name, value in fields.items():
+        headers[name.replace("_", "-")] = value
+    return headers
+
+
+class TestLimits:
+    def test_route_limit_overrides_default(self):
+        settings = {"max_body_size": 100, "body_limits": {"method": 10}}
+
+        assert body_limit(settings, "method") == 10
+        assert body_limit(settings, "other") == 100
+        assert body_limit({}, "method") == MAX_BODY_SIZE
+
+    def test_zero_limit(self):
+        assert body_limit({"max_body_size": 100, "body_limits": {"method": 0}}, "method") == 0
+        assert body_limit({"max_body_size": 0}, "method") == 0
+
+    def test_content_length(self):
+        assert content_length(make_headers(Content_Length="10"), 10) == 10
+        with pytest.raises(BodyTooLarge):
+            content_length(make_headers(Content_Length="11"), 10)
+        with pytest.raises(ValueError):
+            content_length(make_headers(Content_Length="-1"), 10)
+
+    def test_chunked(self):
+        assert chunked(make_headers(Transfer_Encoding="Chunked"))
+        assert not chunked(make_headers(Content_Length="1"))
+        with pytest.raises(ValueError):
+            chunked(make_headers(Transfer_Encoding="gzip, chunked"))
+
+
+class TestReadChunked:
+    def test_read(self):
+        rfile = io.BytesIO(b'4\r\n{"a"\r\n3;ext=1\r\n: 1\r\n1\r\n}\r\n0\r\nTrailer: x\r\n\r\nnext')
+
+        assert read_chunked(rfile, 100) == b'{"a": 1}'
+        assert rfile.read() == b"next"
+
+    def test_rejected_before_reading_over_limit(self):
+        rfile = io.BytesIO(b"4\r\nabcd\r\n10\r\n" + b"x" * 16 + b"\r\n0\r\n\r\n")
+
+        with pytest.raises(BodyTooLarge):
+            read_chunked(rfile, 10)
+        assert rfile.read(16) == b"x" * 16
+
+    @pytest.mark.parametrize("raw", [b"4\r\nab", b"x\r\n", b"4\r\nabcdef\r\n0\r\n\r\n", b"4"])
+    def test_malformed(self, raw):
+        with pytest.raises(ValueError):
+            read_chunked(io.BytesIO(raw), 100)
+
+    def test_async_read(self):
+        async def read(raw: bytes, limit: int) -> bytes:
+            reader = asyncio.StreamReader()
+            reader.feed_data(raw)
+            reader.feed_eof()
+            return await async_read_chunked(reader, limit)
+
+        assert asyncio.run(read(b"2\r\n[1\r\n1\r\n]\r\n0\r\n\r\n", 10)) == b"[1]"
+        with pytest.raises(BodyTooLarge):
+            asyncio.run(read(b"2\r\n[1\r\n9\r\n", 10))
@@ -0,0 +1,135 @@
+import asyncio
+
+import pytest
+from redis.exceptions import ResponseError
+
+from src.api import method_handler
+from src.breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+from src.store import AsyncRedisHandler, RedisHandler
+from tests.conftest import make_body
+
+
+class TestCircuitBreaker:
+    def test_opens_after_consecutive_failures(self, clock):
+        breaker = CircuitBreaker(failure_threshold=3, reset_timeout=10)
+        for _ in range(2):
+            breaker.record_failure()
+        breaker.record_success()
+        for _ in range(2):
+            breaker.record_failure()
+
+        assert breaker.state == CLOSED
+        breaker.record_failure()
+        assert breaker.state == OPEN
+        assert not breaker.allow()
+        assert breaker.stats()["rejected"] == 1
+
+    def test_half_open_probe_closes(self, clock):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, probes=2)
+        breaker.record_failure()
+
+        clock.now += 10
+        assert breaker.allow()
+        assert breaker.state == HALF_OPEN
+        assert breaker.allow()
+        assert not breaker.allow()
+
+        breaker.record_success()
+        assert breaker.state == HALF_OPEN
+        breaker.record_success()
+        assert breaker.state == CLOSED
+        assert breaker.allow()
+
+    def test_half_open_failure_reopens(self, clock):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10)
+        breaker.record_failure()
+        clock.now += 10
+        assert breaker.allow()
+
+        breaker.record_failure()
+
+        assert breaker.state == OPEN
+        clock.now += 5
+        assert not breaker.allow()
+
+    def test_listeners_and_stats(self, clock):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10)
+        seen = []
+        breaker.listeners.append(lambda previous, state: seen.append((previous, state)))
+
+        breaker.record_failure()
+        clock.now += 10
+        breaker.allow()
+        breaker.record_success()
+
+        assert seen == [(CLOSED, OPEN), (OPEN, HALF_OPEN), (HALF_OPEN, CLOSED)]
+        stats = breaker.stats()
+        assert stats["state"] == 0
+        assert stats["transitions_closed_to_open"] == 1
+        assert stats["transitions_half_open_to_closed"] == 1
+
+
+class TestStoreBreaker:
+    def unreachable(self) -> RedisHandler:
+        return RedisHandler(port=1, retries=0, connect_timeout=0.1, breaker=CircuitBreaker(failure_threshold=2, reset_timeout=60))
+
+    def test_fails_fast_once_open(self):
+        store = self.unreachable()
+
+        assert store.cache_get("uid:1") is None
+        assert store.cache_get("uid:1") is None
+        assert store.breaker.state == OPEN
+        with pytest.raises(CircuitOpenError):
+            store.get("i:1")
+        assert store.breaker.stats()["rejected"] == 1
+
+    def test_handler_answers_store_error(self):
+        store = self.unreachable()
+        store.breaker.record_failure()
+        store.breaker.record_failure()
+
+        _, code = method_handler({"body": make_body("clients_interests", {"client_ids": [1, 2]}), "headers": {}}, {}, {"store": store})
+
+        assert code == 500
+        assert store.breaker.stats()["rejected"] == 1
+
+    def test_async_fails_fast_once_open(self):
+        store = AsyncRedisHandler(port=1, retries=0, connect_timeout=0.1, breaker=CircuitBreaker(failure_threshold=1, reset_timeout=60))
+
+        async def scenario():
+            assert await store.cache_get("uid:1") is None
+            with pytest.raises(CircuitOpenError):
+                await store.get_many(["i:1"])
+
+        asyncio.run(scenario())
+        assert store.breaker.state == OPEN
+
+    def test_probe_error_reply_closes(self, clock):
+        store = self.unreachable()
+        store.breaker.record_failure()
+        store.breaker.record_failure()
+        clock.now += 60
+
+        def reply_error():
+            raise ResponseError("WRONGTYPE")
+
+        with pytest.raises(ResponseError):
+            store.call(reply_error)
+
+        assert store.breaker.state == CLOSED
+
+    def test_cancelled_probe_gives_slot_back(self, clock):
+        store = AsyncRedisHandler(port=1, breaker=CircuitBreaker(failure_threshold=1, reset_timeout=10))
+        store.breaker.record_failure()
+        clock.now += 10
+
+        async def scenario():
+            task = asyncio.create_task(store.call(asyncio.sleep, 60))
+            await asyncio.sleep(0)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            return await store.call(asyncio.sleep, 0, "pong")
+
+        assert asyncio.run(scenario()) == "pong"
+        assert store.breaker.state == CLOSED
@@ -0,0 +1,215 @@
+import asyncio
+import threading
+import time
+from typing import Any
+
+from src.cache import BLOCK, AsyncCachedStore, AsyncWriteBehindStore, CachedStore, LocalCache, WriteBehindStore
+from src.scoring import async_get_score, get_score, score_key
+from tests.conftest import AsyncRecordingStore, RecordingStore
+
+
+class BatchStore(RecordingStore):
+    """
+    Writes block while ``release`` is clear
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.release = threading.Event()
+        self.release.set()
+        self.closed = False
+
+    def cache_set_many(self, items: dict[str, Any], expired: int) -> None:
+        self.release.wait(5)
+        super().cache_set_many(items, expired)
+
+    def close(self) -> None:
+        self.closed = True
+
+
+class TestLocalCache:
+    def test_get_set(self):
+        cache = LocalCache(max_size=10, ttl=60)
+        cache.set("a", 1.5)
+
+        assert cache.get("a") == "1.5"
+        assert cache.get("b") is None
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 1
+
+    def test_lru_eviction(self):
+        cache = LocalCache(max_size=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        assert cache.get("b") is None
+        assert cache.get("a") == "1"
+        assert cache.get("c") == "3"
+        assert cache.stats()["evictions"] == 1
+
+    def test_ttl_expiration(self, clock):
+        cache = LocalCache(max_size=10, ttl=60)
+        cache.set("a", 1)
+
+        clock.now += 59
+        assert cache.get("a") == "1"
+        clock.now += 2
+        assert cache.get("a") is None
+        assert cache.stats()["expirations"] == 1
+        assert len(cache) == 0
+
+    def test_ttl_never_exceeds_store_ttl(self, clock):
+        cache = LocalCache(max_size=10, ttl=60)
+        cache.set("a", 1, ttl=10)
+
+        clock.now += 11
+        assert cache.get("a") is None
+
+    def test_thread_safety(self):
+        cache = LocalCache(max_size=50, ttl=60)
+
+        def worker(n: int) -> None:
+            for i in range(1000):
+                cache.set(f"{n}:{i}", i)
+                cache.get(f"{n}:{i - 1}")
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(cache) == 50
+        assert cache.stats()["evictions"] == 8 * 1000 - 50
+
+
+class TestCachedStore:
+    def test_repeated_score_served_locally(self):
+        store = RecordingStore()
+        cached = CachedStore(store, max_size=10, ttl=60)
+
+        first = get_score(cached, phone="79175002040", email="test@example.com")
+        second = get_score(cached, phone="79175002040", email="test@example.com")
+
+        assert first == second == 3.0
+        assert len(store.called("cache_get")) == 1
+        assert len(store.called("cache_set")) == 1
+        assert store.called("cache_set")[0][2] == 3600
+
+    def test_read_through(self):
+        store = RecordingStore()
+        store.cache["uid:1"] = "2.0"
+        cached = CachedStore(store, max_size=10, ttl=60)
+
+        assert cached.cache_get("uid:1") == "2.0"
+        assert cached.cache_get("uid:1") == "2.0"
+        assert store.called("cache_get") == [("uid:1",)]
+
+    def test_async_store(self):
+        store = AsyncRecordingStore()
+        store.cache["uid:1"] = "1.5"
+        cached = AsyncCachedStore(store, max_size=10, ttl=60)
+
+        async def run():
+            return [await cached.cache_get("uid:1") for _ in range(3)]
+
+        assert asyncio.run(run()) == ["1.5", "1.5", "1.5"]
+        assert len(store.called("cache_get")) == 1
+
+
+class TestWriteBehindStore:
+    def test_writes_flushed_in_batches_on_close(self):
+        store = BatchStore()
+        store.release.clear()
+        writer = WriteBehindStore(store, batch_size=100)
+
+        for i in range(10):
+            get_score(writer, phone="7917500%04d" % i, email="test@example.com")
+
+        assert store.called("cache_set_many") == []
+        assert writer.cache_get(score_key(phone="79175000003")) == "3.0"
+        assert writer.cache_get_many([score_key(phone="79175000004"), "uid:missing"]) == ["3.0", None]
+
+        store.release.set()
+        writer.close()
+
+        batches = store.called("cache_set_many")
+        assert sum(len(items) for items, _ in batches) == 10
+        assert len(batches) < 10
+        assert all(expired == 3600 for _, expired in batches)
+        assert store.closed
+        assert writer.stats() == {"queued": 0, "written": 10, "dropped": 0, "flushes": len(batches), "errors": 0}
+
+    def test_drop_oldest_when_full(self):
+        store = BatchStore()
+        store.release.clear()
+        writer = WriteBehindStore(store, max_queue=2, batch_size=1)
+        writer.cache_set("a", 1, 60)
+        while writer.stats()["queued"]:
+            time.sleep(0.001)
+
+        for key in ("b", "c", "b", "d"):
+            writer.cache_set(key, 2, 60)
+        store.release.set()
+        writer.close()
+
+        assert [list(items) for items, _ in store.called("cache_set_many")] == [["a"], ["b"], ["d"]]
+        assert writer.stats()["dropped"] == 1
+
+    def test_batch_being_flushed_is_readable(self):
+        store = BatchStore()
+        store.release.clear()
+        writer = WriteBehindStore(store, batch_size=1)
+        writer.cache_set("a", 1, 60)
+        while writer.stats()["queued"]:
+            time.sleep(0.001)
+
+        assert writer.cache_get("a") == "1"
+        assert writer.cache_get_many(["a", "b"]) == ["1", None]
+
+        store.release.set()
+        writer.close()
+
+        assert writer.cache_get("a") == "1"
+
+    def test_block_waits_for_flush(self):
+        store = BatchStore()
+        writer = WriteBehindStore(store, max_queue=1, batch_size=1, policy=BLOCK)
+
+        writer.cache_set_many({str(i): i for i in range(20)}, 60)
+        writer.close()
+
+        assert len(store.cache) == 20
+        assert writer.stats()["dropped"] == 0
+
+    def test_writes_after_close_go_to_store(self):
+        store = BatchStore()
+        writer = WriteBehindStore(store)
+        writer.close()
+
+        writer.cache_set("a", 1, 60)
+
+        assert store.cache == {"a": "1"}
+
+    def test_async_store(self):
+        class YieldingStore(AsyncRecordingStore):
+            async def cache_set_many(self, items, expired):
+                await asyncio.sleep(0)
+                await super().cache_set_many(items, expired)
+
+        async def run():
+            inner = YieldingStore()
+            writer = AsyncWriteBehindStore(inner, max_queue=4, batch_size=2, policy=BLOCK)
+            scores = [await async_get_score(writer, phone="7917500%04d" % i) for i in range(10)]
+            queued = writer.cache_get(score_key(phone="79175000009"))
+            await writer.close()
+            return inner, scores, await queued
+
+        store, scores, queued = asyncio.run(run())
+
+        assert scores == [1.5] * 10
+        assert queued == "1.5"
+        assert len(store.cache) == 10
+        assert all(len(items) <= 2 for items, _ in store.called("cache_set_many"))
@@ -0,0 +1,101 @@
+import hashlib
+from typing import Any
+
+import pytest
+
+from src.constants import SALT
+
+
+class FakeClock:
+    """
+    Stands in for time.monotonic, tests move ``now`` by hand
+    """
+
+    def __init__(self, now: float = 1000.0) -> None:
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(request, monkeypatch):
+    """
+    Frozen time.monotonic for every module, starting at 1000.0 or at the value given with indirect parametrization
+    """
+    clock = FakeClock(getattr(request, "param", 1000.0))
+    monkeypatch.setattr("time.monotonic", clock)
+    return clock
+
+
+def make_body(method: str, arguments: Any, account: str = "horns&hoofs", login: str = "h&f", token: str | None = None) -> dict[str, Any]:
+    """
+    Method request body signed with the user token of ``account`` and ``login``, unless ``token`` is given
+    """
+    token = token or hashlib.sha512((account + login + SALT).encode("utf-8")).hexdigest()
+    return {"account": account, "login": login, "method": method, "token": token, "arguments": arguments}
+
+
+class RecordingStore:
+    """
+    Store over two plain dicts, ``cache`` and the persistent ``data``, that records every call as ``(op, args)``
+    """
+
+    def __init__(self, data: dict[str, str] | None = None) -> None:
+        self.cache: dict[str, str] = {}
+        self.data: dict[str, str] = dict(data or {})
+        self.calls: list[tuple[str, tuple[Any, ...]]] = []
+
+    @property
+    def round_trips(self) -> int:
+        return len(self.calls)
+
+    def called(self, op: str) -> list[tuple[Any, ...]]:
+        """
+        Arguments of each call of ``op``, in order
+        """
+        return [args for name, args in self.calls if name == op]
+
+    def cache_get(self, key: str) -> str | None:
+        self.calls.append(("cache_get", (key,)))
+        return self.cache.get(key)
+
+    def cache_set(self, key: str, value: Any, expired: int) -> None:
+        self.calls.append(("cache_set", (key, value, expired)))
+        self.cache[key] = str(value)
+
+    def get(self, key: str) -> str | None:
+        self.calls.append(("get", (key,)))
+        return self.data.get(key)
+
+    def get_many(self, keys: list[str]) -> list[str | None]:
+        self.calls.append(("get_many", (list(keys),)))
+        return [self.data.get(key) for key in keys]
+
+    def cache_get_many(self, keys: list[str]) -> list[str | None]:
+        self.calls.append(("cache_get_many", (list(keys),)))
+        return [self.cache.get(key) for key in keys]
+
+    def cache_set_many(self, items: dict[str, Any], expired: int) -> None:
+        self.calls.append(("cache_set_many", (dict(items), expired)))
+        self.cache.update({key: str(value) for key, value in items.items()})
+
+
+class AsyncRecordingStore(RecordingStore):
+    async def cache_get(self, key: str) -> str | None:
+        return super().cache_get(key)
+
+    async def cache_set(self, key: str, value: Any, expired: int) -> None:
+        super().cache_set(key, value, expired)
+
+    async def get(self, key: str) -> str | None:
+        return super().get(key)
+
+    async def get_many(self, keys: list[str]) -> list[str | None]:
+        return super().get_many(keys)
+
+    async def cache_get_many(self, keys: list[str]) -> list[str | None]:
+        return super().cache_get_many(keys)
+
+    async def cache_set_many(self, items: dict[str, Any], expired: int) -> None:
+        super().cache_set_many(items, expired)
@@ -1,3 +1,6 @@
+import datetime
+import random
+import re
 from contextlib import nullcontext as does_not_raise
 from typing import Any
 
@@ -7,7 +10,7 @@ from _pytest.raises import RaisesExc
 from src.datas import (
     CharField, EmailField, PhoneField, DateField,
     BirthDayField, GenderField, ClientIDsField,
-    ClientsInterestsRequest, OnlineScoreRequest, MethodRequest
+    ClientsInterestsRequest, OnlineScoreRequest, MethodRequest, parse_date
 )
 
 
@@ -257,3 +260,77 @@ class TestRequestClasses:
         assert not request.is_admin
         request.login = "admin"
         assert request.is_admin
+
+
+class TestRequestSlots:
+    @pytest.mark.parametrize("cls", [ClientsInterestsRequest, OnlineScoreRequest, MethodRequest])
+    def test_no_instance_dict(self, cls: type) -> None:
+        request = cls()
+
+        assert not hasattr(request, "__dict__")
+        with pytest.raises(AttributeError):
+            request.unknown = 1
+
+    def test_unset_field_is_none(self) -> None:
+        request = OnlineScoreRequest()
+
+        assert request.phone is None
+        request.phone = "79175002040"
+        assert request.phone == "79175002040"
+
+    def test_slots_follow_fields(self) -> None:
+        assert set(OnlineScoreRequest.__slots__) == {"_first_name", "_last_name", "_email", "_phone", "_birthday", "_gender"}
+
+
+class TestFastDateParsing:
+    @staticmethod
+    def legacy_date(value: Any) -> bool:
+        try:
+            return isinstance(value, str) and bool(re.match(r"^\d{2}\.\d{2}\.\d{4}$", value)) and bool(datetime.datetime.strptime(value, "%d.%m.%Y"))
+        except ValueError:
+            return False
+
+    @classmethod
+    def legacy_birthday(cls, value: Any) -> bool:
+        if not cls.legacy_date(value):
+            return False
+        date = datetime.datetime.strptime(value, "%d.%m.%Y").date()
+        return datetime.date.today() - datetime.timedelta(days=365 * 70) <= date <= datetime.date.today()
+
+    @staticmethod
+    def candidates() -> list[Any]:
+        rnd = random.Random(7)
+        digits = "0123456789"
+        values: list[Any] = [
+            "", "01.01.2000", "29.02.2000", "29.02.1900", "31.04.2000", "00.01.2000", "01.00.2000", "01.13.2000",
+            "01.01.0000", "01.01.0001", "31.12.9999", "01.01.2000\n", " 1.01.2000", "1.1.2000", "01-01-2000",
+            "01.01.20000", "01.01.200", "01.01.٢٠٠٠", "1٥.01.2000", "٠١.٠١.٢٠٠٠", "01.01.2000 ", None, 123, ["01.01.2000"],
+        ]
+        for _ in range(3000):
+            day = "".join(rnd.choice(digits) for _ in range(2))
+            month = "".join(rnd.choice(digits[:2]) + rnd.choice(digits) for _ in range(1))
+            year = str(rnd.randint(1900, 2100))
+            values.append(f"{day}.{month}.{year}")
+        today = datetime.date.today()
+        for days in (0, 1, 365 * 70 - 1, 365 * 70, 365 * 70 + 1, -1):
+            values.append((today - datetime.timedelta(days=days)).strftime("%d.%m.%Y"))
+        return values
+
+    def test_date_field_matches_strptime(self) -> None:
+        field = DateField()
+        for value in self.candidates():
+            assert field.validate(value) == self.legacy_date(value), value
+
+    def test_birthday_field_matches_strptime(self) -> None:
+        field = BirthDayField()
+        for value in self.candidates():
+            assert field.validate(value) == self.legacy_birthday(value), value
+
+    def test_parse_date_is_memoized(self) -> None:
+        parse_date.cache_clear()
+        parse_date("01.01.2000")
+        parse_date("01.01.2000")
+
+        info = parse_date.cache_info()
+        assert info.hits == 1
+        assert info.maxsize is not None
@@ -0,0 +1,69 @@
+import json
+
+import pytest
+
+from src.constants import ADMIN_SCORE, ERRORS, FORBIDDEN, INTERNAL_ERROR, NOT_FOUND, OK, STORE_ERROR, ErrorMessage
+from src.encoding import ENCODER, JSON_ENCODERS, ResponseEncoder, make_envelope, response_head
+
+
+class TestResponseEncoder:
+    @pytest.mark.parametrize(
+        "response, code",
+        [
+            (ErrorMessage.FORBIDDEN.value, FORBIDDEN),
+            ({}, NOT_FOUND),
+            (STORE_ERROR, INTERNAL_ERROR),
+            (ADMIN_SCORE, OK),
+            ({"score": 3.0}, OK),
+            ("Invalid phone", 422),
+            ([{"response": {"score": 1.5}, "code": OK}], OK),
+        ],
+    )
+    def test_same_bytes_as_json_dumps(self, response, code):
+        assert ENCODER.encode(response, code) == json.dumps(make_envelope(response, code)).encode("utf-8")
+
+    def test_static_replies_served_from_one_buffer(self):
+        assert ENCODER.encode({}, FORBIDDEN) is ENCODER.encode(ErrorMessage.FORBIDDEN.value, FORBIDDEN)
+        assert ENCODER.encode(ADMIN_SCORE, OK) is ENCODER.encode(ADMIN_SCORE, OK)
+        assert all(ENCODER.encode({}, code) is ENCODER.static[message, code] for code, message in ERRORS.items())
+
+    def test_equal_dict_is_encoded_not_matched(self):
+        encoder = ResponseEncoder()
+        encoder.static[ResponseEncoder.key(ADMIN_SCORE, OK)] = b"registered"
+
+        assert encoder.encode(ADMIN_SCORE, OK) == b"registered"
+        assert encoder.encode({"score": 42}, OK) == b'{"response": {"score": 42}, "code": 200}'
+
+    def test_pluggable_dumps(self):
+        calls = []
+
+        def dumps(value):
+            calls.append(value)
+            return json.dumps(value, separators=(",", ":")).encode("utf-8")
+
+        encoder = ResponseEncoder(dumps)
+        registered = len(calls)
+
+        assert encoder.encode({}, FORBIDDEN) == b'{"error":"Forbidden","code":403}'
+        assert encoder.encode({"score": 3.0}, OK) == b'{"response":{"score":3.0},"code":200}'
+        assert len(calls) == registered + 1
+
+    def test_compact_encoder(self):
+        encoder = ResponseEncoder(JSON_ENCODERS["compact"]())
+
+        assert json.loads(encoder.encode({1: ["cars"]}, OK)) == {"response": {"1": ["cars"]}, "code": OK}
+
+
+class TestResponseHead:
+    def test_content_length(self):
+        head = response_head(OK, "application/json", 12)
+
+        assert head.startswith(b"HTTP/1.1 200 OK\r\nDate: ")
+        assert head.endswith(b"Content-Type: application/json\r\nContent-Length: 12\r\n\r\n")
+
+    def test_chunked_with_connection(self):
+        head = response_head(NOT_FOUND, "application/json", None, "close")
+
+        assert head.startswith(b"HTTP/1.1 404 Not Found\r\n")
+        assert head.endswith(b"Transfer-Encoding: chunked\r\nConnection: close\r\n\r\n")
+        assert b"Content-Length" not in head
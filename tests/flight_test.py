@@ -0,0 +1,163 @@
+import asyncio
+import threading
+import time
+from typing import Any
+
+import pytest
+
+from src.flight import AsyncSingleFlight, SingleFlight
+from src.scoring import async_get_score, get_score
+
+
+class SlowStore:
+    """
+    Score cache whose lookups block until ``release`` is set, so concurrent callers overlap
+    """
+
+    def __init__(self):
+        self.cache = {}
+        self.release = threading.Event()
+        self.cache_get_calls = 0
+        self.cache_set_calls = 0
+
+    def cache_get(self, key: str) -> str | None:
+        self.cache_get_calls += 1
+        self.release.wait(5)
+        return self.cache.get(key)
+
+    def cache_set(self, key: str, value: Any, expired: int) -> None:
+        self.cache_set_calls += 1
+        self.cache[key] = str(value)
+
+
+class AsyncSlowStore:
+    def __init__(self):
+        self.cache = {}
+        self.release = asyncio.Event()
+        self.cache_get_calls = 0
+        self.cache_set_calls = 0
+
+    async def cache_get(self, key: str) -> str | None:
+        self.cache_get_calls += 1
+        await self.release.wait()
+        return self.cache.get(key)
+
+    async def cache_set(self, key: str, value: Any, expired: int) -> None:
+        self.cache_set_calls += 1
+        self.cache[key] = str(value)
+
+
+def run_threads(count: int, target) -> tuple[list[threading.Thread], list[Any]]:
+    results: list[Any] = [None] * count
+
+    def worker(i: int) -> None:
+        try:
+            results[i] = target()
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+class TestSingleFlight:
+    def test_concurrent_calls_share_one_result(self):
+        flight = SingleFlight()
+        started, release = threading.Event(), threading.Event()
+        calls = []
+
+        def work():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return 42
+
+        threads, results = run_threads(8, lambda: flight.do("key", work))
+        started.wait(5)
+        while flight.followers < 7:
+            time.sleep(0.001)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        assert results == [42] * 8
+        assert len(calls) == 1
+        assert flight.stats() == {"in_flight": 0, "leaders": 1, "followers": 7}
+
+    def test_error_shared_and_key_released(self):
+        flight = SingleFlight()
+
+        with pytest.raises(ValueError):
+            flight.do("key", lambda: int("x"))
+
+        assert flight.do("key", lambda: 1) == 1
+        assert flight.stats()["leaders"] == 2
+
+    def test_get_score_coalesces_cache_lookup_and_fill(self):
+        store, flight = SlowStore(), SingleFlight()
+
+        threads, results = run_threads(5, lambda: get_score(store, phone="79175002040", email="test@example.com", flight=flight))
+        while flight.followers < 4:
+            time.sleep(0.001)
+        store.release.set()
+        for thread in threads:
+            thread.join()
+
+        assert results == [3.0] * 5
+        assert store.cache_get_calls == 1
+        assert store.cache_set_calls == 1
+
+
+class TestAsyncSingleFlight:
+    def test_get_score_coalesces_cache_lookup_and_fill(self):
+        async def scenario():
+            store, flight = AsyncSlowStore(), AsyncSingleFlight()
+            calls = [async_get_score(store, phone="79175002040", email="test@example.com", flight=flight) for _ in range(5)]
+            other = async_get_score(store, first_name="a", last_name="b", flight=flight)
+            gathered = asyncio.gather(*calls, other)
+            await asyncio.sleep(0)
+            store.release.set()
+            return store, flight, await gathered
+
+        store, flight, results = asyncio.run(scenario())
+
+        assert results == [3.0] * 5 + [0.5]
+        assert store.cache_get_calls == 2
+        assert store.cache_set_calls == 2
+        assert flight.stats() == {"in_flight": 0, "leaders": 2, "followers": 4}
+
+    def test_cancelled_leader_does_not_cancel_followers(self):
+        async def scenario():
+            flight = AsyncSingleFlight()
+            release = asyncio.Event()
+
+            async def work():
+                await release.wait()
+                return 42
+
+            leader = asyncio.ensure_future(flight.do("key", work))
+            follower = asyncio.ensure_future(flight.do("key", work))
+            await asyncio.sleep(0)
+            leader.cancel()
+            await asyncio.sleep(0)
+            release.set()
+            return leader, await follower
+
+        leader, result = asyncio.run(scenario())
+
+        assert leader.cancelled()
+        assert result == 42
+
+    def test_error_shared(self):
+        async def fail():
+            raise ValueError("boom")
+
+        async def scenario():
+            flight = AsyncSingleFlight()
+            return await asyncio.gather(flight.do("key", fail), flight.do("key", fail), return_exceptions=True)
+
+        first, second = asyncio.run(scenario())
+
+        assert isinstance(first, ValueError) and first is second
@@ -0,0 +1,71 @@
+import asyncio
+import datetime
+import json
+from argparse import Namespace
+from typing import Any
+
+import pytest
+
+from benchmarks.loadgen import LoadGenerator, read_response
+from benchmarks.payloads import admin_token
+
+MIX = {"interests_ratio": 0.3, "admin_ratio": 0.1, "invalid_ratio": 0.0, "client_ids": (1, 3)}
+
+
+def read(data: bytes) -> tuple[int, bytes, bool]:
+    async def scenario():
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        return await read_response(reader)
+
+    return asyncio.run(scenario())
+
+
+class TestReadResponse:
+    def test_content_length(self):
+        assert read(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\n{}") == (200, b"{}", True)
+
+    def test_chunked(self):
+        data = b'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\nConnection: close\r\n\r\n5\r\n{"a":\r\n2\r\n1}\r\n0\r\n\r\n'
+
+        assert read(data) == (200, b'{"a":1}', False)
+
+    @pytest.mark.parametrize("data", [b"garbage\r\n\r\n", b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\nzz\r\n"])
+    def test_malformed(self, data):
+        with pytest.raises(ValueError):
+            read(data)
+
+
+def make_args(port: int, **mix: Any) -> Namespace:
+    return Namespace(host="localhost", port=port, path="/method", concurrency=1, rps=0, duration=0, requests=3, timeout=1, seed=42, **{**MIX, **mix})
+
+
+class TestLoadGenerator:
+    def test_malformed_response_is_an_error(self):
+        async def answer(reader, writer):
+            await reader.readuntil(b"\r\n\r\n")
+            writer.write(b"garbage\r\n\r\n")
+            await writer.drain()
+            writer.close()
+
+        async def scenario():
+            server = await asyncio.start_server(answer, "localhost", 0)
+            async with server:
+                return await LoadGenerator(make_args(server.sockets[0].getsockname()[1])).run()
+
+        result = asyncio.run(scenario())
+
+        assert result["requests"] == 3
+        assert sum(count for name, count in result["outcomes"].items() if name.endswith(" ValueError")) == 3
+
+    def test_admin_tokens_follow_the_hour(self):
+        generator = LoadGenerator(make_args(8080, admin_ratio=1.0))
+        later = datetime.datetime.now() + datetime.timedelta(hours=1)
+
+        for index in range(3):
+            _, raw = generator.request(index, later)
+            head, _, body = raw.partition(b"\r\n\r\n")
+
+            assert json.loads(body)["token"] == admin_token(later)
+            assert head.endswith(b"Content-Length: %d" % len(body))
@@ -0,0 +1,135 @@
+import json
+import logging
+import os
+import threading
+
+import pytest
+
+from src.logs import BackgroundHandler, RequestLog, RequestRecord
+
+
+class RecordingHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.lines = []
+        self.threads = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.lines.append(self.format(record))
+        self.threads.append(threading.current_thread())
+
+
+@pytest.fixture
+def logger():
+    logger = logging.getLogger("logs_test")
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    handler = RecordingHandler()
+    logger.addHandler(handler)
+    yield logger
+    logger.removeHandler(handler)
+    logger.setLevel(logging.NOTSET)
+
+
+class TestRequestLog:
+    def test_single_json_line(self, logger):
+        RequestLog(logger=logger).log("/method", b'{"a": 1}', b'{"code": 200}', {"request_id": "r1", "code": 200, "has": ["phone"]})
+
+        [line] = logger.handlers[0].lines
+        assert "\n" not in line
+        assert json.loads(line) == {
+            "path": "/method",
+            "request_id": "r1",
+            "code": 200,
+            "has": ["phone"],
+            "body": '{"a": 1}',
+            "response": '{"code": 200}',
+        }
+
+    def test_body_truncation(self):
+        record = RequestRecord("/method", b"x" * 100, None, {"code": 200}, body_limit=10)
+
+        assert json.loads(str(record))["body"] == "x" * 10 + "...(+90 bytes)"
+
+    def test_bodies_left_out(self):
+        record = RequestRecord("/method", b"x" * 100, b"y", {"code": 200}, body_limit=0)
+
+        assert json.loads(str(record)) == {"path": "/method", "code": 200}
+
+    def test_sampling_keeps_errors(self, logger):
+        request_log = RequestLog(sample_rate=0, logger=logger)
+        for code in (200, 200, 422, 500):
+            request_log.log("/method", None, None, {"code": code})
+
+        assert [json.loads(line)["code"] for line in logger.handlers[0].lines] == [422, 500]
+
+    def test_sampling_rate(self, logger, monkeypatch):
+        values = iter([0.1, 0.9, 0.3])
+        monkeypatch.setattr("src.logs.random.random", lambda: next(values))
+        request_log = RequestLog(sample_rate=0.5, logger=logger)
+        for _ in range(3):
+            request_log.log("/method", None, None, {"code": 200})
+
+        assert len(logger.handlers[0].lines) == 2
+
+    def test_not_formatted_when_disabled(self, logger):
+        logger.setLevel(logging.ERROR)
+
+        class Body(bytes):
+            def __getitem__(self, item):
+                raise AssertionError("formatted")
+
+        RequestLog(logger=logger).log("/method", Body(b"x"), None, {"code": 200})
+
+        assert logger.handlers[0].lines == []
+
+
+class TestBackgroundHandler:
+    def test_formats_on_writer_thread(self):
+        target = RecordingHandler()
+        handler = BackgroundHandler(target)
+        logger = logging.getLogger("background_test")
+        logger.propagate = False
+        logger.addHandler(handler)
+        try:
+            for i in range(100):
+                logger.warning("line %s", i)
+        finally:
+            logger.removeHandler(handler)
+            handler.close()
+
+        assert target.lines == ["line %s" % i for i in range(100)]
+        assert threading.current_thread() not in target.threads
+
+    def test_restart_after_fork(self):
+        target = RecordingHandler()
+        handler = BackgroundHandler(target)
+        try:
+            listener = handler.listener
+            handler.restart()
+            handler.handle(logging.makeLogRecord({"msg": "after fork", "levelno": logging.INFO}))
+            handler.close()
+
+            assert handler.listener is not listener
+            assert target.lines == ["after fork"]
+        finally:
+            listener.stop()
+
+        handler.restart()
+        assert handler.listener._thread is None
+
+    @pytest.mark.filterwarnings("ignore:This process:DeprecationWarning")
+    def test_forked_child_logs(self, tmp_path):
+        path = tmp_path / "child.log"
+        target = logging.FileHandler(path)
+        handler = BackgroundHandler(target)
+        pid = os.fork()
+        if pid == 0:
+            handler.handle(logging.makeLogRecord({"msg": "from child", "levelno": logging.INFO}))
+            handler.close()
+            os._exit(0)
+        os.waitpid(pid, 0)
+        handler.close()
+        target.close()
+
+        assert path.read_text() == "from child\n"
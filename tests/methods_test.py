@@ -1,5 +1,6 @@
 import datetime
 import hashlib
+import random
 from contextlib import nullcontext as does_not_raise
 from typing import Any, Counter
 
@@ -8,7 +9,7 @@ from _pytest.raises import RaisesExc
 
 from src.constants import ADMIN_LOGIN, ADMIN_SALT, SALT
 from src.datas import ClientsInterestsRequest, MethodRequest, OnlineScoreRequest
-from src.methods import check_auth, validate_clients_interests, validate_online_score
+from src.methods import HourlyDigest, check_auth, user_digest, validate_clients_interests, validate_online_score, validate_online_score_bulk
 
 
 class TestCheckAuth:
@@ -219,3 +220,100 @@ class TestValidateClientsInterests:
 
             assert nclients == result_nclients
             assert isinstance(result, list)
+
+
+class TestValidateOnlineScoreBulk:
+    def test_records_validated_one_by_one(self) -> None:
+        people = [{"phone": "79175002040", "email": "a@b"}, {"phone": "79175002040"}, {"gender": 4, "birthday": "01.01.2000"}]
+
+        result = validate_online_score_bulk({"people": people})
+
+        assert isinstance(result, tuple)
+        records, errors = result
+        assert isinstance(records[0], OnlineScoreRequest)
+        assert records[1:] == [None, None]
+        assert errors == {1: "No couple", 2: "Incorrect gender value"}
+
+    @pytest.mark.parametrize("arguments", [{}, {"people": []}, {"people": [1]}, {"people": None}])
+    def test_invalid_people(self, arguments: dict[str, Any]) -> None:
+        assert validate_online_score_bulk(arguments) == ["Incorrect people value"]
+
+
+class TestCompiledValidators:
+    @staticmethod
+    def reference_online_score(arguments: dict[str, Any]) -> tuple[Any, list[str]]:
+        score = OnlineScoreRequest()
+        errors = []
+        has = []
+        for key in dir(OnlineScoreRequest):
+            if not key.startswith("__"):
+                try:
+                    value = arguments.get(key, None)
+                    setattr(score, key, value)
+                    if value is not None:
+                        has.append(key)
+                except ValueError:
+                    errors.append(f"Incorrect {key} value")
+        if errors:
+            return errors, has
+        pairs = (("phone", "email"), ("birthday", "gender"), ("first_name", "last_name"))
+        if any(arguments.get(a) is not None and arguments.get(b) is not None for a, b in pairs):
+            return score, has
+        return ["No couple"], has
+
+    def test_matches_descriptor_assignment(self) -> None:
+        rnd = random.Random(42)
+        values = {
+            "phone": [None, "79175002040", 79175002040, "89175002040", "", 1],
+            "email": [None, "a@b.c", "abc", "", 5],
+            "birthday": [None, "01.01.2000", "01.01.1890", "XXX", "", "31.02.2000"],
+            "gender": [None, 0, 1, 2, 3, "1"],
+            "first_name": [None, "a", "", 1],
+            "last_name": [None, "b", "", 2],
+        }
+        for _ in range(500):
+            arguments = {key: rnd.choice(options) for key, options in values.items() if rnd.random() < 0.7}
+
+            result, has = validate_online_score(arguments)
+            expected, expected_has = self.reference_online_score(arguments)
+
+            assert has == expected_has
+            if isinstance(expected, list):
+                assert result == expected
+            else:
+                assert isinstance(result, OnlineScoreRequest)
+                for key in values:
+                    assert getattr(result, key) == getattr(expected, key)
+
+
+class TestAuthCache:
+    @staticmethod
+    def admin_token(moment: datetime.datetime) -> bytes:
+        return hashlib.sha512((moment.strftime("%Y%m%d%H") + ADMIN_SALT).encode("utf-8")).hexdigest().encode("utf-8")
+
+    def test_hourly_digest_boundary(self) -> None:
+        digest = HourlyDigest(ADMIN_SALT)
+        before = datetime.datetime(2024, 5, 1, 10, 59, 59, 999000)
+        after = datetime.datetime(2024, 5, 1, 11, 0, 0)
+
+        assert digest.get(before.timestamp()) == self.admin_token(before)
+        assert digest.get(after.timestamp()) == self.admin_token(after)
+        assert digest.get(before.timestamp()) == self.admin_token(before)
+
+    def test_user_digest_cached(self) -> None:
+        user_digest.cache_clear()
+        request = TestCheckAuth.create_method_request(
+            {"account": "horns&hoofs", "login": "h&f", "method": "online_score", "token": "", "arguments": {}}
+        )
+        request.token = TestCheckAuth.get_valid_token({"account": "horns&hoofs", "login": "h&f"})
+
+        assert check_auth(request)
+        assert check_auth(request)
+        assert user_digest.cache_info().hits == 1
+
+    def test_non_ascii_token(self) -> None:
+        request = TestCheckAuth.create_method_request(
+            {"account": "horns&hoofs", "login": "h&f", "method": "online_score", "token": "токен", "arguments": {}}
+        )
+
+        assert not check_auth(request)
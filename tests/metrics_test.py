@@ -0,0 +1,117 @@
+import asyncio
+from typing import Any
+
+import pytest
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from src.api import method_handler
+from src.metrics import AsyncInstrumentedStore, Histogram, InstrumentedStore, Metrics, format_labels, stats_collector
+from src.scoring import get_score
+from tests.conftest import AsyncRecordingStore, RecordingStore, make_body
+
+
+class TestInstruments:
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = Histogram("latency", "help", ("method",), buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 2.0):
+            histogram.observe(value, "a")
+
+        assert histogram.collect() == [
+            'latency_bucket{method="a",le="0.1"} 2',
+            'latency_bucket{method="a",le="1.0"} 3',
+            'latency_bucket{method="a",le="+Inf"} 4',
+            'latency_sum{method="a"} 2.65',
+            'latency_count{method="a"} 4',
+        ]
+        assert histogram.count("a") == 4
+
+    def test_label_escaping(self):
+        assert format_labels(("a",), ('x"y\\z\n',)) == '{a="x\\"y\\\\z\\n"}'
+
+    def test_render(self):
+        metrics = Metrics()
+        metrics.collectors.append(stats_collector("pool", "Pool stats", lambda: {"in_use": 2, "name": "redis"}))
+        metrics.in_flight.inc()
+
+        text = metrics.render()
+
+        assert "# TYPE api_requests_in_flight gauge\napi_requests_in_flight 1\n" in text
+        assert "# TYPE api_request_duration_seconds histogram\n" in text
+        assert 'pool{stat="in_use"} 2.0\n' in text
+        assert "redis" not in text
+
+
+class TestRequestMetrics:
+    def test_method_handler_timings(self):
+        metrics = Metrics()
+        ctx: dict[str, Any] = {}
+        body = make_body("online_score", {"phone": "79175002040", "email": "stupnikov@otus.ru"})
+
+        _, code = method_handler({"body": body, "headers": {}}, ctx, {"store": RecordingStore()})
+        ctx["code"] = code
+        metrics.observe_request(ctx, 0.001)
+
+        assert metrics.requests.get("online_score", "200") == 1
+        assert metrics.latency.count("online_score") == 1
+        assert metrics.auth.count() == 1
+        assert metrics.validation.count("online_score") == 1
+
+    def test_batch_items_timed(self):
+        metrics = Metrics()
+        ctx: dict[str, Any] = {}
+        bodies = [make_body("online_score", {"first_name": "a", "last_name": "b"}), make_body("clients_interests", {"client_ids": [1]}), {}]
+
+        _, code = method_handler({"body": bodies, "headers": {}}, ctx, {"store": RecordingStore()})
+        ctx["code"] = code
+        metrics.observe_request(ctx, 0.001)
+
+        assert metrics.requests.get("batch", "200") == 1
+        assert metrics.auth.count() == 3
+        assert metrics.validation.count("online_score") == 1
+        assert metrics.validation.count("clients_interests") == 1
+
+    def test_unknown_method_label(self):
+        metrics = Metrics()
+        metrics.observe_request({"method": "anything", "code": 422}, 0.001)
+
+        assert metrics.requests.get("unknown", "422") == 1
+
+
+class TestInstrumentedStore:
+    def test_store_timings_and_score_cache_hits(self):
+        metrics = Metrics()
+        store = InstrumentedStore(RecordingStore(), metrics)
+
+        get_score(store, phone="79175002040", email="test@example.com")
+        get_score(store, phone="79175002040", email="test@example.com")
+        store.cache_get_many(["uid:missing", next(iter(store.store.cache))])
+
+        assert metrics.store.count("cache_get") == 2
+        assert metrics.store.count("cache_set") == 1
+        assert metrics.score_cache.get("hit") == 2
+        assert metrics.score_cache.get("miss") == 2
+
+    def test_errors_counted_and_raised(self):
+        def fail(key):
+            raise RedisConnectionError()
+
+        metrics = Metrics()
+        failing = RecordingStore()
+        failing.get = fail
+        store = InstrumentedStore(failing, metrics)
+
+        with pytest.raises(RedisConnectionError):
+            store.get("i:1")
+
+        assert metrics.store_errors.get("get") == 1
+        assert metrics.store.count("get") == 0
+
+    def test_async_store(self):
+        inner = AsyncRecordingStore()
+        inner.cache["uid:1"] = "1.5"
+        metrics = Metrics()
+        store = AsyncInstrumentedStore(inner, metrics)
+
+        assert asyncio.run(store.cache_get("uid:1")) == "1.5"
+        assert metrics.store.count("cache_get") == 1
+        assert metrics.score_cache.get("hit") == 1
@@ -0,0 +1,73 @@
+import asyncio
+import pstats
+from typing import Any
+
+from src.api import async_method_handler, method_handler
+from src.profiling import PROFILE_HEADER, RequestProfiler, report_method
+from tests.conftest import AsyncRecordingStore, RecordingStore, make_body
+
+
+def handle(profiler: RequestProfiler, body: dict[str, Any], headers: dict[str, str] | None = None) -> tuple[Any, int]:
+    request, ctx, settings = {"body": body, "headers": headers or {}}, {}, {"store": RecordingStore()}
+    return profiler.run(headers or {}, ctx, lambda: method_handler(request, ctx, settings))
+
+
+class TestRequestProfiler:
+    def test_stats_per_method(self):
+        profiler = RequestProfiler(sample_rate=1)
+
+        for _ in range(3):
+            assert handle(profiler, make_body("online_score", {"phone": "79175002040", "email": "a@b.c"})) == ({"score": 3.0}, 200)
+        handle(profiler, make_body("clients_interests", {"client_ids": [1, 2]}))
+        handle(profiler, make_body("online_score", {}, token="bad"))
+
+        assert profiler.requests == {"online_score": 3, "clients_interests": 1, "unknown": 1}
+        functions = {function for _, _, function in profiler.profiles["online_score"].stats}
+        assert {"check_auth", "get_score"} <= functions
+        report = profiler.report("clients_interests")
+        assert report.startswith("clients_interests: 1 requests")
+        assert "online_score" not in report
+
+    def test_token_header(self):
+        profiler = RequestProfiler(token="s3cret")
+        body = make_body("online_score", {"first_name": "a", "last_name": "b"})
+
+        handle(profiler, body)
+        handle(profiler, body, {PROFILE_HEADER: "wrong"})
+        handle(profiler, body, {PROFILE_HEADER: "s3cret"})
+
+        assert profiler.requests == {"online_score": 1}
+        assert not RequestProfiler().authorized({PROFILE_HEADER: ""})
+
+    def test_one_request_at_a_time(self):
+        profiler = RequestProfiler(sample_rate=1)
+        body = make_body("online_score", {"first_name": "a", "last_name": "b"})
+
+        # The request handled while another one is profiled runs unprofiled
+        assert profiler.run({}, {}, lambda: handle(profiler, body)) == ({"score": 0.5}, 200)
+        assert profiler.stats() == {"profiled": 1, "skipped": 1}
+
+    def test_async_run(self):
+        profiler = RequestProfiler(sample_rate=1)
+        request = {"body": make_body("online_score", {"first_name": "a", "last_name": "b"}), "headers": {}}
+
+        async def scenario():
+            ctx = {}
+            return await profiler.async_run({}, ctx, lambda: async_method_handler(request, ctx, {"store": AsyncRecordingStore()}))
+
+        assert asyncio.run(scenario()) == ({"score": 0.5}, 200)
+        assert profiler.requests == {"online_score": 1}
+
+    def test_dump_on_close(self, tmp_path):
+        profiler = RequestProfiler(sample_rate=1, directory=str(tmp_path / "profiles"))
+        handle(profiler, make_body("online_score", {"first_name": "a", "last_name": "b"}))
+
+        profiler.close()
+
+        (path,) = (tmp_path / "profiles").iterdir()
+        assert path.name.startswith("online_score.")
+        assert pstats.Stats(str(path)).total_calls > 0
+
+    def test_report_method(self):
+        assert report_method("method=online_score") == "online_score"
+        assert report_method("") is None
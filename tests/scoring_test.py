@@ -5,7 +5,7 @@ from typing import Any
 
 import pytest
 
-from src.scoring import get_score, get_interests
+from src.scoring import get_score, get_scores, get_interests, get_interests_many
 
 
 class MockStore:
@@ -15,6 +15,7 @@ class MockStore:
         self.cache_get_calls = []
         self.cache_set_calls = []
         self.get_calls = []
+        self.get_many_calls = []
 
     def cache_get(self, key: str) -> str | None:
         self.cache_get_calls.append(key)
@@ -28,6 +29,18 @@ class MockStore:
         self.get_calls.append(key)
         return self.storage.get(key)
 
+    def get_many(self, keys: list[str]) -> list[str | None]:
+        self.get_many_calls.append(keys)
+        return [self.storage.get(key) for key in keys]
+
+    def cache_get_many(self, keys: list[str]) -> list[str | None]:
+        self.cache_get_calls.append(keys)
+        return [self.cache.get(key) for key in keys]
+
+    def cache_set_many(self, items: dict[str, Any], expired: int) -> None:
+        self.cache_set_calls.append((items, expired))
+        self.cache.update({key: str(value) for key, value in items.items()})
+
 
 class TestGetScore:
     @pytest.fixture
@@ -136,3 +149,73 @@ class TestGetInterests:
 
         with pytest.raises(json.JSONDecodeError):
             get_interests(mock_store, cid)
+
+
+class TestGetInterestsMany:
+    @pytest.fixture
+    def mock_store(self):
+        return MockStore()
+
+    def test_single_round_trip(self, mock_store):
+        mock_store.storage["i:1"] = json.dumps(["sport"])
+        mock_store.storage["i:3"] = json.dumps(["books", "music"])
+
+        result = get_interests_many(mock_store, [1, 2, 3])
+
+        assert result == {1: ["sport"], 2: [], 3: ["books", "music"]}
+        assert mock_store.get_many_calls == [["i:1", "i:2", "i:3"]]
+        assert not mock_store.get_calls
+
+    def test_duplicates_fetched_once(self, mock_store):
+        mock_store.storage["i:1"] = json.dumps(["sport"])
+
+        result = get_interests_many(mock_store, [1, 2, 1, 1])
+
+        assert result == {1: ["sport"], 2: []}
+        assert mock_store.get_many_calls == [["i:1", "i:2"]]
+
+    def test_empty(self, mock_store):
+        assert get_interests_many(mock_store, []) == {}
+
+
+class TestGetScores:
+    @pytest.fixture
+    def mock_store(self):
+        return MockStore()
+
+    def test_matches_get_score(self, mock_store):
+        people = [
+            {"phone": "79175002040", "email": "test@example.com"},
+            {"first_name": "John", "last_name": "Doe"},
+            {"birthday": "01.01.2000", "gender": 1},
+        ]
+
+        scores = get_scores(mock_store, people)
+
+        assert scores == [get_score(MockStore(), **person) for person in people]
+
+    def test_one_round_trip_each_way(self, mock_store):
+        people = [{"phone": "79175002040", "email": "test@example.com"}, {"first_name": "John", "last_name": "Doe"}]
+        get_scores(mock_store, people)
+
+        assert len(mock_store.cache_get_calls) == 1
+        assert len(mock_store.cache_set_calls) == 1
+        items, expired = mock_store.cache_set_calls[0]
+        assert len(items) == 2
+        assert expired == 60 * 60
+
+    def test_cached_scores_not_recomputed(self, mock_store):
+        people = [{"phone": "79175002040", "email": "test@example.com"}, {"first_name": "John", "last_name": "Doe"}]
+        get_scores(mock_store, people)
+        mock_store.cache_set_calls.clear()
+
+        scores = get_scores(mock_store, people + people)
+
+        assert scores == [3.0, 0.5, 3.0, 0.5]
+        assert mock_store.cache_set_calls == []
+
+    def test_duplicates_in_batch(self, mock_store):
+        person = {"phone": "79175002040", "email": "test@example.com"}
+
+        assert get_scores(mock_store, [person, person]) == [3.0, 3.0]
+        assert mock_store.cache_get_calls == [[next(iter(mock_store.cache))]]
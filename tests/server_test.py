@@ -0,0 +1,434 @@
+import http.client
+import json
+import socket
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from src.api import MainHTTPHandler
+from src.encoding import JSON_ENCODERS, ResponseEncoder
+from src.logs import RequestLog
+from src.metrics import Metrics
+from src.profiling import PROFILE_HEADER, RequestProfiler
+from src.server import PooledHTTPServer, reserve_port
+from tests.conftest import RecordingStore, make_body
+
+
+class Handler(MainHTTPHandler):
+    settings = {"store": RecordingStore(), "keepalive_timeout": 1, "keepalive_requests": 3}
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = PooledHTTPServer(("localhost", 0), Handler, threads=4, queue_size=4)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def score_body() -> dict:
+    return make_body("online_score", {"phone": "79175002040", "email": "stupnikov@otus.ru"})
+
+
+def raw_post(body: bytes, headers: str = "") -> bytes:
+    return b"POST /method HTTP/1.1\r\nHost: localhost\r\nContent-Length: %d\r\n%s\r\n%s" % (len(body), headers.encode(), body)
+
+
+def read_all(sock: socket.socket) -> bytes:
+    data = b""
+    while chunk := sock.recv(65536):
+        data += chunk
+    return data
+
+
+def post(port: int, body: dict) -> dict:
+    request = urllib.request.Request(f"http://localhost:{port}/method", data=json.dumps(body).encode("utf-8"))
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())
+
+
+class TestPooledHTTPServer:
+    def test_concurrent_requests(self, server):
+        body = score_body()
+
+        with ThreadPoolExecutor(8) as executor:
+            results = list(executor.map(lambda _: post(server.server_port, body), range(32)))
+
+        assert all(result == {"response": {"score": 3.0}, "code": 200} for result in results)
+
+
+class TestAcceptQueue:
+    def test_accepts_threads_plus_queue_size(self):
+        release = threading.Event()
+
+        class BlockingHandler(Handler):
+            def do_POST(self):
+                release.wait(5)
+                super().do_POST()
+
+        server = PooledHTTPServer(("localhost", 0), BlockingHandler, threads=1, queue_size=1)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        body = raw_post(json.dumps(score_body()).encode("utf-8"), "Connection: close\r\n")
+        clients = [socket.create_connection(("localhost", server.server_port)) for _ in range(3)]
+        try:
+            for sock in clients:
+                sock.sendall(body)
+            deadline = time.monotonic() + 5
+            while (server.active, server.queued) != (1, 1) and time.monotonic() < deadline:
+                time.sleep(0.01)
+            # The third client waits in the listen backlog until a slot frees up
+            time.sleep(0.2)
+            accepted = server.active, server.queued
+            release.set()
+            responses = [read_all(sock) for sock in clients]
+        finally:
+            for sock in clients:
+                sock.close()
+            server.shutdown()
+            server.server_close()
+
+        assert accepted == (1, 1)
+        assert all(response.startswith(b"HTTP/1.1 200 OK") for response in responses)
+
+
+class TestReservePort:
+    def test_workers_bind_the_reserved_port(self):
+        reserved = reserve_port(("localhost", 0))
+        address = reserved.getsockname()[:2]
+        try:
+            # Reserved only: nothing accepts connections until a worker listens
+            with pytest.raises(ConnectionRefusedError):
+                socket.create_connection(address)
+            workers = [socket.create_server(address, reuse_port=True) for _ in range(2)]
+            socket.create_connection(address).close()
+            for sock in workers:
+                sock.close()
+        finally:
+            reserved.close()
+
+
+class TestKeepAlive:
+    def test_connection_reused(self, server):
+        connection = http.client.HTTPConnection("localhost", server.server_port)
+        results = []
+        sockets = []
+        for _ in range(2):
+            connection.request("POST", "/method", body=json.dumps(score_body()))
+            response = connection.getresponse()
+            results.append(json.loads(response.read()))
+            sockets.append(connection.sock)
+
+        assert sockets[0] is not None and sockets[0] is sockets[1]
+        assert response.getheader("Connection") is None
+        assert results == [{"response": {"score": 3.0}, "code": 200}] * 2
+        connection.close()
+
+    def test_pipelined_requests_until_limit(self, server):
+        body = json.dumps(score_body()).encode("utf-8")
+        with socket.create_connection(("localhost", server.server_port)) as sock:
+            sock.sendall(raw_post(body) * 4)
+            data = read_all(sock)
+
+        # keepalive_requests is 3: the third response closes the connection and the fourth request is dropped
+        assert data.count(b"HTTP/1.1 200 OK") == 3
+        assert data.count(b"Connection: close") == 1
+
+    def test_client_close(self, server):
+        body = json.dumps(score_body()).encode("utf-8")
+        with socket.create_connection(("localhost", server.server_port)) as sock:
+            sock.sendall(raw_post(body, "Connection: close\r\n"))
+            data = read_all(sock)
+
+        assert data.count(b"HTTP/1.1 200 OK") == 1
+
+    def test_unframed_body_closes_connection(self, server):
+        with socket.create_connection(("localhost", server.server_port)) as sock:
+            sock.sendall(b"POST /method HTTP/1.1\r\nHost: localhost\r\nContent-Length: abc\r\n\r\n{}")
+            data = read_all(sock)
+
+        assert data.startswith(b"HTTP/1.1 400")
+        assert b"Connection: close" in data
+
+    def test_idle_timeout(self, server):
+        with socket.create_connection(("localhost", server.server_port)) as sock:
+            sock.settimeout(5)
+            assert read_all(sock) == b""
+
+
+class TestIdleConnections:
+    @pytest.fixture
+    def single(self):
+        class IdleHandler(Handler):
+            settings = {"store": RecordingStore(), "keepalive_timeout": 30}
+
+        server = PooledHTTPServer(("localhost", 0), IdleHandler, threads=1)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        yield server
+        server.shutdown()
+        server.server_close()
+
+    def idle_connection(self, port: int) -> socket.socket:
+        sock = socket.create_connection(("localhost", port))
+        sock.settimeout(5)
+        sock.sendall(raw_post(json.dumps(score_body()).encode("utf-8")))
+        assert sock.recv(65536).startswith(b"HTTP/1.1 200 OK")
+        return sock
+
+    def test_second_client_served_while_first_is_idle(self, single):
+        idle = self.idle_connection(single.server_port)
+        started = time.monotonic()
+        try:
+            result = post(single.server_port, score_body())
+            elapsed = time.monotonic() - started
+            # The idle connection gave its thread away
+            assert read_all(idle) == b""
+        finally:
+            idle.close()
+
+        assert result == {"response": {"score": 3.0}, "code": 200}
+        assert elapsed < 1
+
+    def test_shutdown_closes_idle_connections(self, single):
+        idle = self.idle_connection(single.server_port)
+        started = time.monotonic()
+        try:
+            single.shutdown()
+            assert read_all(idle) == b""
+        finally:
+            idle.close()
+
+        assert time.monotonic() - started < 2
+
+
+class TestBodyLimits:
+    @pytest.fixture
+    def limited(self, server):
+        Handler.settings["body_limits"] = {"method": 300}
+        yield server
+        del Handler.settings["body_limits"]
+
+    def test_content_length_over_limit(self, limited):
+        with socket.create_connection(("localhost", limited.server_port)) as sock:
+            sock.sendall(b"POST /method HTTP/1.1\r\nHost: localhost\r\nContent-Length: 301\r\n\r\n")
+            data = read_all(sock)
+
+        assert data.startswith(b"HTTP/1.1 413")
+        assert b"Connection: close" in data
+        assert json.loads(data.partition(b"\r\n\r\n")[2]) == {"error": "Payload Too Large", "code": 413}
+
+    def test_expect_continue(self, limited):
+        body = json.dumps(score_body()).encode("utf-8")
+        with socket.create_connection(("localhost", limited.server_port)) as sock:
+            sock.sendall(b"POST /method HTTP/1.1\r\nContent-Length: %d\r\nExpect: 100-continue\r\n\r\n" % len(body))
+            assert sock.recv(1024).startswith(b"HTTP/1.1 100 Continue")
+            sock.sendall(body + b"POST /method HTTP/1.1\r\nContent-Length: 5000\r\nExpect: 100-continue\r\n\r\n")
+            data = read_all(sock)
+
+        assert data.startswith(b"HTTP/1.1 200 OK")
+        assert b"HTTP/1.1 413" in data
+
+    def test_chunked_body(self, limited):
+        body = json.dumps(score_body()).encode("utf-8")
+        chunks = b"".join(b"%x\r\n%s\r\n" % (len(body[i : i + 50]), body[i : i + 50]) for i in range(0, len(body), 50))
+        with socket.create_connection(("localhost", limited.server_port)) as sock:
+            sock.sendall(b"POST /method HTTP/1.1\r\nTransfer-Encoding: chunked\r\nConnection: close\r\n\r\n" + chunks + b"0\r\n\r\n")
+            data = read_all(sock)
+
+        assert json.loads(data.partition(b"\r\n\r\n")[2]) == {"response": {"score": 3.0}, "code": 200}
+
+    def test_chunked_body_over_limit(self, limited):
+        with socket.create_connection(("localhost", limited.server_port)) as sock:
+            sock.sendall(b"POST /method HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n100\r\n" + b" " * 256 + b"\r\n100\r\n")
+            data = read_all(sock)
+
+        assert data.startswith(b"HTTP/1.1 413")
+
+
+class TestResponseEncoding:
+    def test_single_write_with_pluggable_encoder(self):
+        writes = []
+
+        class CountingWriter:
+            def __init__(self, wfile):
+                self.wfile = wfile
+
+            def write(self, data):
+                writes.append(data)
+                return self.wfile.write(data)
+
+            def flush(self):
+                self.wfile.flush()
+
+        class EncodingHandler(Handler):
+            settings = {"store": RecordingStore(), "encoder": ResponseEncoder(JSON_ENCODERS["compact"]())}
+
+            def setup(self):
+                super().setup()
+                self.wfile = CountingWriter(self.wfile)
+
+        server = PooledHTTPServer(("localhost", 0), EncodingHandler, threads=1)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            with socket.create_connection(("localhost", server.server_port)) as sock:
+                sock.sendall(raw_post(json.dumps(score_body()).encode("utf-8"), "Connection: close\r\n"))
+                data = read_all(sock)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        assert data.startswith(b"HTTP/1.1 200 OK\r\nDate: ")
+        assert data.endswith(b'Connection: close\r\n\r\n{"response":{"score":3.0},"code":200}')
+        assert writes == [data]
+
+
+class TestServerTiming:
+    def test_header_and_log(self, server):
+        records = []
+        logged = threading.Event()
+        log = RequestLog(body_limit=0)
+
+        def record(path, body, response, context):
+            records.append(context)
+            logged.set()
+
+        log.log = record
+        Handler.settings.update(server_timing=True, request_log=log)
+        try:
+            connection = http.client.HTTPConnection("localhost", server.server_port)
+            connection.request("POST", "/method", body=json.dumps(score_body()))
+            response = connection.getresponse()
+            response.read()
+            connection.close()
+            # The request is logged after its response is sent
+            assert logged.wait(5)
+        finally:
+            del Handler.settings["server_timing"], Handler.settings["request_log"]
+
+        spans = [span.split(";")[0] for span in response.getheader("Server-Timing").split(", ")]
+        assert spans == ["read", "parse", "auth", "validation", "encode"]
+        assert list(records[0]["timings"]) == spans + ["write"]
+
+    def test_off_by_default(self, server):
+        connection = http.client.HTTPConnection("localhost", server.server_port)
+        connection.request("POST", "/method", body=json.dumps(score_body()))
+        response = connection.getresponse()
+        response.read()
+        connection.close()
+
+        assert response.getheader("Server-Timing") is None
+
+
+class TestMetricsEndpoint:
+    def test_metrics(self, server):
+        metrics = Metrics()
+        Handler.settings["metrics"] = metrics
+        try:
+            post(server.server_port, score_body())
+            with urllib.request.urlopen(f"http://localhost:{server.server_port}/metrics") as response:
+                text = response.read().decode("utf-8")
+                content_type = response.headers["Content-Type"]
+        finally:
+            del Handler.settings["metrics"]
+
+        assert content_type.startswith("text/plain; version=0.0.4")
+        assert 'api_requests_total{method="online_score",code="200"} 1\n' in text
+        assert "api_requests_in_flight 0\n" in text
+
+    def test_other_paths(self, server):
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(f"http://localhost:{server.server_port}/other")
+
+        assert error.value.code == 404
+
+
+class TestProfileEndpoint:
+    def test_report_needs_token(self, server):
+        profiler = RequestProfiler(token="s3cret")
+        Handler.settings["profiler"] = profiler
+        try:
+            connection = http.client.HTTPConnection("localhost", server.server_port)
+            connection.request("POST", "/method", body=json.dumps(score_body()), headers={PROFILE_HEADER: "s3cret"})
+            connection.getresponse().read()
+            connection.request("GET", "/debug/profile")
+            forbidden = connection.getresponse()
+            forbidden.read()
+            connection.request("GET", "/debug/profile?method=online_score", headers={PROFILE_HEADER: "s3cret"})
+            report = connection.getresponse().read().decode("utf-8")
+            connection.close()
+        finally:
+            del Handler.settings["profiler"]
+
+        assert forbidden.status == 403
+        assert report.startswith("online_score: 1 requests")
+        assert "method_handler" in report
+
+
+class InterestsStore(RecordingStore):
+    def __init__(self, fail_after: int | None = None):
+        super().__init__({"i:%d" % cid: json.dumps(["books"]) for cid in range(250)})
+        self.fail_after = fail_after
+
+    def get_many(self, keys):
+        if self.fail_after is not None and len(self.called("get_many")) >= self.fail_after:
+            raise RedisConnectionError()
+        return super().get_many(keys)
+
+
+def interests_body(size: int) -> dict:
+    return make_body("clients_interests", {"client_ids": list(range(size))})
+
+
+class TestInterestsStream:
+    def serve(self, store):
+        class StreamHandler(Handler):
+            settings = {"store": store, "stream_threshold": 100, "stream_chunk_size": 100}
+
+        server = PooledHTTPServer(("localhost", 0), StreamHandler, threads=1)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    def test_chunked_response(self):
+        store = InterestsStore()
+        server = self.serve(store)
+        try:
+            connection = http.client.HTTPConnection("localhost", server.server_port)
+            connection.request("POST", "/method", body=json.dumps(interests_body(250)))
+            response = connection.getresponse()
+            data = json.loads(response.read())
+            connection.request("POST", "/method", body=json.dumps(interests_body(10)))
+            small = connection.getresponse()
+            small.read()
+            connection.close()
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        assert response.getheader("Transfer-Encoding") == "chunked"
+        assert data == {"response": {str(cid): ["books"] for cid in range(250)}, "code": 200}
+        assert len(store.called("get_many")) == 3 + 1
+        assert small.getheader("Content-Length") is not None
+
+    def test_store_error_cuts_the_response(self):
+        server = self.serve(InterestsStore(fail_after=1))
+        try:
+            connection = http.client.HTTPConnection("localhost", server.server_port)
+            connection.request("POST", "/method", body=json.dumps(interests_body(250)))
+            response = connection.getresponse()
+            with pytest.raises(http.client.IncompleteRead):
+                response.read()
+            connection.close()
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        assert response.status == 200
@@ -0,0 +1,188 @@
+import asyncio
+import json
+import os
+import threading
+
+import pytest
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from src.scoring import get_interests_many, get_score, get_scores
+from src.store import ENTRY_OVERHEAD, AsyncMemoryStore, MemoryStore, ObservedConnectionPool, load_interests
+
+
+class FakeConnection:
+    def __init__(self, **kwargs):
+        self.pid = os.getpid()
+        self.connected = False
+
+    def connect(self):
+        self.connected = True
+
+    def disconnect(self, *args):
+        self.connected = False
+
+    def can_read(self, timeout=0):
+        return False
+
+    def should_reconnect(self):
+        return False
+
+
+class TestObservedConnectionPool:
+    @pytest.fixture
+    def pool(self):
+        return ObservedConnectionPool(max_connections=2, timeout=0.05, idle_timeout=10, connection_class=FakeConnection)
+
+    def test_connections_are_reused(self, pool):
+        first = pool.get_connection()
+        pool.release(first)
+        second = pool.get_connection()
+        pool.release(second)
+
+        stats = pool.stats()
+        assert first is second
+        assert stats["created"] == 1
+        assert stats["checkouts"] == 2
+        assert stats["in_use"] == 0
+
+    def test_saturation_and_timeout(self, pool):
+        connections = [pool.get_connection(), pool.get_connection()]
+
+        assert pool.stats()["saturation"] == 1.0
+        with pytest.raises(RedisConnectionError):
+            pool.get_connection()
+
+        stats = pool.stats()
+        assert stats["timeouts"] == 1
+        assert stats["peak_in_use"] == 2
+
+        for connection in connections:
+            pool.release(connection)
+        assert pool.stats()["in_use"] == 0
+
+    def test_connect_error_is_not_a_checkout(self):
+        class RefusedConnection(FakeConnection):
+            refuse = False
+
+            def connect(self):
+                if RefusedConnection.refuse:
+                    raise RedisConnectionError("Error 111 connecting to localhost:6379. Connection refused.")
+                super().connect()
+
+        pool = ObservedConnectionPool(max_connections=2, timeout=0.05, connection_class=RefusedConnection)
+        busy = pool.get_connection()
+        RefusedConnection.refuse = True
+        with pytest.raises(RedisConnectionError):
+            pool.get_connection()
+
+        stats = pool.stats()
+        assert (stats["in_use"], stats["connect_errors"], stats["timeouts"]) == (1, 1, 0)
+        pool.release(busy)
+        assert pool.stats()["in_use"] == 0
+
+    def test_blocked_checkout_waits_for_release(self):
+        pool = ObservedConnectionPool(max_connections=1, timeout=1, connection_class=FakeConnection)
+        connection = pool.get_connection()
+        threading.Timer(0.05, pool.release, args=(connection,)).start()
+
+        assert pool.get_connection() is connection
+        assert pool.stats()["wait_max"] >= 0.04
+
+    def test_reap_idle(self, pool):
+        connection = pool.get_connection()
+        pool.release(connection)
+
+        assert pool.reap_idle() == 0
+        assert pool.reap_idle(now=pool._idle_since[connection] + 11) == 1
+
+        stats = pool.stats()
+        assert not connection.connected
+        assert stats["reaped"] == 1
+        assert stats["created"] == 0
+        assert pool.get_connection() is not connection
+
+
+class TestMemoryStore:
+    def test_cache_ttl(self, clock):
+        store = MemoryStore()
+        store.cache_set("uid:1", 1.5, 60)
+
+        assert store.cache_get("uid:1") == "1.5"
+        clock.now += 61
+        assert store.cache_get("uid:1") is None
+        assert store.stats()["expirations"] == 1
+        assert store.stats()["cache_bytes"] == 0
+
+    def test_memory_bounded_lru_eviction(self):
+        entry = len("uid:0") + len("1.0") + ENTRY_OVERHEAD
+        store = MemoryStore(max_bytes=entry * 2)
+        store.cache_set("uid:0", 1.0, 60)
+        store.cache_set("uid:1", 1.0, 60)
+        store.cache_get("uid:0")
+        store.cache_set("uid:2", 1.0, 60)
+
+        assert store.cache_get("uid:1") is None
+        assert store.cache_get("uid:0") == "1.0"
+        assert store.cache_get("uid:2") == "1.0"
+        assert store.stats()["evictions"] == 1
+        assert store.stats()["cache_bytes"] == entry * 2
+
+    def test_overwrite_keeps_size(self):
+        store = MemoryStore()
+        store.cache_set("uid:1", "1.0", 60)
+        store.cache_set("uid:1", "2.0", 60)
+
+        assert store.stats()["cache_bytes"] == len("uid:1") + len("2.0") + ENTRY_OVERHEAD
+        assert store.cache_get("uid:1") == "2.0"
+
+    def test_persistent_data_never_evicted(self):
+        store = MemoryStore(max_bytes=1, data={"i:1": '["books"]'})
+        store.cache_set("uid:1", 1.0, 60)
+
+        assert store.cache_get("uid:1") is None
+        assert store.get("i:1") == '["books"]'
+        assert get_interests_many(store, [1, 2]) == {1: ["books"], 2: []}
+
+    def test_scores(self):
+        store = MemoryStore()
+        person = {"phone": "79175002040", "email": "stupnikov@otus.ru"}
+
+        assert get_score(store, **person) == 3.0
+        assert get_scores(store, [person, {"first_name": "a", "last_name": "b"}]) == [3.0, 0.5]
+        assert store.stats()["hits"] == 1
+        assert store.stats()["cache_size"] == 2
+
+    def test_thread_safety(self):
+        store = MemoryStore(max_bytes=50 * (len("uid:0:000") + len("0") + ENTRY_OVERHEAD))
+
+        def worker(n: int) -> None:
+            for i in range(1000):
+                store.cache_set(f"uid:{n}:{i:03}", i % 10, 60)
+                store.cache_get(f"uid:{n}:{i - 1:03}")
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        stats = store.stats()
+        assert stats["cache_size"] == 50
+        assert stats["evictions"] == 8 * 1000 - 50
+
+    def test_load_interests(self, tmp_path):
+        path = tmp_path / "interests.json"
+        path.write_text(json.dumps({"1": ["books", "cars"], "2": []}))
+
+        store = MemoryStore(data=load_interests(str(path)))
+
+        assert store.get_many(["i:1", "i:2", "i:3"]) == ['["books", "cars"]', "[]", None]
+
+    def test_async_store(self):
+        store = AsyncMemoryStore(MemoryStore(data={"i:1": '["books"]'}))
+
+        async def run():
+            await store.cache_set("uid:1", 2.0, 60)
+            return await store.cache_get("uid:1"), await store.get_many(["i:1"])
+
+        assert asyncio.run(run()) == ("2.0", ['["books"]'])
@@ -0,0 +1,21 @@
+import pytest
+
+from benchmarks.suite import compare
+
+
+def results(**us_per_call: float) -> dict[str, dict[str, dict[str, float]]]:
+    return {"results": {name: {"us_per_call": value} for name, value in us_per_call.items()}}
+
+
+class TestCompare:
+    def test_ratio_and_regression(self):
+        rows = compare(results(fast=1.0, slow=2.5, steady=1.1), results(fast=2.0, slow=2.0, steady=1.0), threshold=0.2)
+
+        assert [(row["name"], row["ratio"], row["regression"]) for row in rows] == [
+            ("fast", 0.5, False),
+            ("slow", 1.25, True),
+            ("steady", pytest.approx(1.1), False),
+        ]
+
+    def test_new_benchmarks_skipped(self):
+        assert compare(results(new=1.0), results(), threshold=0.2) == []
@@ -71,3 +71,25 @@ class TestRedisHandlerIntegration:
         result = self.redis_handler.get(key)
         
         assert result == value
+
+    def test_get_many(self):
+        self.redis.set("test:a", "1")
+        self.redis.set("test:c", "3")
+
+        result = self.redis_handler.get_many(["test:a", "test:b", "test:c"])
+
+        assert result == ["1", None, "3"]
+
+    def test_get_many_chunked(self, monkeypatch):
+        monkeypatch.setattr("src.store.MGET_CHUNK", 2)
+        keys = [f"test:{i}" for i in range(5)]
+        for i, key in enumerate(keys):
+            self.redis.set(key, str(i))
+
+        assert self.redis_handler.get_many(keys) == ["0", "1", "2", "3", "4"]
+
+    def test_cache_set_many_and_get_many(self):
+        self.redis_handler.cache_set_many({"test:a": 1.5, "test:b": "x"}, 60)
+
+        assert self.redis_handler.cache_get_many(["test:a", "test:missing", "test:b"]) == ["1.5", None, "x"]
+        assert 0 < self.redis.ttl("test:a") <= 60
@@ -0,0 +1,75 @@
+import asyncio
+
+from src.api import method_handler
+from src.metrics import AsyncInstrumentedStore, InstrumentedStore, Metrics
+from src.timing import TIMINGS, Timings, record, server_timing, store_span
+from tests.conftest import AsyncRecordingStore, RecordingStore, make_body
+
+
+class TestTimings:
+    def test_spans_add_up(self):
+        timings = Timings()
+        timings.add("auth", 0.001)
+        timings.add("store.get.i", 0.002)
+        timings.add("store.get.i", 0.0005)
+
+        assert timings.fields() == {"auth": 1.0, "store.get.i": 2.5}
+        assert timings.header() == 'auth;dur=1.000, store.get.i;dur=2.500;desc="2 calls"'
+
+    def test_record_without_request(self):
+        record("auth", 1.0)
+
+        assert TIMINGS.get() is None
+        assert server_timing(True) is None
+
+    def test_server_timing(self):
+        timings = Timings()
+        reset = TIMINGS.set(timings)
+        try:
+            assert server_timing(True) is None
+            record("parse", 0.0001)
+            header = server_timing(True)
+            disabled = server_timing(False)
+        finally:
+            TIMINGS.reset(reset)
+
+        assert header == {"Server-Timing": "parse;dur=0.100"}
+        assert disabled is None
+
+    def test_store_span(self):
+        assert store_span("cache_get", ("uid:abc",)) == "store.cache_get.uid"
+        assert store_span("get_many", (["i:1", "i:2"],)) == "store.get_many.i"
+        assert store_span("cache_set_many", ({"uid:1": 1.0}, 60)) == "store.cache_set_many.uid"
+        assert store_span("get_many", ([],)) == "store.get_many"
+        assert store_span("get", ("plain",)) == "store.get"
+
+
+class TestRequestTimings:
+    def test_handler_stages_and_store_calls(self):
+        store = InstrumentedStore(RecordingStore(), Metrics())
+        timings = Timings()
+        bodies = [make_body("online_score", {"phone": "79175002040", "email": "a@b.c"}), make_body("clients_interests", {"client_ids": [1, 2]})]
+
+        reset = TIMINGS.set(timings)
+        try:
+            for body in bodies:
+                method_handler({"body": body, "headers": {}}, {}, {"store": store})
+        finally:
+            TIMINGS.reset(reset)
+
+        assert list(timings.spans) == ["auth", "validation", "store.cache_get.uid", "store.cache_set.uid", "store.get_many.i"]
+        assert timings.spans["auth"][0] == 2
+
+    def test_async_store_calls(self):
+        store = AsyncInstrumentedStore(AsyncRecordingStore(), Metrics())
+
+        async def scenario():
+            timings = Timings()
+            TIMINGS.set(timings)
+            await store.cache_get("uid:1")
+            return timings
+
+        timings = asyncio.run(scenario())
+
+        assert list(timings.spans) == ["store.cache_get.uid"]
+        assert TIMINGS.get() is None